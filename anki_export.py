@@ -0,0 +1,261 @@
+"""Export generated question-answer pairs as an Anki deck (.apkg).
+
+Run with e.g. `python anki_export.py qa_pairs.jsonl -o course.apkg --deck "Course"`.
+"""
+import argparse
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH = 5000              # notes inserted with one executemany
+MODEL_NAME = "AI Anki Basic"
+FIELD_SEPARATOR = "\x1f"
+
+_BASE91 = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~"
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# Anki collection schema 11, as read by the .apkg importer
+SCHEMA = """
+CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null, tags text not null);
+CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null, lapses integer not null, left integer not null,
+    odue integer not null, odid integer not null, flags integer not null, data text not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null, type integer not null);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+DECK_CONFIG = {
+    "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60, "timer": 0, "autoplay": True, "replayq": True,
+    "new": {"bury": True, "delays": [1, 10], "initialFactor": 2500, "ints": [1, 4, 7], "order": 1, "perDay": 20, "separate": True},
+    "rev": {"bury": True, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1, "maxIvl": 36500, "minSpace": 1, "perDay": 100},
+    "lapse": {"delays": [10], "leechAction": 0, "leechFails": 8, "minInt": 1, "mult": 0},
+}
+
+
+def _stable_id(*parts: str) -> int:
+    """Positive 47-bit id derived from parts, so the same deck, model or note
+    gets the same id in every export"""
+    return int.from_bytes(hashlib.sha256("\x00".join(parts).encode("utf-8")).digest()[:6], "big") >> 1
+
+
+def note_guid(question: str) -> str:
+    """Base91 GUID of the normalized question; Anki updates the note with this
+    GUID on re-import instead of adding a second one"""
+    value = int.from_bytes(hashlib.sha256(" ".join(question.split()).encode("utf-8")).digest()[:8], "big")
+    digits = []
+    while value:
+        (value, digit) = divmod(value, len(_BASE91))
+        digits.append(_BASE91[digit])
+    return "".join(reversed(digits)) or _BASE91[0]
+
+
+def _field(text: str) -> str:
+    return html.escape(text, quote=False).replace("\n", "<br>")
+
+
+def _checksum(field: str) -> int:
+    return int(hashlib.sha1(_TAG_RE.sub("", field).encode("utf-8")).hexdigest()[:8], 16)
+
+
+class ApkgWriter:
+    """Streams notes into an Anki collection and packs it with its media into
+    an .apkg. Notes are inserted in batches of INSERT_BATCH inside a single
+    transaction, media files are copied into the zip one at a time, so memory
+    does not grow with the size of the deck."""
+
+    def __init__(self, output_path: str, deck_name: str = "AI Anki", batch_size: int = INSERT_BATCH):
+        self.output_path = output_path
+        self.deck_name = deck_name
+        self.batch_size = batch_size
+        self.deck_id = _stable_id("deck", deck_name)
+        self.model_id = _stable_id("model", MODEL_NAME)
+        self.notes = 0
+        self.media = {}          # name inside the deck -> path on disk
+        self._pending = []
+        self._now = int(time.time())
+        (handle, self._collection_path) = tempfile.mkstemp(suffix=".anki2", dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(handle)
+        self.conn = sqlite3.connect(self._collection_path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("BEGIN")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def add_media(self, path: str) -> str:
+        """Register a file to ship with the deck; returns the name notes refer to it by"""
+        (base, ext) = os.path.splitext(os.path.basename(path))
+        name = f"{base}{ext}"
+        counter = 1
+        while name in self.media and self.media[name] != path:
+            name = f"{base}_{counter}{ext}"
+            counter += 1
+        self.media[name] = path
+        return name
+
+    def add_note(self, question: str, answer: str, tags: Iterable[str] = (), image: str | None = None):
+        """Add a basic card; image is a media name from add_media shown under the answer"""
+        front = _field(question)
+        back = _field(answer)
+        if image is not None:
+            back += f'<br><img src="{html.escape(image)}">'
+        guid = note_guid(question)
+        note_id = _stable_id("note", guid)
+        tag_text = " ".join(tag.replace(" ", "_") for tag in tags)
+        self._pending.append((note_id, guid, front + FIELD_SEPARATOR + back, _TAG_RE.sub("", front), _checksum(front),
+                              f" {tag_text} " if tag_text else ""))
+        if len(self._pending) >= self.batch_size:
+            self._insert()
+
+    def add_pairs(self, pairs: Iterable[dict], tags: Iterable[str] = ()):
+        """Add a note per pair; a pair's "image", a path to an image file,
+        ships with the deck and is shown under its answer"""
+        tags = list(tags)
+        for pair in pairs:
+            image = self.add_media(pair["image"]) if pair.get("image") else None
+            self.add_note(pair["question"], pair["answer"], tags, image)
+
+    def _insert(self):
+        if not self._pending:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, -1, ?, ?, ?, ?, 0, '')",
+            [(note_id, guid, self.model_id, self._now, tags, fields, sort_field, checksum)
+             for (note_id, guid, fields, sort_field, checksum, tags) in self._pending],
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO cards VALUES (?, ?, ?, 0, ?, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')",
+            [(note_id, note_id, self.deck_id, self._now, self.notes + position)
+             for position, (note_id, *_) in enumerate(self._pending)],
+        )
+        self.notes += len(self._pending)
+        self._pending = []
+
+    def _collection_row(self) -> tuple:
+        model = {
+            "id": self.model_id, "name": MODEL_NAME, "type": 0, "mod": self._now, "usn": -1, "sortf": 0,
+            "did": self.deck_id, "tags": [], "vers": [], "req": [[0, "all", [0]]],
+            "flds": [{"name": name, "ord": ord, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+                     for ord, name in enumerate(("Front", "Back"))],
+            "tmpls": [{"name": "Card 1", "ord": 0, "qfmt": "{{Front}}", "afmt": "{{FrontSide}}<hr id=answer>{{Back}}",
+                       "did": None, "bqfmt": "", "bafmt": ""}],
+            "css": ".card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }",
+            "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage{amssymb,amsmath}\n"
+                        "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+            "latexPost": "\\end{document}",
+        }
+
+        def deck(deck_id: int, name: str) -> dict:
+            return {"id": deck_id, "name": name, "mod": self._now, "usn": -1, "desc": "", "dyn": 0, "conf": 1,
+                    "collapsed": False, "extendNew": 10, "extendRev": 50,
+                    "newToday": [0, 0], "revToday": [0, 0], "lrnToday": [0, 0], "timeToday": [0, 0]}
+
+        conf = {"activeDecks": [1], "curDeck": 1, "curModel": str(self.model_id), "nextPos": self.notes + 1,
+                "newSpread": 0, "collapseTime": 1200, "timeLim": 0, "estTimes": True, "dueCounts": True,
+                "sortType": "noteFld", "sortBackwards": False, "addToCur": True}
+        decks = {"1": deck(1, "Default"), str(self.deck_id): deck(self.deck_id, self.deck_name)}
+        return (1, self._now, self._now * 1000, self._now * 1000, 11, 0, 0, 0, json.dumps(conf),
+                json.dumps({str(self.model_id): model}), json.dumps(decks), json.dumps({"1": DECK_CONFIG}), "{}")
+
+    def close(self) -> str:
+        """Finish the collection and write the .apkg; returns its path"""
+        try:
+            self._insert()
+            self.conn.execute("INSERT INTO col VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._collection_row())
+            self.conn.commit()
+            self.conn.close()
+
+            partial_path = f"{self.output_path}.part"
+            with zipfile.ZipFile(partial_path, "w", compression=zipfile.ZIP_DEFLATED) as apkg:
+                apkg.write(self._collection_path, "collection.anki2")
+                media_map = {}
+                for index, (name, path) in enumerate(self.media.items()):
+                    # images are already compressed, so store them as they are
+                    apkg.write(path, str(index), compress_type=zipfile.ZIP_STORED)
+                    media_map[str(index)] = name
+                apkg.writestr("media", json.dumps(media_map))
+            os.replace(partial_path, self.output_path)
+        finally:
+            self._remove_collection()
+        logger.info(f"Exported {self.notes} notes and {len(self.media)} media files to {self.output_path}")
+        return self.output_path
+
+    def discard(self):
+        self.conn.close()
+        self._remove_collection()
+
+    def _remove_collection(self):
+        try:
+            os.remove(self._collection_path)
+        except FileNotFoundError:
+            pass
+
+
+def read_pairs(jsonl_path: str) -> Iterable[dict]:
+    """QA pairs from a JSONL file written by qa_generation, one line at a time"""
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                pair = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping line {line_number} of {jsonl_path}: {e}")
+                continue
+            if isinstance(pair, dict) and pair.get("question") and pair.get("answer"):
+                yield pair
+
+
+def export_apkg(jsonl_path: str, output_path: str, deck_name: str = "AI Anki", tags: Iterable[str] = ()) -> str:
+    """Write the pairs in jsonl_path, with the images they refer to, to an .apkg"""
+    with ApkgWriter(output_path, deck_name) as writer:
+        writer.add_pairs(read_pairs(jsonl_path), tags)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("pairs", help="JSONL file of QA pairs from qa_generation.py")
+    parser.add_argument("-o", "--output", default="deck.apkg")
+    parser.add_argument("--deck", default="AI Anki")
+    parser.add_argument("--tags", nargs="*", default=[])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(export_apkg(args.pairs, args.output, args.deck, args.tags))
+
+
+if __name__ == "__main__":
+    main()
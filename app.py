@@ -1,59 +1,165 @@
 import gradio as gr
-import io
+import logging
 import os
+import tempfile
+import threading
+import time
+import zipfile
 from file_manager import FileManager, FileType
+from jobs import JobQueue, JobStatus, JobStore
+from metrics import METRICS_DIR_ENV, metrics
 
-# Initialize the file manager
+logging.basicConfig(level=logging.INFO)
+
+JOB_POLL_SECONDS = 1
+
+# Initialize the file manager and the job queue in front of it
 file_manager = FileManager()
+job_queue = JobQueue(file_manager, JobStore())
+
+def start_background_work():
+    """Resume unfinished jobs and, with AI_ANKI_WARM_UP=pdf,video (or "all"),
+    build those backends in the background; otherwise they are built on first
+    use. Only called when app.py runs as the main program, since worker
+    processes import this module again."""
+    job_queue.start()
+    warm_up_types = os.getenv("AI_ANKI_WARM_UP", "")
+    if warm_up_types:
+        types = None if warm_up_types == "all" else [FileType(name.strip()) for name in warm_up_types.split(",")]
+        threading.Thread(target=file_manager.warm_up, args=(types,), daemon=True).start()
+
+def format_job(job):
+    if job is None:
+        return "Unknown job ID"
+    lines = [
+        f"Job {job.id}",
+        f"Source: {job.source}",
+        f"Type: {job.file_type.value}",
+        f"Status: {job.status.value} ({job.progress:.0%}) - {job.message}",
+    ]
+    if job.status == JobStatus.DONE:
+        lines.append("✅ Outputs: " + ", ".join(job.outputs))
+    elif job.status == JobStatus.FAILED:
+        lines.append(f"❌ Error: {job.error}")
+    return "\n".join(lines)
 
 def process_file(file_obj):
     if file_obj is None:
-        return "No file uploaded"
+        return "No file uploaded", ""
     
     try:
         # In Gradio 4.0+, file_obj is a NamedString with a name attribute pointing to the file path
-        with open(file_obj.name, 'rb') as f:
-            file_content = f.read()
-        
-        # Create a file-like object
-        file_like = io.BytesIO(file_content)
-        file_like.name = os.path.basename(file_obj.name)
-        
-        # Get file type before processing
-        file_type = FileType.from_file(file_like)
-        file_like.seek(0)  # Reset position after checking type
-        
-        # Process the file with status updates
-        gr.Info(f"Processing {file_type.value} file: {file_like.name}")
-        file_manager.upload_file(file_like)
-        
-        result_msg = f"✅ Successfully processed {file_type.value} file: {file_like.name}"
+        job_id = job_queue.submit_file(file_obj.name)
+        job = job_queue.status(job_id)
+        result_msg = f"🕒 Queued {job.file_type.value} file {os.path.basename(file_obj.name)} as job {job_id}"
         gr.Info(result_msg)
-        return result_msg
+        return result_msg, job_id
     except Exception as e:
-        error_msg = f"❌ Error processing file: {str(e)}"
+        error_msg = f"❌ Error queueing file: {str(e)}"
         gr.Error(error_msg)
-        return error_msg
+        return error_msg, ""
 
 def process_url(url):
     if not url:
-        return "No URL provided"
+        return "No URL provided", ""
     
     try:
-        gr.Info(f"Processing URL: {url}")
-        # Convert URL to bytes
-        url_bytes = io.BytesIO(url.encode('utf-8'))
-        url_bytes.name = url  # Set name for file type detection
-        
-        # Process the URL
-        file_manager.upload_file(url_bytes)
-        result_msg = f"✅ Successfully processed weblink: {url}"
+        job_id = job_queue.submit_url(url)
+        result_msg = f"🕒 Queued weblink {url} as job {job_id}"
+        gr.Info(result_msg)
+        return result_msg, job_id
+    except Exception as e:
+        error_msg = f"❌ Error queueing URL: {str(e)}"
+        gr.Error(error_msg)
+        return error_msg, ""
+
+def job_status(job_id):
+    if not job_id:
+        return "No job ID provided"
+    return format_job(job_queue.status(job_id.strip()))
+
+def watch_job(job_id):
+    """Stream the job's status until it finishes"""
+    if not job_id:
+        yield "No job ID provided"
+        return
+    while True:
+        job = job_queue.status(job_id.strip())
+        yield format_job(job)
+        if job is None or job.finished:
+            return
+        time.sleep(JOB_POLL_SECONDS)
+
+def extract_zip(zip_path, target_dir):
+    """Extract regular files from a zip, ignoring unsafe paths and macOS metadata"""
+    extracted = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                continue
+            if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+                continue
+            extracted.append(archive.extract(info, target_dir))
+    return extracted
+
+def batch_rows(batch):
+    return [[job.id, os.path.basename(job.source), job.file_type.value, job.status.value, f"{job.progress:.0%}"]
+            for job in batch.jobs]
+
+def process_batch(file_objs):
+    """Queue every file (and every file inside a zip) as its own job, like a
+    single upload, then stream the batch's progress and throughput until
+    every job has finished"""
+    if not file_objs:
+        yield "No files uploaded", []
+        return
+
+    try:
+        job_ids = []
+        rejected = []
+        with tempfile.TemporaryDirectory() as workdir:
+            paths = []
+            for file_obj in file_objs:
+                if file_obj.name.lower().endswith(".zip"):
+                    paths.extend(extract_zip(file_obj.name, tempfile.mkdtemp(dir=workdir)))
+                else:
+                    paths.append(file_obj.name)
+
+            # submit_file keeps its own link or copy, so the extracted files can go with workdir
+            for path in paths:
+                try:
+                    job_ids.append(job_queue.submit_file(path))
+                except Exception as e:
+                    rejected.append(["", os.path.basename(path), "", f"❌ {e}", ""])
+
+        result_msg = f"🕒 Queued {len(job_ids)} of {len(paths)} files as jobs"
         gr.Info(result_msg)
-        return result_msg
     except Exception as e:
-        error_msg = f"❌ Error processing URL: {str(e)}"
+        error_msg = f"❌ Error queueing batch: {str(e)}"
         gr.Error(error_msg)
-        return error_msg
+        yield error_msg, []
+        return
+
+    while True:
+        batch = job_queue.batch_status(job_ids)
+        yield f"{result_msg}\n{batch.summary()}", batch_rows(batch) + rejected
+        if batch.finished:
+            return
+        time.sleep(JOB_POLL_SECONDS)
+
+def recent_jobs():
+    return [
+        [job.id, job.file_type.value, os.path.basename(job.source), job.status.value, f"{job.progress:.0%}", job.message]
+        for job in job_queue.store.recent()
+    ]
+
+def show_metrics():
+    if not metrics.enabled:
+        return "Metrics are off; start the app with AI_ANKI_METRICS=1", ""
+    directory = os.getenv(METRICS_DIR_ENV, os.path.join(".cache", "metrics"))
+    (prom_path, trace_path) = metrics.write(directory)
+    return metrics.summary() or "Nothing recorded yet", f"Saved {prom_path} and {trace_path}"
 
 # Create Gradio interface
 with gr.Blocks(title="File Processing System", theme=gr.themes.Soft()) as demo:
@@ -79,10 +185,11 @@ with gr.Blocks(title="File Processing System", theme=gr.themes.Soft()) as demo:
         )
         file_button = gr.Button("📤 Process File", variant="primary")
         file_output = gr.Textbox(label="Result", lines=4)
+        file_job_id = gr.Textbox(label="Job ID")
         file_button.click(
             process_file,
             inputs=[file_input],
-            outputs=[file_output],
+            outputs=[file_output, file_job_id],
             show_progress=True
         )
     
@@ -94,12 +201,55 @@ with gr.Blocks(title="File Processing System", theme=gr.themes.Soft()) as demo:
         )
         url_button = gr.Button("🔗 Process URL", variant="primary")
         url_output = gr.Textbox(label="Result", lines=4)
+        url_job_id = gr.Textbox(label="Job ID")
         url_button.click(
             process_url,
             inputs=[url_input],
-            outputs=[url_output],
+            outputs=[url_output, url_job_id],
+            show_progress=True
+        )
+
+    with gr.Tab("📦 Batch Upload"):
+        batch_input = gr.File(
+            label="Upload Files or a Zip Archive",
+            file_count="multiple",
+            file_types=[
+                ".zip",
+                ".mp3", ".wav", ".ogg", ".m4a", ".flac", ".aac", ".wma", ".aiff",
+                ".pdf",
+                ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".svg", ".tiff",
+                ".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".webm", ".mpeg", ".mpg", ".3gp"
+            ]
+        )
+        batch_button = gr.Button("📦 Process Batch", variant="primary")
+        batch_output = gr.Textbox(label="Summary", lines=2)
+        batch_table = gr.Dataframe(headers=["Job ID", "File", "Type", "Status", "Progress"], interactive=False)
+        batch_button.click(
+            process_batch,
+            inputs=[batch_input],
+            outputs=[batch_output, batch_table],
             show_progress=True
         )
 
+    with gr.Tab("📋 Jobs"):
+        job_id_input = gr.Textbox(label="Job ID", placeholder="Paste a job ID")
+        with gr.Row():
+            status_button = gr.Button("🔄 Check Status")
+            watch_button = gr.Button("👀 Watch Until Done", variant="primary")
+        job_output = gr.Textbox(label="Status", lines=6)
+        status_button.click(job_status, inputs=[job_id_input], outputs=[job_output])
+        watch_button.click(watch_job, inputs=[job_id_input], outputs=[job_output])
+
+        jobs_button = gr.Button("📋 Recent Jobs")
+        jobs_table = gr.Dataframe(headers=["Job ID", "Type", "Source", "Status", "Progress", "Message"], interactive=False)
+        jobs_button.click(recent_jobs, outputs=[jobs_table])
+
+    with gr.Tab("📈 Metrics"):
+        metrics_button = gr.Button("📈 Stage Timings")
+        metrics_output = gr.Textbox(label="Time per stage", lines=12)
+        metrics_files = gr.Textbox(label="Exports")
+        metrics_button.click(show_metrics, outputs=[metrics_output, metrics_files])
+
 if __name__ == "__main__":
-    demo.launch(share=True)
+    start_background_work()
+    demo.queue(default_concurrency_limit=None).launch(share=True)
@@ -0,0 +1,631 @@
+"""Ad-hoc benchmarks for the ingestion pipeline.
+
+Run one with e.g. `python benchmarks.py frames lecture.mp4`.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def bench_frame_samplers(video_path: str, samplers: list[str]):
+    from video_to_pdf import sample_frames
+
+    print(f"{'sampler':<12}{'frames':>8}{'seconds':>10}{'frames/s':>10}")
+    for sampler in samplers:
+        start = time.perf_counter()
+        frames = 0
+        for _ in sample_frames(video_path, sampler):
+            frames += 1
+        elapsed = time.perf_counter() - start
+        print(f"{sampler:<12}{frames:>8}{elapsed:>10.2f}{frames / elapsed if elapsed else 0:>10.1f}")
+
+
+def make_slides(slide_count: int, size: tuple[int, int], rng: random.Random) -> list:
+    """Text slides that share one layout: a title and eight lines of words"""
+    import cv2
+    import numpy as np
+
+    (width, height) = size
+    slides = []
+    for slide_id in range(slide_count):
+        image = np.full((height, width, 3), 255, dtype=np.uint8)
+        cv2.putText(image, f"Slide {slide_id}", (80, 160), cv2.FONT_HERSHEY_SIMPLEX, 3, (20, 20, 120), 6)
+        for line in range(8):
+            words = " ".join(rng.choice(["graph", "node", "model", "loss", "tensor", "query", "cache", "index"]) for _ in range(6))
+            cv2.putText(image, words, (100, 300 + line * 90), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 3)
+        slides.append(image)
+    return slides
+
+
+def make_slide_video(path: str, slide_count: int = 20, revisits: int = 5, seconds_per_slide: int = 8,
+                     size: tuple[int, int] = (1920, 1080), fps: int = 25, seed: int = 0) -> list[tuple[float, float, int]]:
+    """Render a synthetic lecture: text slides with cross-fades, sensor noise
+    and a few slides shown again later. Returns (start, end, slide id) spans."""
+    import cv2
+    import numpy as np
+
+    rng = random.Random(seed)
+    (width, height) = size
+    slides = make_slides(slide_count, size, rng)
+
+    order = list(range(slide_count)) + [rng.randrange(slide_count) for _ in range(revisits)]
+    fade = fps // 2
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    spans = []
+    previous = None
+    for position, slide_id in enumerate(order):
+        start = position * seconds_per_slide
+        spans.append((start, start + seconds_per_slide, slide_id))
+        for index in range(seconds_per_slide * fps):
+            if previous is not None and index < fade:
+                frame = cv2.addWeighted(previous, 1 - index / fade, slides[slide_id], index / fade, 0)
+            else:
+                frame = slides[slide_id]
+            noise = np.random.default_rng(position * 10000 + index).integers(0, 3, frame.shape, dtype=np.uint8)
+            writer.write(cv2.add(frame, noise))
+        previous = slides[slide_id]
+    writer.release()
+    return spans
+
+
+def bench_slide_similarity(backends: list[str], slide_count: int, revisits: int, pipelined: bool,
+                           hash_size: int | None = None, hash_threshold: float | None = None):
+    from video_to_pdf import FRAME_RATE, detect_unique_screenshots, detect_unique_screenshots_pipelined
+
+    detect = detect_unique_screenshots_pipelined if pipelined else detect_unique_screenshots
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = os.path.join(workdir, "slides.mp4")
+        spans = make_slide_video(video_path, slide_count=slide_count, revisits=revisits)
+        print(f"{len(spans)} slide spans, {slide_count} unique slides")
+
+        rows = []
+        for backend in backends:
+            output = os.path.join(workdir, backend)
+            os.makedirs(output)
+            start = time.perf_counter()
+            saved_files = detect(video_path, output, similarity=backend)
+            elapsed = time.perf_counter() - start
+
+            # file names carry the capture time in minutes (plus one sample interval)
+            captured = []
+            for saved in saved_files:
+                minutes = float(re.match(r"\d+_([\d.]+)\.png", os.path.basename(saved)).group(1))
+                seconds = minutes * 60 - 1 / FRAME_RATE
+                captured.append(next((slide for (begin, end, slide) in spans if begin <= seconds < end), None))
+            found = {slide for slide in captured if slide is not None}
+            rows.append((backend, len(saved_files), len(found), len(saved_files) - len(found), slide_count - len(found), elapsed))
+
+    print(f"{'backend':<18}{'saved':>7}{'unique':>8}{'dupes':>7}{'missed':>8}{'seconds':>10}")
+    for (backend, saved, unique, dupes, missed, elapsed) in rows:
+        print(f"{backend:<18}{saved:>7}{unique:>8}{dupes:>7}{missed:>8}{elapsed:>10.2f}")
+
+    bench_similarity_pairs(backends, slide_count, hash_size, hash_threshold)
+
+
+def bench_similarity_pairs(backends: list[str], slide_count: int, hash_size: int | None = None,
+                           hash_threshold: float | None = None):
+    """Cost and accuracy of each backend on its own, without motion detection:
+    fingerprint time per 1080p frame, time per comparison, and how often two
+    captures of one slide count as the same (same ok) and two different slides
+    as different (distinct ok). Captures are decoded from the synthetic video,
+    so they carry its real compression artifacts."""
+    import cv2
+    from slide_similarity import HASH_SIZE, HASH_THRESHOLD, make_similarity_backend
+    from video_to_pdf import SSIM_THRESHOLD
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = os.path.join(workdir, "slides.mp4")
+        spans = make_slide_video(video_path, slide_count=slide_count, revisits=0, seconds_per_slide=2)
+        capture = cv2.VideoCapture(video_path)
+        captures = []
+        for (begin, end, _) in spans:
+            pair = []
+            # one capture just after the cross-fade, one near the end of the slide
+            for seconds in (begin + (end - begin) * 0.5, begin + (end - begin) * 0.9):
+                capture.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000)
+                pair.append(capture.read()[1])
+            captures.append(pair)
+        capture.release()
+
+    print(f"{'backend':<18}{'fp ms':>8}{'cmp ms':>8}{'same ok':>9}{'distinct ok':>13}")
+    for name in backends:
+        backend = make_similarity_backend(name, SSIM_THRESHOLD, hash_threshold if hash_threshold is not None else HASH_THRESHOLD,
+                                          hash_size or HASH_SIZE)
+        start = time.perf_counter()
+        fingerprints = [[backend.fingerprint(frame) for frame in pair] for pair in captures]
+        fingerprint_ms = (time.perf_counter() - start) * 1000 / (2 * slide_count)
+        start = time.perf_counter()
+        same = [backend.similarity(first, second) >= backend.threshold for (first, second) in fingerprints]
+        compare_ms = (time.perf_counter() - start) * 1000 / slide_count
+        distinct = [backend.similarity(fingerprints[i][0], fingerprints[j][0]) < backend.threshold
+                    for i in range(slide_count) for j in range(i + 1, slide_count)]
+        print(f"{name:<18}{fingerprint_ms:>8.2f}{compare_ms:>8.3f}{sum(same) / len(same):>9.0%}"
+              f"{sum(distinct) / len(distinct) if distinct else 1:>13.0%}")
+
+
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import file_manager
+imported = time.perf_counter()
+manager = file_manager.FileManager()
+constructed = time.perf_counter()
+if {file_type!r}:
+    manager.warm_up([file_manager.FileType({file_type!r})])
+ready = time.perf_counter()
+print(json.dumps([imported - start, constructed - imported, ready - constructed]))
+"""
+
+
+def bench_startup(file_types: list[str]):
+    """Cold start per FileType, each in a fresh interpreter: importing
+    file_manager, constructing FileManager, then building that type's backends."""
+    print(f"{'file type':<12}{'import':>10}{'init':>10}{'backends':>10}")
+    for file_type in [""] + file_types:
+        probe = STARTUP_PROBE.format(file_type=file_type)
+        output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+        (imported, constructed, ready) = json.loads(output.strip().splitlines()[-1])
+        print(f"{file_type or '(none)':<12}{imported:>10.2f}{constructed:>10.2f}{ready:>10.2f}")
+
+
+def bench_pdf_triage(pdf_dir: str, workers: int | None):
+    """Pages per second of extract_pdf over every PDF in pdf_dir, converting
+    every page with docling vs routing pages through pdf_triage first. The
+    pool size is set with AI_ANKI_PDF_WORKERS; workers only limits how many
+    shards are queued at a time."""
+    from pdf_extraction import PDF_WORKERS, extract_pdf
+    from pdf_triage import triage_pdf
+
+    pdfs = sorted(os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir) if name.lower().endswith(".pdf"))
+    start = time.perf_counter()
+    routes = [triage_pdf(path) for path in pdfs]
+    triage_seconds = time.perf_counter() - start
+    pages = sum(len(document) for document in routes)
+    print(f"triaged {len(pdfs)} PDFs ({pages} pages) in {triage_seconds:.2f}s")
+
+    print(f"{'mode':<10}{'pages':>8}{'seconds':>10}{'pages/s':>10}  methods")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for triage in (False, True):
+            methods = {}
+            start = time.perf_counter()
+            for path in pdfs:
+                output_path = os.path.join(output_dir, f"{os.path.basename(path)}.md")
+                for (method, count) in extract_pdf(path, output_path, workers=workers or PDF_WORKERS, triage=triage).items():
+                    methods[method] = methods.get(method, 0) + count
+            elapsed = time.perf_counter() - start
+            mode = "triage" if triage else "docling"
+            print(f"{mode:<10}{pages:>8}{elapsed:>10.2f}{pages / elapsed if elapsed else 0:>10.1f}  {methods}")
+
+
+def bench_captions(image_dir: str, max_side: int, delay: float, packing: list[int]):
+    """Payload size after downscaling, and images per second through
+    ImageCaptioner against the offline stub backend with a fixed latency."""
+    import io
+    from image_captioning import ImageCaptioner, StubCaptioner, prepare_image
+
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                   if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".bmp")))
+    original = prepared = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        original += len(data)
+        buffer = io.BytesIO()
+        prepare_image(data, max_side).save(buffer, format="JPEG")
+        prepared += buffer.tell()
+    print(f"{len(paths)} images: {original / 1024 ** 2:.1f} MiB original, {prepared / 1024 ** 2:.1f} MiB at max side {max_side}")
+
+    print(f"{'per request':<12}{'requests':>10}{'seconds':>10}{'images/s':>10}")
+    for images_per_request in packing:
+        backend = StubCaptioner(delay=delay)
+        captioner = ImageCaptioner(backend, max_side=max_side, images_per_request=images_per_request)
+        start = time.perf_counter()
+        captioner.caption_paths(paths)
+        elapsed = time.perf_counter() - start
+        print(f"{images_per_request:<12}{len(backend.calls):>10}{elapsed:>10.2f}{len(paths) / elapsed if elapsed else 0:>10.1f}")
+
+
+def bench_kg(documents: int, delay: float, workers: list[int]):
+    """Documents per minute through KGGenerator with the offline fake model,
+    one pass per refine/extract pool size."""
+    from graph_writer import GraphWriter, SQLiteGraphBackend
+    from kg_generation import FakeKGBackend, KGGenerator
+
+    words = ["Alpha", "Beta", "Gamma", "Delta", "Epsilon", "Zeta", "Theta", "Kappa"]
+    with tempfile.TemporaryDirectory() as save_dir:
+        rng = random.Random(0)
+        for index in range(documents):
+            with open(os.path.join(save_dir, f"doc_{index:04}.txt"), "w", encoding="utf-8") as f:
+                f.write(" and ".join(rng.sample(words, 4)))
+
+        print(f"{'workers':<10}{'documents':>10}{'seconds':>10}{'docs/min':>10}")
+        for count in workers:
+            writer = GraphWriter(SQLiteGraphBackend(os.path.join(save_dir, f"graph_{count}.sqlite3")))
+            generator = KGGenerator(backend=FakeKGBackend(delay=delay), writer=writer,
+                                    refine_workers=count, extract_workers=count)
+            # every pass writes a fresh graph, so ignore the manifest the previous pass left in save_dir
+            result = generator.generate_kg(save_dir, incremental=False)
+            print(f"{count:<10}{len(result.documents):>10}{result.seconds:>10.2f}{result.documents_per_minute:>10.1f}")
+
+
+def bench_graph_write(nodes: int, relationships: int, batch_sizes: list[int], neo4j: bool):
+    """Bulk-load a synthetic course graph through GraphWriter, twice per batch
+    size: the second pass writes the same graph again and must change nothing."""
+    from graph_writer import GraphWriter, Neo4jGraphBackend, SQLiteGraphBackend
+
+    rng = random.Random(0)
+    names = [f"Concept {index}" for index in range(nodes)]
+    edges = [(rng.choice(names), rng.choice(names), rng.choice(["PREREQUISITE_OF", "PART_OF", "RELATED_TO"]))
+             for _ in range(relationships)]
+    documents = 100
+
+    print(f"{'batch':<8}{'pass':>6}{'seconds':>10}{'rows/s':>12}")
+    with tempfile.TemporaryDirectory() as graph_dir:
+        for batch_size in batch_sizes:
+            for attempt in (1, 2):
+                backend = Neo4jGraphBackend.from_env() if neo4j else SQLiteGraphBackend(os.path.join(graph_dir, f"graph_{batch_size}.sqlite3"))
+                writer = GraphWriter(backend, batch_size=batch_size)
+                start = time.perf_counter()
+                rows = 0
+                for document in range(documents):
+                    source = f"lecture_{document:03}.txt"
+                    keys = [writer.add_node(name, "Concept") for name in names[document::documents]]
+                    for (subj, obj, relation) in edges[document::documents]:
+                        writer.add_relationship(subj, obj, relation, source)
+                    writer.add_document(f"doc-{document}", source, keys)
+                    rows += len(keys) * 2 + len(edges[document::documents]) + 1
+                    if writer.full:
+                        writer.flush()
+                writer.close()
+                elapsed = time.perf_counter() - start
+                print(f"{batch_size:<8}{attempt:>6}{elapsed:>10.2f}{rows / elapsed if elapsed else 0:>12.0f}")
+            if not neo4j:
+                backend = SQLiteGraphBackend(os.path.join(graph_dir, f"graph_{batch_size}.sqlite3"))
+                print(f"{'':<8}{'':>6}  {backend.counts()}")
+                backend.close()
+
+
+HARD_NEGATIVES = [
+    ("What is the main advantage of using a hash index?", "What is the main disadvantage of using a hash index?"),
+    ("What is the first product of the reaction?", "What is the second product of the reaction?"),
+    ("What is the worst-case time complexity of quicksort?", "What is the worst-case time complexity of heapsort?"),
+    ("What does the transformer encoder do with the input tokens?", "What does the transformer decoder do with the input tokens?"),
+    ("Why is a B-tree index ordered?", "Why is a hash index not ordered?"),
+    ("Which layer of the OSI model handles routing?", "Which layer of the OSI model handles framing?"),
+]
+
+
+def make_questions(count: int, duplicate_rate: float = 0.3, hard_negative_rate: float = 0.1,
+                   seed: int = 0) -> tuple[list[str], list[bool]]:
+    """Synthetic questions where duplicate_rate of them restate an earlier one
+    with different case, punctuation or one extra word, and hard_negative_rate
+    of them swap one word of an earlier one, which asks something else;
+    returns the questions and whether each is such a restatement."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{index}" for index in range(20000)]
+    questions = []
+    restated = []
+    for _ in range(count):
+        originals = [question for question, again in zip(questions[-1000:], restated[-1000:]) if not again] or questions
+        draw = rng.random()
+        if questions and draw < duplicate_rate:
+            words = rng.choice(originals).split()
+            variant = rng.randrange(3)
+            if variant == 0:
+                questions.append(" ".join(words).upper())
+            elif variant == 1:
+                questions.append(" ".join(words).rstrip("?") + " ?!")
+            else:
+                questions.append(" ".join(words[:-1] + ["exactly", words[-1]]))
+            restated.append(True)
+        elif questions and draw < duplicate_rate + hard_negative_rate:
+            words = rng.choice(originals).rstrip("?").split()
+            words[rng.randrange(2, len(words))] = rng.choice(vocabulary)
+            questions.append(" ".join(words) + "?")
+            restated.append(False)
+        else:
+            questions.append("What is " + " ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 16))) + "?")
+            restated.append(False)
+    return questions, restated
+
+
+def bench_qa_dedup(pairs: int, indexes: list[str], threshold: float | None):
+    """Throughput and accuracy of the QA dedup indexes on synthetic questions,
+    and whether each keeps the HARD_NEGATIVES pairs apart"""
+    from qa_dedup import QADeduplicator, make_dedup_index
+
+    questions, restated = make_questions(pairs)
+    print(f"{pairs} questions, {sum(restated)} restated")
+    print(f"{'index':<12}{'kept':>8}{'dropped':>9}{'missed':>8}{'recall':>8}{'false drops':>13}{'seconds':>10}{'q/s':>10}"
+          f"{'hard kept':>11}")
+    for name in indexes:
+        deduplicator = QADeduplicator(make_dedup_index(name, threshold))
+        start = time.perf_counter()
+        kept = [deduplicator.is_new(question) for question in questions]
+        elapsed = time.perf_counter() - start
+        # recall: restatements dropped; false drops: distinct questions dropped
+        missed = sum(1 for new, again in zip(kept, restated) if new and again)
+        false = sum(1 for new, again in zip(kept, restated) if not new and not again)
+        recall = 1 - missed / sum(restated) if any(restated) else 1.0
+        hard = make_dedup_index(name, threshold)
+        apart = sum(1 for (first, second) in HARD_NEGATIVES if hard.add(first) is None and hard.add(second) is None)
+        print(f"{name:<12}{deduplicator.kept:>8}{deduplicator.dropped:>9}{missed:>8}{recall:>8.2%}{false:>13}"
+              f"{elapsed:>10.2f}{pairs / elapsed if elapsed else 0:>10.0f}{f'{apart}/{len(HARD_NEGATIVES)}':>11}")
+
+
+def bench_anki(cards: int, media: int, media_kb: int):
+    """.apkg export speed for synthetic QA pairs and slide images"""
+    import sqlite3
+    import zipfile
+    from anki_export import ApkgWriter
+
+    questions, _ = make_questions(cards, duplicate_rate=0, hard_negative_rate=0)
+    with tempfile.TemporaryDirectory() as directory:
+        slides = []
+        for index in range(media):
+            slides.append(os.path.join(directory, f"slide_{index:04d}.png"))
+            with open(slides[-1], "wb") as f:
+                f.write(os.urandom(media_kb * 1024))
+        output = os.path.join(directory, "bench.apkg")
+        guids = []
+        for run in ("export", "re-export"):
+            start = time.perf_counter()
+            with ApkgWriter(output, "Benchmark") as writer:
+                names = [writer.add_media(path) for path in slides]
+                for index, question in enumerate(questions):
+                    writer.add_note(question, f"Answer {index}", image=names[index % len(names)] if names else None)
+            elapsed = time.perf_counter() - start
+            with zipfile.ZipFile(output) as apkg:
+                apkg.extract("collection.anki2", directory)
+            with sqlite3.connect(os.path.join(directory, "collection.anki2")) as conn:
+                guids.append({guid for (guid,) in conn.execute("SELECT guid FROM notes")})
+            print(f"{run:<10} {writer.notes} notes, {media} media: {elapsed:.2f}s "
+                  f"({writer.notes / elapsed:.0f} notes/s, {os.path.getsize(output) / 2 ** 20:.1f} MiB)")
+        print(f"stable GUIDs across exports: {guids[0] == guids[1]}")
+
+
+def serve_pages(pages: int, delay: float):
+    """Threaded HTTP server on a free local port with pages /page/0... and
+    /sitemap.xml; pages carry an ETag and answer a matching If-None-Match with 304"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(delay)
+            if self.path == "/sitemap.xml":
+                host = self.headers["Host"]
+                locs = "".join(f"<url><loc>http://{host}/page/{index}</loc></url>" for index in range(pages))
+                body = f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>'.encode()
+                return self._send(200, body, {"Content-Type": "application/xml"})
+            match = re.fullmatch(r"/page/(\d+)", self.path)
+            if not match or int(match.group(1)) >= pages:
+                return self._send(404)
+            etag = f'"page-{match.group(1)}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            body = (f"<html><head><title>Page {match.group(1)}</title><script>ignored()</script></head><body>"
+                    f"<nav><a href='/'>home</a></nav><h1>Page {match.group(1)}</h1>"
+                    + "<p>Some <b>bold</b> text with a <a href='/page/0'>link</a>.</p>" * 20
+                    + "<ul><li>one</li><li>two</li></ul></body></html>").encode()
+            self._send(200, body, {"Content-Type": "text/html; charset=utf-8", "ETag": etag})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_crawl(pages: int, delay: float, workers: list[int], host_interval: float):
+    """Crawl throughput against a local server reached under two host names,
+    then a second crawl of the same pages that should come back as 304s"""
+    from crawler import LocalBackend, ValidatorCache, WebCrawler
+
+    server = serve_pages(pages, delay)
+    port = server.server_address[1]
+    sitemaps = [f"http://127.0.0.1:{port}/sitemap.xml", f"http://localhost:{port}/sitemap.xml"]
+    # the same pages again, spelled differently, to exercise URL normalization
+    repeats = [f"http://LOCALHOST:{port}/page/0/", f"http://127.0.0.1:{port}/page/1#top"]
+    print(f"{2 * pages} pages on 2 hosts, {delay * 1000:.0f}ms per response, {host_interval}s between requests per host")
+    try:
+        for count in workers:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                for run in ("cold", "revalidate"):
+                    crawler = WebCrawler(LocalBackend(pool_size=count, allow_private=True), workers=count, host_interval=host_interval,
+                                         cache=ValidatorCache(cache_dir))
+                    report = crawler.crawl(sitemaps + repeats)
+                    print(f"workers={count:<3} {run:<11} {report.summary()}")
+    finally:
+        server.shutdown()
+
+
+def bench_file_types(directory: str, rounds: int):
+    """Upload type detection speed over the files in directory, opened from
+    disk and as in-memory uploads. Detection accuracy is covered by
+    tests/test_file_detection.py."""
+    import io
+    from collections import Counter
+    from file_detection import HEADER_BYTES, detect, read_header
+
+    paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+             if os.path.isfile(os.path.join(directory, name))]
+    if not paths:
+        print(f"no files in {directory}")
+        return
+    kinds = Counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            kinds[detect(path, read_header(f)) or "unknown"] += 1
+    print(f"{len(paths)} files: " + ", ".join(f"{count} {kind}" for kind, count in kinds.most_common()))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in paths:
+            with open(path, "rb") as f:
+                detect(path, read_header(f))
+    elapsed = time.perf_counter() - start
+    print(f"files on disk: {rounds * len(paths) / elapsed:>10.0f} detections/s (including open)")
+
+    buffers = []
+    for path in paths:
+        with open(path, "rb") as f:
+            buffer = io.BytesIO(f.read(HEADER_BYTES))
+        buffer.name = os.path.basename(path)
+        buffers.append(buffer)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for buffer in buffers:
+            detect(buffer.name, read_header(buffer))
+    elapsed = time.perf_counter() - start
+    print(f"in memory:     {rounds * len(buffers) / elapsed:>10.0f} detections/s")
+
+
+def bench_metrics(calls: int, kg_documents: int):
+    """Cost of spans and counters with metrics off and on, then a fake KG run
+    with metrics on to show the exports"""
+    from metrics import Metrics
+
+    for enabled in (False, True):
+        recorder = Metrics(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(calls):
+            with recorder.span("bench.stage"):
+                pass
+        span_ns = (time.perf_counter() - start) / calls * 1e9
+        start = time.perf_counter()
+        for _ in range(calls):
+            recorder.count("bench_bytes", 1024, stage="bench")
+        count_ns = (time.perf_counter() - start) / calls * 1e9
+        print(f"metrics {'on ' if enabled else 'off'}: span {span_ns:>7.0f}ns, count {count_ns:>7.0f}ns")
+
+    from graph_writer import GraphWriter, SQLiteGraphBackend
+    from kg_generation import FakeKGBackend, KGGenerator
+    from metrics import metrics
+
+    metrics.enable()
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(kg_documents):
+            with open(os.path.join(directory, f"doc{index}.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Document {index} mentions Alice and Bob. " * 50)
+        writer = GraphWriter(SQLiteGraphBackend(os.path.join(directory, "graph.sqlite3")))
+        KGGenerator(FakeKGBackend(delay=0.01), writer=writer).generate_kg(directory)
+        (prom_path, trace_path) = metrics.write(os.path.join(directory, "metrics"))
+        with open(trace_path, encoding="utf-8") as f:
+            events = len(json.load(f)["traceEvents"])
+        with open(prom_path, encoding="utf-8") as f:
+            prom_lines = f.read().splitlines()
+    print(metrics.summary())
+    print(f"{len(prom_lines)} Prometheus lines, {events} trace events")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    frames = subparsers.add_parser("frames", help="seek-based vs sequential frame sampling")
+    frames.add_argument("video_path")
+    frames.add_argument("--samplers", nargs="+", default=["seek", "sequential", "keyframe"])
+
+    similarity = subparsers.add_parser("similarity", help="slide dedup accuracy and speed on a synthetic video")
+    similarity.add_argument("--backends", nargs="+", default=["ssim", "ssim-downscaled", "dhash", "phash"])
+    similarity.add_argument("--slides", type=int, default=20)
+    similarity.add_argument("--revisits", type=int, default=5)
+    similarity.add_argument("--pipelined", action="store_true")
+    similarity.add_argument("--hash-size", type=int, default=None, help="dhash/phash side in bits, for the pairs table")
+    similarity.add_argument("--hash-threshold", type=float, default=None, help="dhash/phash threshold, for the pairs table")
+
+    startup = subparsers.add_parser("startup", help="import and first-use cost per FileType")
+    startup.add_argument("--file-types", nargs="+", default=["weblink", "audio", "image", "pdf", "video"])
+
+    pdf_triage = subparsers.add_parser("pdf-triage", help="PDF extraction throughput with and without page triage")
+    pdf_triage.add_argument("pdf_dir")
+    pdf_triage.add_argument("--workers", type=int, default=None, help="shards in flight, default the pdf_pool size")
+
+    captions = subparsers.add_parser("captions", help="image downscaling and batched captioning against a stub model")
+    captions.add_argument("image_dir")
+    captions.add_argument("--max-side", type=int, default=1024)
+    captions.add_argument("--delay", type=float, default=0.5, help="simulated seconds per model request")
+    captions.add_argument("--packing", type=int, nargs="+", default=[1, 4])
+
+    kg = subparsers.add_parser("kg", help="knowledge graph pipeline throughput with a fake model")
+    kg.add_argument("--documents", type=int, default=40)
+    kg.add_argument("--delay", type=float, default=0.5, help="simulated seconds per model call")
+    kg.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+
+    graph_write = subparsers.add_parser("graph-write", help="bulk graph writes through GraphWriter")
+    graph_write.add_argument("--nodes", type=int, default=10000)
+    graph_write.add_argument("--relationships", type=int, default=20000)
+    graph_write.add_argument("--batch-sizes", type=int, nargs="+", default=[500, 5000])
+    graph_write.add_argument("--neo4j", action="store_true", help="write to the database in NEO4J_URI instead of SQLite")
+
+    qa_dedup = subparsers.add_parser("qa-dedup", help="near-duplicate question filtering at scale")
+    qa_dedup.add_argument("--pairs", type=int, default=100000)
+    qa_dedup.add_argument("--indexes", nargs="+", default=["exact", "minhash"])
+    qa_dedup.add_argument("--threshold", type=float, default=None)
+
+    anki = subparsers.add_parser("anki", help=".apkg export of QA pairs with slide media")
+    anki.add_argument("--cards", type=int, default=50000)
+    anki.add_argument("--media", type=int, default=200)
+    anki.add_argument("--media-kb", type=int, default=300)
+
+    crawl = subparsers.add_parser("crawl", help="concurrent crawling and conditional GETs against a local server")
+    crawl.add_argument("--pages", type=int, default=100, help="pages per host")
+    crawl.add_argument("--delay", type=float, default=0.05, help="simulated seconds per response")
+    crawl.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    crawl.add_argument("--host-interval", type=float, default=0.0)
+
+    file_types = subparsers.add_parser("file-types", help="upload type detection speed")
+    file_types.add_argument("directory", help="files to detect, e.g. a folder of real uploads")
+    file_types.add_argument("--rounds", type=int, default=200)
+
+    metrics_parser = subparsers.add_parser("metrics", help="instrumentation overhead and exports")
+    metrics_parser.add_argument("--calls", type=int, default=200000)
+    metrics_parser.add_argument("--kg-documents", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.benchmark == "frames":
+        bench_frame_samplers(args.video_path, args.samplers)
+    elif args.benchmark == "similarity":
+        bench_slide_similarity(args.backends, args.slides, args.revisits, args.pipelined, args.hash_size, args.hash_threshold)
+    elif args.benchmark == "startup":
+        bench_startup(args.file_types)
+    elif args.benchmark == "pdf-triage":
+        bench_pdf_triage(args.pdf_dir, args.workers)
+    elif args.benchmark == "captions":
+        bench_captions(args.image_dir, args.max_side, args.delay, args.packing)
+    elif args.benchmark == "kg":
+        bench_kg(args.documents, args.delay, args.workers)
+    elif args.benchmark == "graph-write":
+        bench_graph_write(args.nodes, args.relationships, args.batch_sizes, args.neo4j)
+    elif args.benchmark == "qa-dedup":
+        bench_qa_dedup(args.pairs, args.indexes, args.threshold)
+    elif args.benchmark == "anki":
+        bench_anki(args.cards, args.media, args.media_kb)
+    elif args.benchmark == "crawl":
+        bench_crawl(args.pages, args.delay, args.workers, args.host_interval)
+    elif args.benchmark == "file-types":
+        bench_file_types(args.directory, args.rounds)
+    elif args.benchmark == "metrics":
+        bench_metrics(args.calls, args.kg_documents)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,608 @@
+"""Fetch many web pages as markdown.
+
+Run with e.g. `python crawler.py https://example.com/sitemap.xml -o crawled/`.
+"""
+import argparse
+import functools
+import gzip
+import io
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from itertools import zip_longest
+from typing import Callable, Iterable
+from urllib.parse import urljoin, urlsplit
+
+from extraction_cache import ExtractionCache, normalize_url
+from metrics import metrics
+from processors import processors
+
+logger = logging.getLogger(__name__)
+
+CRAWL_WORKERS = 8                # pages fetched at the same time
+HOST_INTERVAL = 1.0              # min seconds between two requests to the same host
+REQUEST_TIMEOUT = 30             # seconds
+MAX_RETRIES = 2                  # extra attempts for a page on network errors, 429 and 5xx
+RETRY_BACKOFF = 2                # seconds before the first retry, doubled every round
+CRAWL_CACHE_DIR = os.path.join(".cache", "crawl")
+USER_AGENT = "ai-anki-crawler/1.0"
+MAX_REDIRECTS = 5                # redirects followed per request, each checked like the first URL
+MAX_SITEMAP_BYTES = 50 * 1024 ** 2   # uncompressed size limit of one sitemap, as in the sitemaps protocol
+ALLOW_PRIVATE_ENV = "CRAWL_ALLOW_PRIVATE"  # set to 1 to let the local backend reach loopback and private hosts
+
+_SITEMAP_RE = re.compile(r"sitemap[^/]*\.xml(\.gz)?$", re.IGNORECASE)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+class CrawlError(Exception):
+    def __init__(self, message: str, status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after       # seconds the server asked us to wait
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class _MarkdownParser(HTMLParser):
+    BLOCKS = {"p", "div", "section", "article", "main", "header", "footer", "table", "tr", "blockquote", "figure"}
+    SKIPPED = {"script", "style", "noscript", "head", "nav", "svg", "template", "iframe"}
+    INLINE = {"strong": "**", "b": "**", "em": "*", "i": "*"}
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.out = []
+        self.skipping = 0
+        self.pre = 0
+        self.lists = []
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+        if self.skipping:
+            return
+        if re.fullmatch(r"h[1-6]", tag):
+            self.out.append(f"\n\n{'#' * int(tag[1])} ")
+        elif tag in self.BLOCKS:
+            self.out.append("\n\n")
+        elif tag == "br":
+            self.out.append("\n")
+        elif tag in ("ul", "ol"):
+            self.lists.append(0 if tag == "ol" else None)
+            self.out.append("\n")
+        elif tag == "li":
+            indent = "  " * max(len(self.lists) - 1, 0)
+            if self.lists and self.lists[-1] is not None:
+                self.lists[-1] += 1
+                self.out.append(f"\n{indent}{self.lists[-1]}. ")
+            else:
+                self.out.append(f"\n{indent}- ")
+        elif tag in ("td", "th"):
+            self.out.append(" | ")
+        elif tag == "pre":
+            self.pre += 1
+            self.out.append("\n\n```\n")
+        elif tag == "code" and not self.pre:
+            self.out.append("`")
+        elif tag in self.INLINE:
+            self.out.append(self.INLINE[tag])
+        elif tag == "a":
+            self.links.append(dict(attrs).get("href"))
+            self.out.append("[")
+        elif tag == "img":
+            attrs = dict(attrs)
+            if attrs.get("src"):
+                self.out.append(f"![{attrs.get('alt') or ''}]({urljoin(self.base_url, attrs['src'])})")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self.skipping = max(self.skipping - 1, 0)
+            return
+        if self.skipping:
+            return
+        if re.fullmatch(r"h[1-6]", tag) or tag in self.BLOCKS:
+            self.out.append("\n\n")
+        elif tag in ("ul", "ol"):
+            if self.lists:
+                self.lists.pop()
+            self.out.append("\n")
+        elif tag == "pre":
+            self.pre = max(self.pre - 1, 0)
+            self.out.append("\n```\n\n")
+        elif tag == "code" and not self.pre:
+            self.out.append("`")
+        elif tag in self.INLINE:
+            self.out.append(self.INLINE[tag])
+        elif tag == "a" and self.links:
+            href = self.links.pop()
+            self.out.append(f"]({urljoin(self.base_url, href)})" if href else "]")
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        self.out.append(data if self.pre else re.sub(r"\s+", " ", data))
+
+
+def html_to_markdown(html: str, base_url: str = "") -> str:
+    """Markdown for the readable part of an HTML page: headings, paragraphs,
+    lists, links, emphasis and code; scripts, styles and navigation are dropped."""
+    parser = _MarkdownParser(base_url)
+    parser.feed(html)
+    parser.close()
+    lines = [line.rstrip() for line in "".join(parser.out).splitlines()]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip() + "\n"
+
+
+def parse_sitemap(xml: str | bytes) -> tuple[list[str], list[str]]:
+    """(page URLs, nested sitemap URLs) listed in a sitemap or sitemap index.
+    Pass the raw bytes when possible, so the XML declaration picks the encoding."""
+    root = ElementTree.fromstring(xml)
+    locations = [element.text.strip() for element in root.iter()
+                 if element.tag.rsplit("}", 1)[-1] == "loc" and (element.text or "").strip()]
+    if root.tag.endswith("sitemapindex"):
+        return [], locations
+    return locations, []
+
+
+def page_url(source: str) -> str:
+    """Normalized URL for a user-supplied link, which may lack a scheme"""
+    source = source.strip()
+    return normalize_url(source if "://" in source else f"https://{source}")
+
+
+def is_sitemap(url: str) -> bool:
+    return bool(_SITEMAP_RE.search(urlsplit(url).path))
+
+
+def public_addresses(host: str, port: int) -> list[str]:
+    """Addresses host resolves to. Raises CrawlError unless there is at least
+    one and all of them are public, so nothing reaches loopback, private
+    networks or cloud metadata endpoints from the server."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError, ValueError) as e:
+        raise CrawlError(f"cannot resolve {host}: {e}")
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise CrawlError(f"{host} resolves to non-public address {ip}", 403)
+    if not addresses:
+        raise CrawlError(f"cannot resolve {host}: no addresses")
+    return addresses
+
+
+def check_public(url: str) -> list[str]:
+    """Raise CrawlError unless url is http(s) and its host resolves only to
+    public addresses (see public_addresses); returns those addresses"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CrawlError(f"{url}: only http and https URLs can be crawled", 400)
+    try:
+        return public_addresses(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    except (CrawlError, ValueError) as e:
+        raise CrawlError(f"{url}: {e}", getattr(e, "status", 400)) from None
+
+
+@functools.lru_cache(maxsize=None)
+def _public_address_adapter():
+    """requests transport adapter whose connections only go to public
+    addresses. check_public alone is not enough: the connection would look
+    the host up again, and a DNS server that answers with a public address
+    the first time and a private one the second (DNS rebinding) would get
+    through. These connections resolve and check the host themselves and
+    connect to the exact address that was checked; the Host header and the
+    TLS server name are still the host name."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+    from urllib3.util.connection import create_connection
+
+    def new_conn(connection):
+        error = None
+        for address in public_addresses(connection.host, connection.port):
+            try:
+                return create_connection((address, connection.port), connection.timeout,
+                                         source_address=connection.source_address,
+                                         socket_options=connection.socket_options)
+            except OSError as e:
+                error = e
+        if isinstance(error, TimeoutError):
+            raise ConnectTimeoutError(connection, f"Connection to {connection.host} timed out. "
+                                                  f"(connect timeout={connection.timeout})") from error
+        raise NewConnectionError(connection, f"Failed to establish a new connection: {error}") from error
+
+    class PublicHTTPConnection(HTTPConnection):
+        _new_conn = new_conn
+
+    class PublicHTTPSConnection(HTTPSConnection):
+        _new_conn = new_conn
+
+    class PublicHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = PublicHTTPConnection
+
+    class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = PublicHTTPSConnection
+
+    class PublicAddressAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": PublicHTTPConnectionPool, "https": PublicHTTPSConnectionPool}
+
+    return PublicAddressAdapter
+
+
+def response_text(response) -> str:
+    """Body of a text response. Without a charset in Content-Type it is
+    decoded as UTF-8, which HTML and XML pages use in practice, and only
+    guessed when that fails, instead of requests' ISO-8859-1 default."""
+    if "charset=" in response.headers.get("Content-Type", "").lower():
+        return response.text
+    try:
+        return response.content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return response.content.decode(response.apparent_encoding or "utf-8", errors="replace")
+
+
+def sitemap_body(response) -> bytes:
+    """XML of a sitemap response, gunzipped for .xml.gz files (requests only
+    undoes a gzip Content-Encoding, not a gzipped body)"""
+    body = response.content
+    if body[:2] == b"\x1f\x8b":
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+                body = f.read(MAX_SITEMAP_BYTES + 1)
+        except (OSError, EOFError) as e:
+            raise CrawlError(f"{response.url}: bad gzip sitemap: {e}")
+    if len(body) > MAX_SITEMAP_BYTES:
+        raise CrawlError(f"{response.url}: sitemap larger than {MAX_SITEMAP_BYTES} bytes")
+    return body
+
+
+@dataclass
+class Fetched:
+    markdown: str | None             # None when the server answered 304 Not Modified
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class LocalBackend:
+    """Plain HTTP GETs converted with html_to_markdown. Each worker thread
+    keeps its own requests.Session, so connections to a host are reused
+    across pages, and validators from an earlier fetch are sent along so an
+    unchanged page comes back as an empty 304.
+
+    Unless allow_private (default: $CRAWL_ALLOW_PRIVATE) is set, every URL
+    and every redirect target must resolve to public addresses (see
+    check_public), and connections are only made to the addresses that were
+    checked."""
+
+    def __init__(self, timeout: float = REQUEST_TIMEOUT, user_agent: str = USER_AGENT, pool_size: int = CRAWL_WORKERS,
+                 allow_private: bool | None = None):
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        if allow_private is None:
+            allow_private = os.getenv(ALLOW_PRIVATE_ENV, "") not in ("", "0")
+        self.allow_private = allow_private
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            session.headers["User-Agent"] = self.user_agent
+            adapter_class = HTTPAdapter if self.allow_private else _public_address_adapter()
+            adapter = adapter_class(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url: str, headers: dict | None = None):
+        import requests
+        # redirects are followed by hand, so each target is checked before it is requested
+        for _ in range(MAX_REDIRECTS + 1):
+            if not self.allow_private:
+                check_public(url)
+            try:
+                with metrics.model_call("crawler", "get"):
+                    response = self.session.get(url, headers=headers, timeout=self.timeout, allow_redirects=False)
+            except requests.RequestException as e:
+                raise CrawlError(f"{url}: {e}")
+            except CrawlError as e:
+                # raised by the connection when the host resolved to a non-public address this time
+                raise CrawlError(f"{url}: {e}", e.status) from None
+            if not response.is_redirect:
+                break
+            url = urljoin(url, response.headers["Location"])
+        else:
+            raise CrawlError(f"{url}: more than {MAX_REDIRECTS} redirects", response.status_code)
+        metrics.count("crawl_bytes", len(response.content), host=urlsplit(url).netloc)
+        if response.status_code >= 400:
+            retry_after = response.headers.get("Retry-After", "")
+            raise CrawlError(f"{url}: HTTP {response.status_code}", response.status_code,
+                             float(retry_after) if retry_after.isdigit() else None)
+        return response
+
+    def fetch(self, url: str, etag: str | None = None, last_modified: str | None = None) -> Fetched:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        response = self.get(url, headers)
+        if response.status_code == 304:
+            return Fetched(None, etag, last_modified)
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type in ("", "text/html", "application/xhtml+xml"):
+            with metrics.span("crawl.html_to_markdown"):
+                markdown = html_to_markdown(response_text(response), response.url)
+        elif content_type.startswith("text/"):
+            markdown = response_text(response)
+        else:
+            raise CrawlError(f"{url}: unsupported content type {content_type}", response.status_code)
+        return Fetched(markdown, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+class FirecrawlBackend:
+    """Firecrawl's hosted scraper; it renders JavaScript but has no conditional requests"""
+
+    def __init__(self, crawler_factory: Callable[[], object] = lambda: processors.get("crawler")):
+        self.crawler_factory = crawler_factory
+
+    def fetch(self, url: str, etag: str | None = None, last_modified: str | None = None) -> Fetched:
+        try:
+            with metrics.model_call("crawler", "scrape"):
+                result = self.crawler_factory().scrape(url)
+        except Exception as e:
+            raise CrawlError(f"{url}: {e}")
+        if not result or not result.get("markdown"):
+            raise CrawlError(f"{url}: Firecrawl returned no markdown", 502)
+        return Fetched(result["markdown"])
+
+
+def make_crawl_backend(name: str | None = None):
+    """Backend by name, "firecrawl" or "local"; defaults to $CRAWL_BACKEND, then
+    Firecrawl when FIRECRAWL_API_KEY is set"""
+    name = name or os.getenv("CRAWL_BACKEND") or ("firecrawl" if os.getenv("FIRECRAWL_API_KEY") else "local")
+    if name == "firecrawl":
+        return FirecrawlBackend()
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"unknown crawl backend {name}")
+
+
+class HostRateLimiter:
+    """Hands out request slots at least interval seconds apart per host.
+    Slots are reserved under a lock and waited for outside it, so requests
+    to different hosts never wait for each other."""
+
+    def __init__(self, interval: float = HOST_INTERVAL):
+        self.interval = interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str, delay: float = 0.0):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now + delay, self._next.get(host, 0.0))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ValidatorCache:
+    """Last markdown of each URL with its ETag and Last-Modified headers, one
+    JSON file per normalized URL under root"""
+
+    def __init__(self, root: str = CRAWL_CACHE_DIR):
+        self.root = root
+
+    def _path(self, url: str) -> str:
+        key = ExtractionCache.hash_url(url)
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, url: str) -> dict | None:
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, url: str, fetched: Fetched):
+        if not fetched.etag and not fetched.last_modified:
+            return
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "etag": fetched.etag, "last_modified": fetched.last_modified,
+                       "markdown": fetched.markdown}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class CrawlResult:
+    url: str
+    markdown: str | None = None
+    error: str | None = None
+    not_modified: bool = False       # served from the validator cache after a 304
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class CrawlReport:
+    results: list[CrawlResult] = field(default_factory=list)
+    duplicates: int = 0
+    seconds: float = 0.0
+
+    @property
+    def failed(self) -> list[CrawlResult]:
+        return [result for result in self.results if not result.ok]
+
+    def summary(self) -> str:
+        not_modified = sum(1 for result in self.results if result.not_modified)
+        pages_per_second = len(self.results) / self.seconds if self.seconds else 0.0
+        return (f"{len(self.results) - len(self.failed)}/{len(self.results)} pages crawled "
+                f"({not_modified} not modified, {self.duplicates} duplicate URLs skipped) "
+                f"in {self.seconds:.1f}s ({pages_per_second:.1f} pages/s)")
+
+
+class WebCrawler:
+    """Fetch URL lists and sitemaps concurrently. URLs are normalized and
+    deduplicated, then interleaved host by host so the workers spread over
+    hosts while HostRateLimiter keeps each host to one request per interval.
+    Failed requests are retried with backoff (honouring Retry-After); a page
+    that keeps failing gets an error in its result instead of stopping the
+    crawl."""
+
+    def __init__(self, backend=None, workers: int = CRAWL_WORKERS, host_interval: float = HOST_INTERVAL,
+                 cache: ValidatorCache | None = None, max_retries: int = MAX_RETRIES):
+        self.backend = backend if backend is not None else make_crawl_backend()
+        self.workers = workers
+        self.limiter = HostRateLimiter(host_interval)
+        self.cache = cache if cache is not None else ValidatorCache()
+        self.max_retries = max_retries
+        # sitemaps are XML, which only a plain GET returns as is
+        self.sitemap_fetcher = self.backend if isinstance(self.backend, LocalBackend) else LocalBackend()
+
+    def expand(self, sources: Iterable[str]) -> tuple[list[str], int]:
+        """(unique normalized page URLs in first-seen order, duplicates dropped),
+        with every sitemap source replaced by the pages it lists"""
+        urls = {}
+        duplicates = 0
+        pending = deque((source, False) for source in sources)    # (URL, listed as a sitemap by a sitemap index)
+        seen_sitemaps = set()
+        while pending:
+            (source, nested) = pending.popleft()
+            if not source.strip():
+                continue
+            url = page_url(source)
+            if nested or is_sitemap(url):
+                if url in seen_sitemaps:
+                    continue
+                seen_sitemaps.add(url)
+                try:
+                    self.limiter.wait(url)
+                    (pages, sitemaps) = parse_sitemap(sitemap_body(self.sitemap_fetcher.get(url)))
+                except Exception as e:
+                    logger.error(f"Skipping sitemap {url}: {e}")
+                    continue
+                logger.info(f"Sitemap {url}: {len(pages)} pages, {len(sitemaps)} nested sitemaps")
+                pending.extendleft(reversed([(sitemap, True) for sitemap in sitemaps] + [(page, False) for page in pages]))
+                continue
+            if url in urls:
+                duplicates += 1
+            else:
+                urls[url] = None
+        return list(urls), duplicates
+
+    def fetch(self, url: str) -> CrawlResult:
+        start = time.perf_counter()
+        cached = self.cache.get(url)
+        error = None
+        delay = 0.0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = max(delay, RETRY_BACKOFF * 2 ** (attempt - 1))
+            self.limiter.wait(url, delay)
+            try:
+                fetched = self.backend.fetch(url, cached and cached.get("etag"), cached and cached.get("last_modified"))
+            except CrawlError as e:
+                logger.warning(f"Fetch failed (attempt {attempt + 1}): {e}")
+                error = e
+                delay = e.retry_after or 0.0
+                if not e.retryable:
+                    break
+                continue
+            if fetched.markdown is None:
+                metrics.count("crawl_pages", result="not_modified")
+                return CrawlResult(url, cached["markdown"], not_modified=True, seconds=time.perf_counter() - start)
+            self.cache.put(url, fetched)
+            metrics.count("crawl_pages", result="fetched")
+            return CrawlResult(url, fetched.markdown, seconds=time.perf_counter() - start)
+        metrics.count("crawl_pages", result="failed")
+        return CrawlResult(url, error=str(error), seconds=time.perf_counter() - start)
+
+    @staticmethod
+    def _interleave(urls: list[str]) -> list[str]:
+        by_host = defaultdict(list)
+        for url in urls:
+            by_host[urlsplit(url).netloc].append(url)
+        return [url for round_ in zip_longest(*by_host.values()) for url in round_ if url is not None]
+
+    def crawl(self, sources: Iterable[str], on_result: Callable[[CrawlResult], None] | None = None) -> CrawlReport:
+        """Fetch every page in sources (URLs or sitemap URLs); on_result is
+        called from the calling thread as each page finishes. Results are in
+        the order the URLs were first seen."""
+        start = time.perf_counter()
+        (urls, duplicates) = self.expand(sources)
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.fetch, url): url for url in self._interleave(urls)}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                logger.info(f"Crawled {result.url}: {'ok' if result.ok else result.error}")
+                if on_result is not None:
+                    on_result(result)
+        report = CrawlReport([results[url] for url in urls], duplicates, time.perf_counter() - start)
+        logger.info(report.summary())
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sources", nargs="+", help="page or sitemap URLs, or files with one URL per line")
+    parser.add_argument("-o", "--output", default="crawled")
+    parser.add_argument("--backend", choices=["firecrawl", "local"], default=None)
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    parser.add_argument("--host-interval", type=float, default=HOST_INTERVAL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sources = []
+    for source in args.sources:
+        if os.path.isfile(source):
+            with open(source, "r", encoding="utf-8") as f:
+                sources.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        else:
+            sources.append(source)
+
+    os.makedirs(args.output, exist_ok=True)
+
+    def save(result: CrawlResult):
+        if result.ok:
+            name = re.sub(r"\W+", "_", urlsplit(result.url).netloc + urlsplit(result.url).path) or "page"
+            with open(os.path.join(args.output, f"{name}.md"), "w", encoding="utf-8") as f:
+                f.write(result.markdown)
+
+    crawler = WebCrawler(make_crawl_backend(args.backend), workers=args.workers, host_interval=args.host_interval)
+    print(crawler.crawl(sources, on_result=save).summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from typing import BinaryIO
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(".cache", "extractions")
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # evict least recently used entries beyond this size
+CACHE_EVICT_TO = 0.9             # an eviction frees space down to this fraction of the limit, so it runs rarely
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme and host, drop default ports, fragments and a trailing slash"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    netloc = host if port is None or (scheme, port) in (("http", 80), ("https", 443)) else f"{host}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+    path = parts.path.rstrip("/") if parts.path not in ("", "/") else ""
+    return urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+class ExtractionCache:
+    """Content-addressed store of extracted text.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes (or of the
+    normalized URL) plus the processor name and version, and live as plain
+    files under root. Reading an entry refreshes its mtime; once the cache
+    grows past max_bytes the least recently used entries are removed.
+
+    The total size is scanned from disk once and then kept up to date by
+    put(), so the cache is only walked again when it is over the limit.
+    Entries written by other processes are counted at that next walk."""
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._size_lock = threading.Lock()
+
+    @staticmethod
+    def hash_file(file: BinaryIO) -> str:
+        position = file.tell()
+        file.seek(0)
+        digest = hashlib.sha256()
+        for block in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+        file.seek(position)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_path(path: str) -> str:
+        """Hash a file on disk through a read-only memory map, without copying it into memory"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return digest.hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                        digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+                finally:
+                    view.release()
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_url(url: str) -> str:
+        return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(digest: str, processor: str, version: int) -> str:
+        return hashlib.sha256(f"{digest}:{processor}:{version}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return text
+
+    def put(self, key: str, text: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # unique per call, so threads and processes writing the same key never share a temporary file
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{key}.", suffix=".tmp")
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                size = os.fstat(f.fileno()).st_size
+            with self._size_lock:
+                try:
+                    size -= os.stat(path).st_size
+                except FileNotFoundError:
+                    pass
+                os.replace(tmp_path, path)
+                if self._size is not None:
+                    self._size += size
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._size_lock:
+            if self._size is None or self._size > self.max_bytes:
+                self._size = self._evict()
+
+    def _evict(self) -> int:
+        """Walk the cache and, when it is over max_bytes, remove least recently
+        used entries until it is down to CACHE_EVICT_TO of that; returns its size"""
+        entries = []
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return total
+        for (_, size, path) in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"Evicted {path} from the extraction cache")
+            if total <= self.max_bytes * CACHE_EVICT_TO:
+                break
+        return total
@@ -0,0 +1,128 @@
+import os
+import re
+from typing import BinaryIO
+
+HEADER_BYTES = 512               # bytes sniffed from the start of an upload
+
+# Kinds returned by sniff; MEDIA is a container that holds audio or video, decided by the extension
+PDF = "pdf"
+IMAGE = "image"
+AUDIO = "audio"
+VIDEO = "video"
+MEDIA = "media"
+
+URL_RE = re.compile(r"^(?:https?://|www\.)[^\s/?#]+\S*$|^localhost(?::\d{2,5})?(?:[/?#]\S*)?$", re.IGNORECASE)
+
+EXTENSIONS = {
+    **dict.fromkeys(("mp3", "wav", "ogg", "m4a", "flac", "aac", "wma", "aiff"), AUDIO),
+    "pdf": PDF,
+    **dict.fromkeys(("jpg", "jpeg", "png", "gif", "bmp", "webp", "svg", "tiff"), IMAGE),
+    **dict.fromkeys(("mp4", "avi", "mkv", "mov", "wmv", "flv", "webm", "mpeg", "mpg", "3gp"), VIDEO),
+}
+
+# (offset, magic, kind), checked in order
+_SIGNATURES = [
+    (0, b"%PDF-", PDF),
+    (0, b"\x89PNG\r\n\x1a\n", IMAGE),
+    (0, b"\xff\xd8\xff", IMAGE),
+    (0, b"GIF87a", IMAGE),
+    (0, b"GIF89a", IMAGE),
+    (0, b"II*\x00", IMAGE),
+    (0, b"MM\x00*", IMAGE),
+    (0, b"ID3", AUDIO),
+    (0, b"fLaC", AUDIO),
+    (0, b"OggS", AUDIO),
+    (0, b"#!AMR", AUDIO),
+    (0, b"FLV\x01", VIDEO),
+    (0, b"\x00\x00\x01\xba", VIDEO),             # MPEG program stream
+    (0, b"\x00\x00\x01\xb3", VIDEO),             # MPEG video sequence
+    (0, b"\x1a\x45\xdf\xa3", MEDIA),             # Matroska / WebM
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", MEDIA),   # ASF (WMA / WMV)
+]
+_RIFF_FORMS = {b"WAVE": AUDIO, b"AVI ": VIDEO, b"WEBP": IMAGE}
+_AIFF_FORMS = {b"AIFF", b"AIFC"}
+_ISO_AUDIO_BRANDS = {b"M4A ", b"M4B ", b"M4P ", b"F4A "}
+_ISO_IMAGE_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1", b"avif", b"avis"}
+_QUICKTIME_ATOMS = {b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+_SVG_RE = re.compile(rb"^\s*(?:<\?xml[^>]*>\s*)?(?:<!--.*?-->\s*|<!DOCTYPE[^>]*>\s*)*<svg[\s>]", re.IGNORECASE | re.DOTALL)
+
+
+def read_header(file: BinaryIO, size: int = HEADER_BYTES) -> bytes:
+    """First size bytes of file, leaving its position where it was. Buffered
+    readers at the start of the file are peeked without consuming anything;
+    other streams are read and seeked back. Returns b"" for unreadable or
+    text-mode files."""
+    try:
+        position = file.tell()
+    except (AttributeError, OSError, ValueError):
+        return b""
+    peek = getattr(file, "peek", None)
+    if position == 0 and peek is not None:
+        try:
+            header = peek(size)[:size]
+            if isinstance(header, bytes):
+                return header
+        except (OSError, ValueError):
+            pass
+    try:
+        file.seek(0)
+        header = file.read(size)
+        file.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return b""
+    return header if isinstance(header, bytes) else b""
+
+
+def sniff(header: bytes) -> str | None:
+    """Kind of content whose first bytes are header, from magic numbers, or
+    None when they match no known format"""
+    for (offset, magic, kind) in _SIGNATURES:
+        if header.startswith(magic, offset):
+            return kind
+    if len(header) < 12:
+        return None
+    if header.startswith(b"RIFF"):
+        return _RIFF_FORMS.get(header[8:12])
+    if header.startswith(b"FORM") and header[8:12] in _AIFF_FORMS:
+        return AUDIO
+    # ISO base media boxes start with a 32-bit size, whose first byte is 0 for a small box
+    if header[0] == 0 and header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in _ISO_AUDIO_BRANDS:
+            return AUDIO
+        if brand in _ISO_IMAGE_BRANDS:
+            return IMAGE
+        # mp4, mov, 3gp and generic brands, which audio-only files use too
+        return MEDIA
+    if header[0] == 0 and header[4:8] in _QUICKTIME_ATOMS:
+        return VIDEO
+    if header.startswith(b"BM") and header[6:10] == b"\x00\x00\x00\x00":
+        return IMAGE
+    # MPEG audio frame sync: MP3 without an ID3 tag, or ADTS AAC
+    if header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        return AUDIO
+    if _SVG_RE.match(header):
+        return IMAGE
+    return None
+
+
+def extension_kind(name: str) -> str | None:
+    return EXTENSIONS.get(os.path.splitext(name)[1][1:].lower())
+
+
+def is_url(name: str) -> bool:
+    return bool(URL_RE.match(name.strip()))
+
+
+def detect(name: str, header: bytes) -> str | None:
+    """Kind of an upload: its content when the header has a known magic
+    number, a URL when name is one, otherwise the kind its extension implies.
+    Returns "weblink" for URLs and None when nothing matches."""
+    kind = sniff(header)
+    if kind == MEDIA:
+        return AUDIO if extension_kind(name) == AUDIO else VIDEO
+    if kind is not None:
+        return kind
+    if is_url(name):
+        return "weblink"
+    return extension_kind(name)
@@ -1,46 +1,54 @@
+import io
 import logging
 import re
 import os
-from PIL import Image
-from camel.loaders import ChunkrReader, Firecrawl
-from camel.models import FishAudioModel
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from enum import Enum
-from dataclasses import dataclass
-from moviepy import VideoFileClip
-from PyPDF2 import PdfReader
-from typing import BinaryIO
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import BinaryIO, Callable
 from urllib.parse import urlparse
-from video_to_pdf import video_to_slides, slides_to_pdf
-from docling.document_converter import DocumentConverter
-from camel.agents import ChatAgent
-from camel.configs import QwenConfig
-from camel.messages import BaseMessage
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType, ModelType
+from crawler import CrawlError, CrawlResult, WebCrawler, page_url
+from extraction_cache import ExtractionCache
+from file_detection import detect, read_header
+from image_captioning import CamelCaptioner, ImageCaptioner
+from metrics import metrics
+from pdf_extraction import extract_pdf
+from processors import processors
+from text_aggregation import concatenate_texts
+from transcription import ChunkedTranscriber, FishAudioSpeechToText
 
 from dotenv import load_dotenv
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-IMAGE_TO_TEXT_SYSTEM_PROMPT = "You are a helpful assistant that can describe the content of an image."
-IMAGE_TO_TEXT_USER_PROMPT = "Please describe the content of the image in detail."
-
-import os
-import logging
-import re
-from enum import Enum
-from dataclasses import dataclass
-from typing import BinaryIO
-from urllib.parse import urlparse
-
-from camel.loaders import Firecrawl
-from camel.models import FishAudioModel
-
-# Assuming ImageProcessor is defined elsewhere as per your initial code
-
-logger = logging.getLogger(__name__)
+# progress(fraction done, stage message), reported while an upload is processed; see JobQueue
+Progress = Callable[[float, str], None]
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024               # bytes copied at a time when an upload has to be streamed
+
+# Registry backends each FileType needs; see FileManager.warm_up
+FILE_TYPE_PROCESSORS = {
+    "audio": ("audio_model",),
+    "pdf": ("pdf_converter",),
+    "image": ("vl_model",),
+    "video": ("audio_model", "pdf_converter", "slide_detection"),
+    "weblink": ("crawler",),
+}
+
+# Bump a processor's version whenever its output changes, so cached extractions are not reused
+PROCESSOR_VERSIONS = {
+    "pdf": 1,
+    "audio": 1,
+    "image": 2,
+    "video-audio": 1,
+    "video-slides": 1,
+}
+DEGRADED_PDF_METHODS = {"pypdf", "failed"}  # extract_pdf methods whose text is a fallback, never cached
 
 class FileType(Enum):
     AUDIO = "audio"
@@ -52,50 +60,14 @@ class FileType(Enum):
 
     @classmethod
     def from_file(cls, file: BinaryIO) -> "FileType":
+        """Type of an upload from its first bytes (see file_detection), its
+        name when that is a URL, or else its extension"""
         # Safeguard for files without a 'name' attribute
-        filename = getattr(file, 'name', '').lower()
-
-        # Web link patterns
-        web_patterns = [
-            r'\.html?$',
-            r'^https?://',
-            r'^www\.',
-            r'\.(com|org|net|edu|gov|mil|io|co|me|app|dev|ai|txt)(/|$)',
-            r'^localhost',
-            r':\d{2,5}',
-            r'/api/',
-            r'/v\d+/',
-            r'\?.*=.*',
-            r'#.*$'
-        ]
-
-        # Check for web links first
-        if any(re.search(pattern, filename) for pattern in web_patterns):
-            try:
-                parsed = urlparse(filename)
-                if parsed.scheme or parsed.netloc:
-                    return cls.WEBLINK
-            except Exception:
-                pass
-
-        # Audio files
-        if re.search(r'\.(mp3|wav|ogg|m4a|flac|aac|wma|aiff)$', filename):
-            return cls.AUDIO
-
-        # PDF files
-        if filename.endswith('.pdf'):
-            return cls.PDF
-
-        # Image files
-        if re.search(r'\.(jpg|jpeg|png|gif|bmp|webp|svg|tiff)$', filename):
-            return cls.IMAGE
-        
-        # Video files
-        if re.search(r'\.(mp4|avi|mkv|mov|wmv|flv|webm|mpeg|mpg|3gp)$', filename):
-            return cls.VIDEO
-
-        # Default to UNKNOWN
-        return cls.UNKNOWN
+        name = getattr(file, 'name', '')
+        if not isinstance(name, str):
+            name = ''
+        kind = detect(name, read_header(file))
+        return cls(kind) if kind is not None else cls.UNKNOWN
 
 @dataclass
 class File:
@@ -106,6 +78,10 @@ class File:
 
     @staticmethod
     def _get_binaryio_size_read(file: BinaryIO) -> int:
+        try:
+            return os.fstat(file.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
         current_pos = file.tell()
         file.seek(0, os.SEEK_END)
         size = file.tell()
@@ -133,166 +109,470 @@ class File:
             size=size
         )
 
+@dataclass
+class BatchItemResult:
+    source: str
+    file_type: FileType
+    size: int
+    outputs: list[str] = field(default_factory=list)
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchResult:
+    items: list[BatchItemResult]
+    seconds: float
+
+    @property
+    def succeeded(self) -> list[BatchItemResult]:
+        return [item for item in self.items if item.ok]
+
+    @property
+    def failed(self) -> list[BatchItemResult]:
+        return [item for item in self.items if not item.ok]
+
+    @property
+    def files_per_second(self) -> float:
+        return len(self.items) / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return sum(item.size for item in self.items) / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"{len(self.succeeded)}/{len(self.items)} files processed in {self.seconds:.1f}s "
+                f"({self.files_per_second:.2f} files/s, {self.bytes_per_second / 1024 ** 2:.2f} MiB/s)")
+
+
+_worker_manager = None
+
+def _get_worker_manager(save_dir: str) -> "FileManager":
+    """FileManager owned by a worker process, built on its first task"""
+    global _worker_manager
+    if _worker_manager is None or _worker_manager.save_dir != save_dir:
+        _worker_manager = FileManager(save_dir)
+    return _worker_manager
+
+
+def _run_slide_branch(save_dir: str, saved_path: str) -> tuple[dict[str, float], bool, dict]:
+    """Slide branch of a video upload, run in a worker process; returns its
+    timings, whether every slide's text was extracted and the metrics it recorded"""
+    timings = {}
+    with metrics.span("video.slides", timings):
+        complete = _get_worker_manager(save_dir)._process_video_slides(saved_path)
+    return timings, complete, metrics.collect()
+
+
 class FileManager:
-    def __init__(self, save_dir: str = "uploads"):
+    def __init__(self, save_dir: str = "uploads", cache: ExtractionCache | None = None):
         self.save_dir = save_dir
-        self.audio_model = FishAudioModel()
-        self.pdf_converter = DocumentConverter()
-        self.crawler = Firecrawl()
-        self.image_processor = ImageProcessor(save_dir)
+        self.cache = cache if cache is not None else ExtractionCache()
+        self.image_processor = ImageProcessor(save_dir, cache=self.cache)
         self.video_processor = VideoProcessor(save_dir)
 
-    def _save_file(self, file: BinaryIO):
+    # Backends come from the shared processor registry and are built on first use
+
+    @property
+    def audio_model(self):
+        return processors.get("audio_model")
+
+    @property
+    def pdf_converter(self):
+        return processors.get("pdf_converter")
+
+    @property
+    def crawler(self):
+        return processors.get("crawler")
+
+    @cached_property
+    def web_crawler(self) -> WebCrawler:
+        return WebCrawler()
+
+    @cached_property
+    def transcriber(self) -> ChunkedTranscriber:
+        return ChunkedTranscriber(FishAudioSpeechToText(self.audio_model))
+
+    def warm_up(self, file_types: list[FileType] | None = None):
+        """Build the backends needed for file_types (all by default) ahead of the first upload"""
+        for file_type in file_types or list(FileType):
+            for name in FILE_TYPE_PROCESSORS.get(file_type.value, ()):
+                processors.get(name)
+
+    def _unique_target(self, filename: str, create) -> str:
+        """Call create(path) for save_dir/filename, then name_1, name_2... until
+        it does not raise FileExistsError; exclusive creation keeps concurrent
+        uploads of the same name apart"""
         os.makedirs(self.save_dir, exist_ok=True)
         # Use os.path.basename to prevent directory traversal
-        filename = os.path.basename(getattr(file, 'name', 'unknown'))
-        filepath = os.path.join(self.save_dir, filename)
-        
-        # Prevent overwriting by appending a number if file exists
+        filepath = os.path.join(self.save_dir, os.path.basename(filename))
         base, ext = os.path.splitext(filepath)
         counter = 1
-        while os.path.exists(filepath):
-            filepath = f"{base}_{counter}{ext}"
-            counter += 1
+        while True:
+            try:
+                create(filepath)
+                return filepath
+            except FileExistsError:
+                filepath = f"{base}_{counter}{ext}"
+                counter += 1
 
-        with open(filepath, 'wb') as f:
-            file.seek(0)
-            f.write(file.read())
+    def _save_file(self, file: BinaryIO):
+        def write(filepath: str):
+            with open(filepath, 'xb') as f:
+                file.seek(0)
+                shutil.copyfileobj(file, f, UPLOAD_CHUNK_SIZE)
+
+        return self._unique_target(getattr(file, 'name', 'unknown'), write)
+
+    def _place_file(self, path: str, move: bool = False) -> str:
+        """Put a file that is already on disk into save_dir without reading it
+        into memory: a hardlink on the same filesystem, otherwise a kernel-side
+        copy. With move the original is removed afterwards."""
+        def place(filepath: str):
+            try:
+                os.link(path, filepath)
+            except FileExistsError:
+                raise
+            except OSError:
+                with open(filepath, 'xb'):
+                    pass
+                shutil.copyfile(path, filepath)
+
+        filepath = self._unique_target(path, place)
+        if move:
+            os.remove(path)
         return filepath
     
-    def _process_pdf(self, pdf_file_path: str):
-        pdf_text = ""
+    def _process_pdf(self, pdf_file_path: str, progress: Progress | None = None) -> bool:
+        """Extract a PDF's text; returns False when some page fell back to
+        PyPDF2 or failed, so the output is not worth caching"""
+        output_path = f"{pdf_file_path}.txt"
+
+        def pages_progress(pages_done: int, page_count: int):
+            logger.info(f"{pdf_file_path}: {pages_done}/{page_count} pages extracted")
+            if progress is not None:
+                progress(pages_done / page_count, f"{pages_done}/{page_count} pages extracted")
+
+        methods = extract_pdf(pdf_file_path, output_path, progress=pages_progress)
+        logger.info(f"PDF processing complete, output saved to {output_path}")
+        return not any(method in DEGRADED_PDF_METHODS for method in methods)
+
+    def _process_page_image(self, name: str, image: bytes) -> str | None:
+        """Markdown of one slide, or None when docling could not convert it"""
+        from docling.datamodel.base_models import DocumentStream
         try:
-            converter = DocumentConverter()
-            result = converter.convert(pdf_file_path)
+            with metrics.span("slides.docling"):
+                result = self.pdf_converter.convert(DocumentStream(name=name, stream=io.BytesIO(image)))
+            return result.document.export_to_markdown()
         except Exception as e:
-            logger.warning(f"ChunkrReader failed, using PyPDF2 fallback: {e}")
-            # Fallback to PyPDF2
-            with open(pdf_file_path, 'rb') as pdf_file:
-                pdf_reader = PdfReader(pdf_file)
-                for page in pdf_reader.pages:
-                    pdf_text += page.extract_text() + "\n"
-            result = pdf_text
-
-        output_path = os.path.join(f"{pdf_file_path}.txt")
+            logger.warning(f"Failed to extract text from {name}: {e}")
+            return None
+
+    def _process_video_slides(self, saved_path: str) -> bool:
+        """Stream the video's slides into a PDF and extract their text page by
+        page while detection is still running, without a PNG round trip.
+        Returns False when some slide's text could not be extracted."""
+        base = os.path.splitext(os.path.basename(saved_path))[0]
+        pages = []
+        with ThreadPoolExecutor(max_workers=1) as extractor:
+            def on_page(page_number: int, jpeg: bytes):
+                pages.append(extractor.submit(self._process_page_image, f"{base}_{page_number:03}.jpg", jpeg))
+
+            self.video_processor.video_to_pdf(saved_path, on_page=on_page)
+
+        texts = [page.result() for page in pages]
+        output_path = f"{os.path.splitext(saved_path)[0]}.pdf.txt"
         with open(output_path, "w", encoding='utf-8') as f:
-            f.write(result)
-        logger.info(f"PDF processing complete, output saved to {output_path}")
+            f.write("\n\n".join(text or "" for text in texts))
+        logger.info(f"Slide text extraction complete, output saved to {output_path}")
+        return all(text is not None for text in texts)
 
-    def _process_audio(self, saved_path: str):
+    def _process_audio(self, saved_path: str, progress: Progress | None = None):
         audio_file_path = saved_path
-        audio_text = self.audio_model.speech_to_text(audio_file_path)
+
+        def chunks_progress(chunks_done: int, chunk_count: int):
+            if progress is not None:
+                progress(chunks_done / chunk_count, f"{chunks_done}/{chunk_count} audio chunks transcribed")
+
+        audio_text = self.transcriber.transcribe(audio_file_path, chunks_progress)
         with open(f"{audio_file_path}.txt", "w") as f:
             f.write(audio_text)
 
-    def upload_file(self, file: BinaryIO):
+    def _run_audio_branch(self, saved_path: str, progress: Progress | None = None) -> dict[str, float]:
+        timings = {}
+        with metrics.span("video.extract_audio", timings):
+            if progress is not None:
+                progress(0.0, "extracting audio")
+            audio_path = self.video_processor.extract_audio(saved_path)
+        if audio_path is None:
+            # a silent screen recording still has its slides; its transcript is just empty
+            with open(f"{saved_path}.mp3.txt", "w"):
+                pass
+            return timings
+        with metrics.span("video.speech_to_text", timings):
+            self._process_audio(audio_path, progress)
+        return timings
+
+    def _process_video(self, saved_path: str, progress: Progress | None = None) -> bool:
+        """Run the audio branch (network-bound STT) on a thread and the slide
+        branch (CPU-bound detection) in a process at the same time, so the
+        wall-clock time is that of the longer branch. Returns False when some
+        slide's text could not be extracted. Progress follows the audio
+        branch; the slide branch only reports when it is done."""
+        timings = {}
+        errors = []
+        complete = True
+        with metrics.span("video.total", timings):
+            slides = processors.submit("slide_pool", _run_slide_branch, self.save_dir, saved_path)
+            with ThreadPoolExecutor(max_workers=1) as audio_pool:
+                # the slide branch is usually the longer one, so audio gets the first 90%
+                audio_progress = (lambda fraction, message: progress(0.9 * fraction, message)) if progress else None
+                audio = audio_pool.submit(self._run_audio_branch, saved_path, audio_progress)
+            if progress is not None and not slides.done():
+                progress(0.9, "waiting for slide detection")
+            for branch, future in (("audio", audio), ("slides", slides)):
+                try:
+                    if branch == "slides":
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            # the worker died, maybe on an earlier upload's video queued ahead of this
+                            # one; the pool is rebuilt, so the slides get one more try
+                            logger.warning(f"Slide worker died, retrying slide detection for {saved_path}")
+                            result = processors.submit("slide_pool", _run_slide_branch, self.save_dir, saved_path).result()
+                        (branch_timings, complete, recorded) = result
+                        metrics.merge(recorded)
+                    else:
+                        branch_timings = future.result()
+                    timings.update(branch_timings)
+                except Exception as e:
+                    logger.error(f"Video {branch} branch failed for {saved_path}: {e}")
+                    errors.append(e)
+
+        logger.info(f"Video stage timings for {saved_path}: " + ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
+        if errors:
+            raise errors[0]
+        return complete
+
+    def _weblink_path(self, url: str) -> str:
+        # Sanitize filename from URL
+        parsed_url = urlparse(url)
+        safe_filename = re.sub(r'\W+', '_', parsed_url.netloc + parsed_url.path)
+        if not safe_filename:
+            safe_filename = 'weblink'
+        return os.path.join(self.save_dir, f"{safe_filename}.txt")
+
+    def _save_weblink(self, result: CrawlResult) -> str:
+        os.makedirs(self.save_dir, exist_ok=True)
+        output_path = self._weblink_path(result.url)
+        with open(output_path, "w", encoding='utf-8') as f:
+            f.write(result.markdown)
+        return output_path
+
+    def _process_weblink(self, url: str) -> str:
+        result = self.web_crawler.fetch(page_url(url))
+        if not result.ok:
+            raise CrawlError(result.error)
+        return self._save_weblink(result)
+
+    def crawl(self, sources: list[str]) -> BatchResult:
+        """Fetch page and sitemap URLs concurrently (see crawler.WebCrawler) and
+        save each page's markdown as it arrives; one outcome per unique page"""
+        start = time.perf_counter()
+        items = []
+
+        def save(result: CrawlResult):
+            item = BatchItemResult(source=result.url, file_type=FileType.WEBLINK, size=0, error=result.error,
+                                   seconds=result.seconds)
+            if result.ok:
+                try:
+                    item.outputs = [self._save_weblink(result)]
+                except OSError as e:
+                    item.error = str(e)
+            items.append(item)
+
+        report = self.web_crawler.crawl(sources, on_result=save)
+        order = {result.url: index for index, result in enumerate(report.results)}
+        result = BatchResult(items=sorted(items, key=lambda item: order[item.source]), seconds=time.perf_counter() - start)
+        logger.info(result.summary())
+        return result
+
+    def _output_paths(self, file_type: FileType, path: str) -> dict[str, str]:
+        """Text files each processor writes for an upload saved at path (the URL for weblinks)"""
+        if file_type == FileType.PDF:
+            return {"pdf": f"{path}.txt"}
+        if file_type == FileType.AUDIO:
+            return {"audio": f"{path}.txt"}
+        if file_type == FileType.IMAGE:
+            return {"image": self.image_processor.description_path(path)}
+        if file_type == FileType.VIDEO:
+            return {
+                "video-audio": f"{path}.mp3.txt",
+                "video-slides": f"{os.path.splitext(path)[0]}.pdf.txt",
+            }
+        return {}
+
+    def _restore_from_cache(self, digest: str, outputs: dict[str, str]) -> bool:
+        texts = {}
+        for processor in outputs:
+            text = self.cache.get(self.cache.key(digest, processor, PROCESSOR_VERSIONS[processor]))
+            if text is None:
+                return False
+            texts[processor] = text
+        os.makedirs(self.save_dir, exist_ok=True)
+        for processor, output_path in outputs.items():
+            with open(output_path, "w", encoding='utf-8') as f:
+                f.write(texts[processor])
+        return True
+
+    def _store_in_cache(self, digest: str, outputs: dict[str, str]):
+        for processor, output_path in outputs.items():
+            if not os.path.exists(output_path):
+                logger.warning(f"{processor} produced no output at {output_path}, not caching it")
+                continue
+            with open(output_path, "r", encoding='utf-8') as f:
+                self.cache.put(self.cache.key(digest, processor, PROCESSOR_VERSIONS[processor]), f.read())
+
+    def _process_saved(self, file_type: FileType, saved_path: str, digest: str, progress: Progress | None = None) -> list[str]:
+        """Outputs for an upload saved at saved_path, restored from the cache
+        when its bytes were processed before, otherwise produced and cached
+        unless processing fell back to a degraded result. Processing errors
+        propagate; only outputs that were actually written are returned."""
+        outputs = self._output_paths(file_type, saved_path)
+        if self._restore_from_cache(digest, outputs):
+            logger.info(f"Cache hit for {saved_path}, restored {list(outputs.values())}")
+            return list(outputs.values())
+
+        metrics.count("upload_bytes", os.path.getsize(saved_path), type=file_type.value)
+        complete = True
+        with metrics.span(f"upload.{file_type.value}", file=os.path.basename(saved_path)):
+            if file_type == FileType.IMAGE:
+                with open(saved_path, 'rb') as f:
+                    self.image_processor.process_image(File.from_upload(f))
+            elif file_type == FileType.PDF:
+                complete = self._process_pdf(saved_path, progress)
+            elif file_type == FileType.AUDIO:
+                self._process_audio(saved_path, progress)
+            elif file_type == FileType.VIDEO:
+                complete = self._process_video(saved_path, progress)
+
+        if complete:
+            self._store_in_cache(digest, outputs)
+        else:
+            # a video's transcript is still exact; only the text that fell back is left out
+            degraded = {"pdf", "video-slides"}
+            logger.warning(f"{saved_path} was processed with fallbacks, not caching {sorted(degraded & outputs.keys())}")
+            self._store_in_cache(digest, {name: path for name, path in outputs.items() if name not in degraded})
+        written = [path for path in outputs.values() if os.path.exists(path)]
+        if len(written) < len(outputs):
+            logger.warning(f"{saved_path}: no output at {sorted(set(outputs.values()) - set(written))}")
+        return written
+
+    def upload_path(self, path: str, move: bool = False, progress: Progress | None = None) -> list[str]:
+        """Like upload_file for a file already on disk. The file is hardlinked
+        (or moved) into save_dir and hashed through a memory map, so peak
+        memory does not depend on its size."""
+        with open(path, 'rb') as f:
+            file_type = FileType.from_file(f)
+        if file_type not in [FileType.AUDIO, FileType.PDF, FileType.IMAGE, FileType.VIDEO]:
+            logger.error(f"Unsupported file type for {path}")
+            return []
+
+        digest = self.cache.hash_path(path)
+        # outputs are named after the path the file is given, which may carry a _1, _2... suffix
+        saved_path = self._place_file(path, move=move)
+        logger.info(f"File saved to {saved_path}")
+        return self._process_saved(file_type, saved_path, digest, progress)
+
+    def upload_file(self, file: BinaryIO, progress: Progress | None = None) -> list[str]:
+        """Process an upload and return the paths of the text files it produced.
+        Files seen before (same bytes, same processor version) are
+        served from the extraction cache without running any processor.
+        progress(fraction, message) is called as processing stages advance."""
         file_type = FileType.from_file(file)
 
         if file_type in [FileType.AUDIO, FileType.PDF, FileType.IMAGE, FileType.VIDEO]:
+            digest = self.cache.hash_file(file)
             saved_path = self._save_file(file)
             logger.info(f"File saved to {saved_path}")
-            if file_type == FileType.IMAGE:
-                self.image_processor.process_image(File.from_upload(file))
-            elif file_type == FileType.PDF:
-                self._process_pdf(saved_path)
-            elif file_type == FileType.AUDIO:
-                self._process_audio(saved_path)
-            elif file_type == FileType.VIDEO:
-                audio_path = self.video_processor.extract_audio(saved_path)
-                self._process_audio(audio_path)
-                pdf_path = self.video_processor.video_to_pdf(saved_path)
-                self._process_pdf(pdf_path)       
+            return self._process_saved(file_type, saved_path, digest, progress)
         elif file_type == FileType.WEBLINK:
-            # Assuming 'file' contains the URL as bytes
-            try:
-                url = file.read().decode('utf-8').strip()
-                result = self.crawler.scrape(url)
-                # Sanitize filename from URL
-                parsed_url = urlparse(url)
-                safe_filename = re.sub(r'\W+', '_', parsed_url.netloc + parsed_url.path)
-                if not safe_filename:
-                    safe_filename = 'weblink'
-                filepath = os.path.join(self.save_dir, f"{safe_filename}.txt")
-                with open(filepath, "w", encoding='utf-8') as f:
-                    f.write(result['markdown'])
-            except Exception as e:
-                logger.error(f"Failed to process weblink: {e}")
-
-    def concatenate_texts(self):
-        files = [os.path.join(self.save_dir, file) for file in os.listdir(self.save_dir) if file.endswith('.txt')]
-        texts = []
-        for file in files:
-            with open(file, "r") as f:
-                texts.append(f'{file}: \n{f.read()}')
-            concatenated_text = "\n".join(texts)
-        with open(os.path.join(self.save_dir, "concatenated.txt"), "w") as f:
-            f.write(concatenated_text)
+            # 'file' contains the URL as bytes; pages are revalidated with a
+            # conditional GET rather than served from the extraction cache
+            url = file.read().decode('utf-8').strip()
+            return [self._process_weblink(url)]
+        return []
+
+    def concatenate_texts(self) -> str:
+        """Join every text output in save_dir into concatenated.txt; see text_aggregation"""
+        return concatenate_texts(self.save_dir)
 
 class ImageProcessor:
-    def __init__(self, save_dir: str):
-        self.model = ModelFactory.create(
-            model_platform=ModelPlatformType.QWEN,
-            model_type=ModelType.QWEN_VL_PLUS,
-            model_config_dict=QwenConfig(temperature=0.2).as_dict(),
-        )
+    def __init__(self, save_dir: str, cache: ExtractionCache | None = None):
         self.save_dir = save_dir
-        self.img_agent = ChatAgent(
-            system_message=IMAGE_TO_TEXT_SYSTEM_PROMPT,
-            model=self.model,
-            output_language="English"  # Changed to match prompts
-        )
+        # one captioner per processor, so its concurrency limit covers every upload thread
+        self.captioner = ImageCaptioner(CamelCaptioner(lambda: self.model), cache=cache)
 
-    def process_image(self, image_file: File):
-        # Open the image using PIL.Image
-        try:
-            pil_image = Image.open(image_file.content)
-        except IOError:
-            logger.error("Cannot convert binary data to an image.")
-            return
-
-        user_msg = BaseMessage.make_user_message(
-            role_name="User",
-            content=IMAGE_TO_TEXT_USER_PROMPT,
-            image_list=[pil_image]
-        )
-            
-        try:
-            response = self.img_agent.step(user_msg)
-            img_description = response.msgs[0].content
+    @property
+    def model(self):
+        return processors.get("vl_model")
+
+    def description_path(self, name: str) -> str:
+        # Ensure the filename is safe
+        safe_filename = re.sub(r'\W+', '_', os.path.basename(name))
+        return os.path.join(self.save_dir, f"{safe_filename}.txt")
 
-            # Ensure the filename is safe
-            safe_filename = re.sub(r'\W+', '_', image_file.name)
-            description_path = os.path.join(self.save_dir, f"{safe_filename}.txt")
+    def process_image(self, image_file: File):
+        img_description = self.captioner.caption_bytes([image_file.content.read()])[0]
+        description_path = self.description_path(image_file.name)
+        with open(description_path, "w", encoding='utf-8') as f:
+            f.write(img_description)
+        logger.info(f"Image description saved to {description_path}")
+
+    def process_images(self, paths: list[str]) -> list[str]:
+        """Caption images already on disk as one batch; returns the description paths in input order"""
+        description_paths = []
+        for path, img_description in zip(paths, self.captioner.caption_paths(paths)):
+            description_path = self.description_path(path)
             with open(description_path, "w", encoding='utf-8') as f:
                 f.write(img_description)
-            logger.info(f"Image description saved to {description_path}")
-        except Exception as e:
-            logger.error(f"Failed to process image: {e}")
+            description_paths.append(description_path)
+        logger.info(f"Saved {len(description_paths)} image descriptions to {self.save_dir}")
+        return description_paths
 
 class VideoProcessor:
     def __init__(self, save_dir: str):
         self.save_dir = save_dir
     
-    def extract_audio(self, saved_path: str):
-        try:
-            video_clip = VideoFileClip(saved_path)
-            audio_clip = video_clip.audio
-            audio_path = f"{saved_path}.mp3"
-            audio_clip.write_audiofile(audio_path)
-            logger.info(f"Audio extracted and saved to {audio_path}")
-        except Exception as e:
-            logger.error(f"Failed to extract audio: {e}")
-
+    def extract_audio(self, saved_path: str) -> str | None:
+        """Audio track of the video as an MP3 next to it; returns its path, or
+        None when the video has no audio track"""
+        from moviepy import VideoFileClip
+        video_clip = VideoFileClip(saved_path)
+        audio_clip = video_clip.audio
+        if audio_clip is None:
+            logger.info(f"{saved_path} has no audio track, only the slides will be extracted")
+            return None
+        audio_path = f"{saved_path}.mp3"
+        audio_clip.write_audiofile(audio_path)
+        logger.info(f"Audio extracted and saved to {audio_path}")
         return audio_path
         
-    def video_to_pdf(self, video_path: str) -> str:
-        pdf_path = f"{video_path.replace('.mp4', '.pdf')}"
-        try:    
-            output_folder_screenshot_path, saved_files = video_to_slides(video_path)
-            slides_to_pdf(video_path, output_folder_screenshot_path, saved_files)
-            logger.info(f"PDF processing complete, output saved to {pdf_path}")
-        except Exception as e:
-            logger.error(f"Failed to process video: {e}")
+    def video_to_pdf(self, video_path: str, on_page=None) -> str | None:
+        """Slides of the video as a PDF next to it; returns its path, or None
+        when the video has no slides. Detection errors propagate."""
+        slide_detection = processors.get("slide_detection")
+        pdf_path = f"{os.path.splitext(video_path)[0]}.pdf"
+        try:
+            slide_detection.video_to_pdf_stream(video_path, pdf_path, on_page=on_page)
+        except slide_detection.NoSlidesError as e:
+            logger.info(f"{e}, only the audio will be transcribed")
+            return None
+        logger.info(f"PDF processing complete, output saved to {pdf_path}")
         return pdf_path
     
     def merge_audio_and_pdf(self, audio_txt_path: str, pdf_txt_path: str):
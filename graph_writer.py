@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from dataclasses import dataclass, field
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BATCH_SIZE = 5000          # rows sent to the store in one transaction
+GRAPH_DB = "graph.sqlite3"
+
+
+def normalize_name(name: str) -> str:
+    """Stable key of an entity: names that only differ in case, quoting or
+    spacing are the same node"""
+    return " ".join(re.sub(r"[\"'`‘’“”]", "", str(name)).split()).casefold()
+
+
+def normalize_type(node_type: str) -> str:
+    words = re.findall(r"[A-Za-z0-9]+", str(node_type))
+    return "".join(word[:1].upper() + word[1:] for word in words) or "Entity"
+
+
+def normalize_relation(relation_type: str) -> str:
+    return "_".join(re.findall(r"[A-Za-z0-9]+", str(relation_type))).upper() or "RELATED_TO"
+
+
+def document_key(source: str, document_id: str) -> str:
+    """Key of a Document node. Element ids are content hashes, so the same
+    text saved under two names has one id; keying on the source as well keeps
+    them two documents, and removing one source leaves the other intact."""
+    return f"{source}\x00{document_id}"
+
+
+def _properties(item) -> dict:
+    properties = getattr(item, "properties", None) or {}
+    return {str(name): value for name, value in properties.items() if isinstance(value, (str, int, float, bool))}
+
+
+@dataclass
+class _Buffer:
+    nodes: dict[str, dict] = field(default_factory=dict)
+    relationships: dict[tuple[str, str, str, str], dict] = field(default_factory=dict)
+    documents: dict[str, dict] = field(default_factory=dict)
+    mentions: dict[tuple[str, str], dict] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.nodes) + len(self.relationships) + len(self.documents) + len(self.mentions)
+
+
+class Neo4jGraphBackend:
+    """Writes batches with UNWIND ... MERGE, one transaction per batch. Nodes
+    are merged on a unique key, so writing the same graph again changes nothing."""
+
+    def __init__(self, url: str, username: str, password: str, database: str | None = None):
+        from neo4j import GraphDatabase
+        self.driver = GraphDatabase.driver(url, auth=(username, password))
+        self.database = database
+        with self.driver.session(database=self.database) as session:
+            session.run("CREATE CONSTRAINT entity_key IF NOT EXISTS FOR (n:Entity) REQUIRE n.key IS UNIQUE")
+            # documents used to be unique on their id alone, which collides for identical content
+            session.run("DROP CONSTRAINT document_id IF EXISTS")
+            session.run("CREATE CONSTRAINT document_key IF NOT EXISTS FOR (d:Document) REQUIRE d.key IS UNIQUE")
+            session.run("CREATE INDEX document_source IF NOT EXISTS FOR (d:Document) ON (d.source)")
+
+    @classmethod
+    def from_env(cls) -> "Neo4jGraphBackend":
+        return cls(os.getenv("NEO4J_URI"), os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+
+    def _write(self, query: str, rows: list[dict]):
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(lambda tx: tx.run(query, rows=rows).consume())
+
+    def merge_nodes(self, rows: list[dict]):
+        # nodes carry their type as a label, like camel's own Neo4j storage,
+        # and Entity as well, which holds the unique key every write matches on
+        by_label = {}
+        for row in rows:
+            by_label.setdefault(normalize_type(row["type"]), []).append(row)
+        for label, batch in by_label.items():
+            # label is normalized to [A-Za-z0-9], so it is safe to put in the query
+            self._write(f"""
+                UNWIND $rows AS row
+                MERGE (n:Entity {{key: row.key}})
+                SET n:`{label}`, n.id = row.id, n.type = row.type, n += row.properties
+            """, batch)
+
+    def merge_documents(self, rows: list[dict]):
+        self._write("""
+            UNWIND $rows AS row
+            MERGE (d:Document {key: row.key})
+            SET d.id = row.id, d.source = row.source
+        """, rows)
+
+    def merge_mentions(self, rows: list[dict]):
+        self._write("""
+            UNWIND $rows AS row
+            MATCH (d:Document {key: row.document}), (n:Entity {key: row.node})
+            MERGE (d)-[:MENTIONS]->(n)
+        """, rows)
+
+    def merge_relationships(self, relation: str, rows: list[dict]):
+        # relation is normalized to [A-Z0-9_], so it is safe to put in the query
+        self._write(f"""
+            UNWIND $rows AS row
+            MATCH (a:Entity {{key: row.subj}}), (b:Entity {{key: row.obj}})
+            MERGE (a)-[r:`{relation}`]->(b)
+            SET r += row.properties,
+                r.sources = CASE WHEN row.source IN coalesce(r.sources, []) THEN r.sources
+                                 ELSE coalesce(r.sources, []) + row.source END
+        """, rows)
+
+    def remove_sources(self, sources: list[str]):
+        """Take everything written for sources out of the graph: their
+        documents, their tag on shared relationships (and relationships left
+        without any source), and entities no other document mentions."""
+        self._write("""
+            UNWIND $rows AS source
+            MATCH (:Document {source: source})-[:MENTIONS]->(:Entity)-[r]-(:Entity)
+            WHERE source IN coalesce(r.sources, [])
+            WITH DISTINCT r, source
+            SET r.sources = [tag IN r.sources WHERE tag <> source]
+            WITH r WHERE size(r.sources) = 0
+            DELETE r
+        """, sources)
+        self._write("""
+            UNWIND $rows AS source
+            MATCH (d:Document {source: source})
+            OPTIONAL MATCH (d)-[:MENTIONS]->(n:Entity)
+            WITH d, collect(n) AS nodes
+            DETACH DELETE d
+            WITH nodes UNWIND nodes AS n
+            WITH DISTINCT n WHERE NOT (:Document)-[:MENTIONS]->(n)
+            DETACH DELETE n
+        """, sources)
+
+    def close(self):
+        self.driver.close()
+
+
+class SQLiteGraphBackend:
+    """Embedded graph store with the same write semantics as the Neo4j
+    backend, for tests and local runs without a database server"""
+
+    def __init__(self, path: str = GRAPH_DB):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_documents()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (key TEXT PRIMARY KEY, id TEXT NOT NULL, type TEXT NOT NULL, properties TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, id TEXT NOT NULL, source TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS documents_source ON documents (source);
+            CREATE TABLE IF NOT EXISTS mentions (document TEXT NOT NULL, node TEXT NOT NULL, PRIMARY KEY (document, node));
+            CREATE INDEX IF NOT EXISTS mentions_node ON mentions (node);
+            CREATE TABLE IF NOT EXISTS relationships (
+                subj TEXT NOT NULL, obj TEXT NOT NULL, type TEXT NOT NULL, properties TEXT NOT NULL, sources TEXT NOT NULL,
+                PRIMARY KEY (subj, obj, type)
+            );
+            CREATE INDEX IF NOT EXISTS relationships_obj ON relationships (obj);
+        """)
+
+    def _migrate_documents(self):
+        """Re-key documents of a graph written when they were keyed on their id alone"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(documents)")]
+        if not columns or "key" in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE documents RENAME TO documents_by_id")
+            self.conn.execute("CREATE TABLE documents (key TEXT PRIMARY KEY, id TEXT NOT NULL, source TEXT NOT NULL)")
+            self.conn.execute("INSERT INTO documents SELECT coalesce(source, '') || char(0) || id, id, coalesce(source, '') FROM documents_by_id")
+            self.conn.execute("UPDATE mentions SET document = (SELECT key FROM documents WHERE documents.id = mentions.document)")
+            self.conn.execute("DROP TABLE documents_by_id")
+
+    def merge_nodes(self, rows: list[dict]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO nodes VALUES (:key, :id, :type, :properties) "
+                "ON CONFLICT (key) DO UPDATE SET id = excluded.id, type = excluded.type, properties = excluded.properties",
+                [{**row, "properties": json.dumps(row["properties"], sort_keys=True)} for row in rows],
+            )
+
+    def merge_documents(self, rows: list[dict]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO documents VALUES (:key, :id, :source) ON CONFLICT (key) DO NOTHING", rows)
+
+    def merge_mentions(self, rows: list[dict]):
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO mentions VALUES (:document, :node)", rows)
+
+    def merge_relationships(self, relation: str, rows: list[dict]):
+        with self.conn:
+            for row in rows:
+                existing = self.conn.execute(
+                    "SELECT sources FROM relationships WHERE subj = ? AND obj = ? AND type = ?",
+                    (row["subj"], row["obj"], relation),
+                ).fetchone()
+                sources = json.loads(existing[0]) if existing else []
+                if row["source"] not in sources:
+                    sources.append(row["source"])
+                self.conn.execute(
+                    "INSERT INTO relationships VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (subj, obj, type) DO UPDATE SET properties = excluded.properties, sources = excluded.sources",
+                    (row["subj"], row["obj"], relation, json.dumps(row["properties"], sort_keys=True), json.dumps(sources)),
+                )
+
+    def remove_sources(self, sources: list[str]):
+        with self.conn:
+            for source in sources:
+                documents = [row[0] for row in self.conn.execute("SELECT key FROM documents WHERE source = ?", (source,))]
+                marks = ",".join("?" * len(documents))
+                nodes = {row[0] for row in self.conn.execute(f"SELECT node FROM mentions WHERE document IN ({marks})", documents)}
+                for node in nodes:
+                    rows = self.conn.execute(
+                        "SELECT subj, obj, type, sources FROM relationships WHERE subj = ? UNION "
+                        "SELECT subj, obj, type, sources FROM relationships WHERE obj = ?", (node, node)).fetchall()
+                    for (subj, obj, relation, tags) in rows:
+                        tags = json.loads(tags)
+                        if source not in tags:
+                            continue
+                        tags.remove(source)
+                        if tags:
+                            self.conn.execute("UPDATE relationships SET sources = ? WHERE subj = ? AND obj = ? AND type = ?",
+                                              (json.dumps(tags), subj, obj, relation))
+                        else:
+                            self.conn.execute("DELETE FROM relationships WHERE subj = ? AND obj = ? AND type = ?", (subj, obj, relation))
+                self.conn.execute(f"DELETE FROM mentions WHERE document IN ({marks})", documents)
+                self.conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+                for node in nodes:
+                    if self.conn.execute("SELECT 1 FROM mentions WHERE node = ? LIMIT 1", (node,)).fetchone() is None:
+                        self.conn.execute("DELETE FROM relationships WHERE subj = ? OR obj = ?", (node, node))
+                        self.conn.execute("DELETE FROM nodes WHERE key = ?", (node,))
+
+    def counts(self) -> dict[str, int]:
+        return {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("nodes", "relationships", "documents", "mentions")}
+
+    def close(self):
+        self.conn.close()
+
+
+class GraphWriter:
+    """Buffers nodes, relationships and their source documents and flushes
+    them to a backend in batches of batch_size rows. Everything is keyed
+    (nodes on their normalized name, relationships on both ends and type,
+    documents on their source and element id), so repeated writes are no-ops."""
+
+    def __init__(self, backend, batch_size: int = GRAPH_BATCH_SIZE):
+        self.backend = backend
+        self.batch_size = batch_size
+        self._buffer = _Buffer()
+        self.pending_sources = set()
+
+    @property
+    def full(self) -> bool:
+        return len(self._buffer) >= self.batch_size
+
+    def add_node(self, name: str, node_type: str, properties: dict | None = None) -> str:
+        key = normalize_name(name)
+        self._buffer.nodes[key] = {"key": key, "id": str(name).strip(), "type": str(node_type), "properties": properties or {}}
+        return key
+
+    def add_relationship(self, subj: str, obj: str, relation: str, source: str, properties: dict | None = None):
+        row = {"subj": normalize_name(subj), "obj": normalize_name(obj), "source": source, "properties": properties or {}}
+        self._buffer.relationships[(row["subj"], row["obj"], normalize_relation(relation), source)] = row
+
+    def add_document(self, document_id: str, source: str, node_keys):
+        key = document_key(source, document_id)
+        self._buffer.documents[key] = {"key": key, "id": document_id, "source": source}
+        for node in node_keys:
+            self._buffer.mentions[(key, node)] = {"document": key, "node": node}
+        self.pending_sources.add(source)
+
+    def add(self, graph_element, source: str):
+        """Buffer a camel GraphElement extracted from the file `source`"""
+        keys = {self.add_node(node.id, node.type, _properties(node)) for node in graph_element.nodes}
+        for relationship in graph_element.relationships:
+            for node in (relationship.subj, relationship.obj):
+                if normalize_name(node.id) not in keys:
+                    keys.add(self.add_node(node.id, node.type, _properties(node)))
+            self.add_relationship(relationship.subj.id, relationship.obj.id, relationship.type, source, _properties(relationship))
+        document_id = getattr(graph_element.source, "id", None) or source
+        self.add_document(document_id, source, keys)
+
+    def _batches(self, rows: list):
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+
+    def flush(self):
+        """Write everything buffered. The buffer is only cleared once all of
+        it is written, so a failed flush can simply be retried."""
+        buffer = self._buffer
+        with metrics.span("graph.flush", backend=type(self.backend).__name__):
+            self._write(buffer)
+        metrics.count("graph_rows_written", len(buffer.nodes), kind="node")
+        metrics.count("graph_rows_written", len(buffer.relationships), kind="relationship")
+        if len(buffer):
+            logger.info(f"Wrote {len(buffer.nodes)} nodes, {len(buffer.relationships)} relationships "
+                        f"and {len(buffer.documents)} documents to the graph")
+        self.clear()
+
+    def _write(self, buffer: "_Buffer"):
+        for batch in self._batches(list(buffer.nodes.values())):
+            self.backend.merge_nodes(batch)
+        for batch in self._batches(list(buffer.documents.values())):
+            self.backend.merge_documents(batch)
+        for batch in self._batches(list(buffer.mentions.values())):
+            self.backend.merge_mentions(batch)
+        by_relation = {}
+        for (_, _, relation, _), row in buffer.relationships.items():
+            by_relation.setdefault(relation, []).append(row)
+        for relation, rows in by_relation.items():
+            for batch in self._batches(rows):
+                self.backend.merge_relationships(relation, batch)
+
+    def clear(self):
+        self._buffer = _Buffer()
+        self.pending_sources = set()
+
+    def close(self):
+        self.flush()
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.backend.close()
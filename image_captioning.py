@@ -0,0 +1,189 @@
+import hashlib
+import io
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from extraction_cache import ExtractionCache
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CAPTION_SYSTEM_PROMPT = "You are a helpful assistant that can describe the content of an image."
+CAPTION_USER_PROMPT = "Please describe the content of the image in detail."
+CAPTION_BATCH_PROMPT = ("Please describe the content of each of the {count} images in detail. "
+                        "Start the description of image N with a line '### Image N' and describe them in order.")
+
+MAX_IMAGE_SIDE = 1024            # longest side, in pixels, of an image sent to the model
+JPEG_QUALITY = 85
+IMAGES_PER_REQUEST = 1           # >1 packs several images into one request, for models that accept that
+MAX_CONCURRENCY = 4              # requests in flight at the same time, across all callers
+MAX_RETRIES = 2
+RETRY_BACKOFF = 2                # seconds before the first retry, doubled every round
+CAPTION_VERSION = 1              # bump when the prompts change, so cached captions are not reused
+
+_IMAGE_HEADER_RE = re.compile(r"^#+\s*Image\s+(\d+)\s*:?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+class CaptionError(Exception):
+    pass
+
+
+def prepare_image(data: bytes, max_side: int = MAX_IMAGE_SIDE, quality: int = JPEG_QUALITY):
+    """Downscale so the longest side is at most max_side and re-encode as
+    JPEG; returns the re-opened PIL image, so what is sent to the model is
+    the small JPEG rather than the original encoding."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB") if image.mode not in ("RGB", "L") else image.copy()
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    buffer.seek(0)
+    prepared = Image.open(buffer)
+    prepared.load()
+    return prepared
+
+
+def split_batch_caption(text: str, count: int) -> list[str] | None:
+    """Per-image descriptions of a packed response, or None when the model did
+    not answer with exactly one '### Image N' section per image."""
+    headers = list(_IMAGE_HEADER_RE.finditer(text))
+    if [int(match.group(1)) for match in headers] != list(range(1, count + 1)):
+        return None
+    bounds = [match.end() for match in headers] + [len(text)]
+    starts = [match.start() for match in headers[1:]] + [len(text)]
+    return [text[bounds[index]:starts[index]].strip() for index in range(count)]
+
+
+class CamelCaptioner:
+    """Caption images with a camel vision model. Every request gets a fresh
+    ChatAgent, so no image or answer stays in the context of the next one.
+    Any camel model works, including the offline ModelType.STUB model."""
+
+    def __init__(self, model_factory: Callable[[], object]):
+        self.model_factory = model_factory
+
+    def _ask(self, prompt: str, images: list) -> str:
+        from camel.agents import ChatAgent
+        from camel.messages import BaseMessage
+
+        agent = ChatAgent(system_message=CAPTION_SYSTEM_PROMPT, model=self.model_factory(), output_language="English")
+        message = BaseMessage.make_user_message(role_name="User", content=prompt, image_list=images)
+        with metrics.model_call("vl_model", "caption"):
+            response = agent.step(message)
+        metrics.record_usage("vl_model", response.info.get("usage"))
+        return response.msgs[0].content
+
+    def caption(self, images: list) -> list[str]:
+        if len(images) == 1:
+            return [self._ask(CAPTION_USER_PROMPT, images)]
+        captions = split_batch_caption(self._ask(CAPTION_BATCH_PROMPT.format(count=len(images)), images), len(images))
+        if captions is None:
+            logger.warning(f"Could not split a packed caption of {len(images)} images, asking for each on its own")
+            captions = [self._ask(CAPTION_USER_PROMPT, [image]) for image in images]
+        return captions
+
+
+class StubCaptioner:
+    """Offline backend: describes each image by its size. fail_attempts makes
+    that many calls raise first; calls records the batch size of each call."""
+
+    def __init__(self, fail_attempts: int = 0, delay: float = 0.0):
+        self.fail_attempts = fail_attempts
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def caption(self, images: list) -> list[str]:
+        with self._lock:
+            self.calls.append(len(images))
+            if self.fail_attempts > 0:
+                self.fail_attempts -= 1
+                raise CaptionError("stub failure")
+        time.sleep(self.delay)
+        return [f"A {image.width}x{image.height} image." for image in images]
+
+
+class ImageCaptioner:
+    """Caption many images at once.
+
+    Images are downscaled and re-encoded before they are sent, grouped
+    `images_per_request` to a request, and at most `max_concurrency` requests
+    are in flight across every thread sharing this captioner. Captions are
+    cached by the SHA-256 of the original image bytes, so an image seen
+    before is never sent again."""
+
+    def __init__(self, backend, cache: ExtractionCache | None = None, max_side: int = MAX_IMAGE_SIDE,
+                 quality: int = JPEG_QUALITY, images_per_request: int = IMAGES_PER_REQUEST,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES):
+        self.backend = backend
+        self.cache = cache
+        self.max_side = max_side
+        self.quality = quality
+        self.images_per_request = max(1, images_per_request)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _cache_key(self, digest: str) -> str:
+        return ExtractionCache.key(digest, f"image-caption-{self.max_side}", CAPTION_VERSION)
+
+    def _request(self, load: Callable[[int], bytes], group: list[int]) -> list[str]:
+        images = [prepare_image(load(index), self.max_side, self.quality) for index in group]
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                with self._slots:
+                    captions = self.backend.caption(images)
+                if len(captions) != len(images):
+                    raise CaptionError(f"expected {len(images)} captions, got {len(captions)}")
+                return captions
+            except Exception as e:
+                logger.warning(f"Captioning {len(images)} images failed (attempt {attempt + 1}): {e}")
+                error = e
+        raise CaptionError(f"Captioning failed after {self.max_retries} retries: {error}")
+
+    def _caption(self, digests: list[str], load: Callable[[int], bytes]) -> list[str]:
+        """Captions in input order; load(i) returns the bytes of image i and is
+        only called for images that are not cached. Duplicates are captioned once."""
+        captions = {}
+        if self.cache is not None:
+            for digest in set(digests):
+                cached = self.cache.get(self._cache_key(digest))
+                if cached is not None:
+                    captions[digest] = cached
+
+        first_index = {}
+        for index, digest in enumerate(digests):
+            if digest not in captions:
+                first_index.setdefault(digest, index)
+        pending = list(first_index.values())
+        groups = [pending[start:start + self.images_per_request] for start in range(0, len(pending), self.images_per_request)]
+        logger.info(f"Captioning {len(pending)} of {len(digests)} images in {len(groups)} requests ({len(captions)} cached)")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(groups)))) as pool:
+            futures = [(group, pool.submit(self._request, load, group)) for group in groups]
+            for group, future in futures:
+                for index, caption in zip(group, future.result()):
+                    captions[digests[index]] = caption
+                    if self.cache is not None:
+                        self.cache.put(self._cache_key(digests[index]), caption)
+        return [captions[digest] for digest in digests]
+
+    def caption_bytes(self, images: list[bytes]) -> list[str]:
+        return self._caption([hashlib.sha256(data).hexdigest() for data in images], images.__getitem__)
+
+    def caption_paths(self, paths: list[str]) -> list[str]:
+        """Like caption_bytes for files on disk; each file is only read while
+        its request is being prepared."""
+        def load(index: int) -> bytes:
+            with open(paths[index], "rb") as f:
+                return f.read()
+
+        return self._caption([ExtractionCache.hash_path(path) for path in paths], load)
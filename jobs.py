@@ -0,0 +1,310 @@
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+
+from file_manager import FileManager, FileType
+from metrics import metrics, profile
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = "jobs.sqlite3"
+JOB_INPUT_DIR = os.path.join("jobs", "inputs")  # uploads are copied here so queued jobs survive a restart
+JOB_WORKERS = 4
+PROGRESS_INTERVAL = 1.0         # seconds between progress writes to the job store
+# Jobs of one type that may run at the same time; video is CPU heavy, links are mostly waiting on the network
+TYPE_LIMITS = {
+    FileType.VIDEO: 1,
+    FileType.AUDIO: 2,
+    FileType.PDF: 2,
+    FileType.IMAGE: 4,
+    FileType.WEBLINK: 4,
+}
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str             # "file" (source is a path) or "url" (source is the URL)
+    source: str
+    file_type: FileType
+    status: JobStatus
+    progress: float
+    message: str
+    outputs: list[str]
+    error: str | None
+    created_at: float
+    updated_at: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+
+@dataclass
+class BatchProgress:
+    """Jobs queued together, e.g. one batch upload; throughput counts the
+    finished jobs over the time since the first one was queued"""
+    jobs: list[Job]
+
+    @property
+    def done(self) -> list[Job]:
+        return [job for job in self.jobs if job.status == JobStatus.DONE]
+
+    @property
+    def failed(self) -> list[Job]:
+        return [job for job in self.jobs if job.status == JobStatus.FAILED]
+
+    @property
+    def finished(self) -> bool:
+        return all(job.finished for job in self.jobs)
+
+    @property
+    def seconds(self) -> float:
+        if not self.jobs:
+            return 0.0
+        end = max(job.updated_at for job in self.jobs) if self.finished else time.time()
+        return end - min(job.created_at for job in self.jobs)
+
+    @property
+    def files_per_minute(self) -> float:
+        finished = len(self.done) + len(self.failed)
+        return 60 * finished / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        pending = len(self.jobs) - len(self.done) - len(self.failed)
+        return (f"{len(self.done)}/{len(self.jobs)} files done, {len(self.failed)} failed, {pending} queued or running "
+                f"after {self.seconds:.1f}s ({self.files_per_minute:.2f} files/min)")
+
+
+class JobStore:
+    """Jobs persisted in a local SQLite file; one short-lived connection per call"""
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    file_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL,
+                    message TEXT NOT NULL,
+                    outputs TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _from_row(row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            source=row["source"],
+            file_type=FileType(row["file_type"]),
+            status=JobStatus(row["status"]),
+            progress=row["progress"],
+            message=row["message"],
+            outputs=json.loads(row["outputs"]),
+            error=row["error"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+    def add(self, kind: str, source: str, file_type: FileType, job_id: str | None = None) -> Job:
+        now = time.time()
+        job = Job(job_id or uuid.uuid4().hex, kind, source, file_type, JobStatus.QUEUED, 0.0, "queued", [], None, now, now)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.source, job.file_type.value, job.status.value, job.progress,
+                 job.message, json.dumps(job.outputs), job.error, job.created_at, job.updated_at),
+            )
+        return job
+
+    def update(self, job_id: str, status: JobStatus | None = None, progress: float | None = None,
+               message: str | None = None, outputs: list[str] | None = None, error: str | None = None):
+        fields = {"updated_at": time.time()}
+        if status is not None:
+            fields["status"] = status.value
+        if progress is not None:
+            fields["progress"] = progress
+        if message is not None:
+            fields["message"] = message
+        if outputs is not None:
+            fields["outputs"] = json.dumps(outputs)
+        if error is not None:
+            fields["error"] = error
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Job | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def get_many(self, job_ids: list[str]) -> list[Job]:
+        """Jobs with these ids, in the same order; unknown ids are left out"""
+        jobs = {}
+        with self._connect() as conn:
+            # in slices, since older SQLite builds allow at most 999 parameters per statement
+            for start in range(0, len(job_ids), 500):
+                ids = job_ids[start:start + 500]
+                for row in conn.execute(f"SELECT * FROM jobs WHERE id IN ({', '.join('?' * len(ids))})", ids):
+                    jobs[row["id"]] = self._from_row(row)
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    def recent(self, limit: int = 20) -> list[Job]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def unfinished(self) -> list[Job]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value),
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+
+class JobQueue:
+    """Bounded worker pool in front of FileManager.upload_file.
+
+    At most `workers` jobs run at once and at most TYPE_LIMITS[type] of each
+    FileType; queued jobs whose type is at its limit wait without holding a
+    worker. Jobs left queued or running by a previous process are picked up
+    again by start()."""
+
+    def __init__(self, file_manager: FileManager, store: JobStore, workers: int = JOB_WORKERS,
+                 type_limits: dict[FileType, int] | None = None, input_dir: str = JOB_INPUT_DIR):
+        self.file_manager = file_manager
+        self.store = store
+        self.workers = workers
+        self.type_limits = type_limits if type_limits is not None else TYPE_LIMITS
+        self.input_dir = input_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._running = {file_type: 0 for file_type in FileType}
+
+    def start(self):
+        for job in self.store.unfinished():
+            logger.info(f"Resuming job {job.id} ({job.source})")
+            self.store.update(job.id, status=JobStatus.QUEUED, progress=0.0, message="requeued after restart")
+            self._enqueue(job)
+
+    def submit_file(self, path: str) -> str:
+        """Keep the file somewhere durable and queue it; returns the job id.
+        The file is hardlinked when possible, so nothing is copied."""
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.input_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        stored_path = os.path.join(job_dir, os.path.basename(path))
+        try:
+            os.link(path, stored_path)
+        except OSError:
+            shutil.copyfile(path, stored_path)
+        with open(stored_path, "rb") as f:
+            file_type = FileType.from_file(f)
+        job = self.store.add("file", stored_path, file_type, job_id=job_id)
+        self._enqueue(job)
+        return job.id
+
+    def submit_url(self, url: str) -> str:
+        job = self.store.add("url", url, FileType.WEBLINK)
+        self._enqueue(job)
+        return job.id
+
+    def status(self, job_id: str) -> Job | None:
+        return self.store.get(job_id)
+
+    def batch_status(self, job_ids: list[str]) -> BatchProgress:
+        return BatchProgress(self.store.get_many(job_ids))
+
+    def _enqueue(self, job: Job):
+        with self._lock:
+            self._pending.append(job)
+        self._schedule()
+
+    def _schedule(self):
+        with self._lock:
+            index = 0
+            while sum(self._running.values()) < self.workers and index < len(self._pending):
+                job = self._pending[index]
+                if self._running[job.file_type] < self.type_limits.get(job.file_type, self.workers):
+                    del self._pending[index]
+                    self._running[job.file_type] += 1
+                    self._executor.submit(self._run, job)
+                else:
+                    index += 1
+
+    def _progress_reporter(self, job: Job):
+        """progress(fraction, message) callback for the file manager that
+        writes to the store at most every PROGRESS_INTERVAL seconds"""
+        last_write = 0.0
+        lock = threading.Lock()
+
+        def progress(fraction: float, message: str):
+            nonlocal last_write
+            with lock:
+                now = time.monotonic()
+                if now - last_write < PROGRESS_INTERVAL and fraction < 1.0:
+                    return
+                last_write = now
+            self.store.update(job.id, progress=min(max(fraction, 0.0), 0.99), message=message)
+
+        return progress
+
+    def _run(self, job: Job):
+        try:
+            self.store.update(job.id, status=JobStatus.RUNNING, progress=0.0, message=f"processing {job.file_type.value}")
+            progress = self._progress_reporter(job)
+            # AI_ANKI_PROFILE=cprofile|pyinstrument profiles the job's own thread, see metrics.profile
+            with profile(f"job-{job.id}"), metrics.span("job", type=job.file_type.value):
+                if job.kind == "url":
+                    source = io.BytesIO(job.source.encode("utf-8"))
+                    source.name = job.source
+                    outputs = self.file_manager.upload_file(source, progress=progress)
+                else:
+                    outputs = self.file_manager.upload_path(job.source, progress=progress)
+            if not outputs:
+                raise Exception(f"no text extracted from {job.source}")
+            self.store.update(job.id, status=JobStatus.DONE, progress=1.0, message="done", outputs=outputs)
+            logger.info(f"Job {job.id} done: {outputs}")
+            if job.kind == "file":
+                shutil.rmtree(os.path.dirname(job.source), ignore_errors=True)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            self.store.update(job.id, status=JobStatus.FAILED, progress=1.0, message="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._running[job.file_type] -= 1
+            self._schedule()
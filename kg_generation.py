@@ -1,21 +1,37 @@
+import hashlib
+import json
 import logging
 import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from collections import Counter
+from typing import Callable
 
-from camel.storages import Neo4jGraph
-from camel.loaders import UnstructuredIO
-from camel.agents import ChatAgent, KnowledgeGraphAgent
-from camel.configs import QwenConfig
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType, ModelType
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-uio = UnstructuredIO()
+from extraction_cache import ExtractionCache
+from graph_writer import GRAPH_BATCH_SIZE, GraphWriter, Neo4jGraphBackend, normalize_name, normalize_relation, normalize_type
+from metrics import metrics
+from processors import processors
+from text_aggregation import source_names
+from text_chunking import CHUNK_TOKENS, OVERLAP_TOKENS, chunk_text, count_tokens
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+REFINE_WORKERS = 4               # documents being summarized at the same time
+EXTRACT_WORKERS = 4              # documents having nodes and relationships extracted at the same time
+MAX_RETRIES = 3                  # extra attempts for a failed model call
+RETRY_BACKOFF = 2                # seconds before the first retry, doubled every round
+WRITE_QUEUE_SIZE = 32            # extracted documents waiting for the writer before extraction blocks
+# Documents longer than this are not summarized but split into chunks, extracted chunk by chunk and merged
+CHUNK_THRESHOLD_TOKENS = CHUNK_TOKENS
+KG_MANIFEST_NAME = ".kg_manifest.json"
+
 REFINE_SYSTEM_PROMPT = """"
     Objective:
         Generate a comprehensive and detailed summary of the provided input text.
@@ -81,73 +97,421 @@ REFINE_SYSTEM_PROMPT = """"
         - If the text includes data or statistics, include the most relevant figures to support the key points.
     """
 
+
+def _with_retries(call: Callable, what: str, max_retries: int = MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        if attempt:
+            delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.warning(f"Retrying {what} in {delay}s")
+            time.sleep(delay)
+        try:
+            return call()
+        except Exception as e:
+            logger.warning(f"{what} failed (attempt {attempt + 1}): {e}")
+            error = e
+    raise error
+
+
+def content_id(text: str) -> str:
+    """Element id derived from the text itself, so re-running over the same
+    content produces the same ids and different content never shares one"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def merge_graph_elements(elements: list, text: str, element_id: str):
+    """Reduce the graph elements extracted from the chunks of one document
+    into a single one. Nodes whose names normalize the same are merged and
+    take the most common spelling and type; relationships are deduplicated
+    on their merged endpoints and normalized type."""
+    from camel.loaders import UnstructuredIO
+    from camel.storages.graph_storages.graph_element import GraphElement, Node, Relationship
+
+    spellings = {}
+    types = {}
+    for element in elements:
+        for node in element.nodes:
+            key = normalize_name(node.id)
+            spellings.setdefault(key, Counter())[str(node.id).strip()] += 1
+            types.setdefault(key, Counter())[normalize_type(node.type)] += 1
+    nodes = {key: Node(id=spellings[key].most_common(1)[0][0], type=types[key].most_common(1)[0][0]) for key in spellings}
+
+    relationships = {}
+    for element in elements:
+        for relationship in element.relationships:
+            (subj, obj) = (normalize_name(relationship.subj.id), normalize_name(relationship.obj.id))
+            if subj not in nodes or obj not in nodes or subj == obj:
+                continue
+            relation = normalize_relation(relationship.type)
+            relationships.setdefault((subj, obj, relation), Relationship(subj=nodes[subj], obj=nodes[obj], type=relation))
+
+    source = UnstructuredIO().create_element_from_text(text=text, element_id=element_id)
+    return GraphElement(nodes=list(nodes.values()), relationships=list(relationships.values()), source=source)
+
+
+class CamelKGBackend:
+    """Refine and extract with camel agents. Every call builds fresh agents
+    around the shared model, so no document's text or answers end up in the
+    prompt for another document."""
+
+    def __init__(self, model_factory: Callable[[], object] = lambda: processors.get("kg_model")):
+        self.model_factory = model_factory
+
+    def refine(self, text: str) -> str:
+        from camel.agents import ChatAgent
+        agent = ChatAgent(system_message=REFINE_SYSTEM_PROMPT, model=self.model_factory())
+        with metrics.model_call("kg_model", "refine"):
+            response = agent.step(text)
+        metrics.record_usage("kg_model", response.info.get("usage"))
+        return response.msgs[0].content
+
+    def extract(self, text: str, element_id: str):
+        from camel.agents import KnowledgeGraphAgent
+        from camel.loaders import UnstructuredIO
+        element = UnstructuredIO().create_element_from_text(text=text, element_id=element_id)
+        with metrics.model_call("kg_model", "extract"):
+            return KnowledgeGraphAgent(model=self.model_factory()).run(element, parse_graph_elements=True)
+
+
+class FakeKGBackend:
+    """Offline backend for tests and benchmarks: refine returns the text
+    unchanged, extract makes a node per distinct capitalized word and links
+    each to the next one. delay simulates model latency per call;
+    fail_attempts maps an element id to how many extract calls for it raise."""
+
+    def __init__(self, delay: float = 0.0, fail_attempts: dict[str, int] | None = None):
+        self.delay = delay
+        self.fail_attempts = dict(fail_attempts or {})
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def refine(self, text: str) -> str:
+        time.sleep(self.delay)
+        return text
+
+    def extract(self, text: str, element_id: str):
+        from camel.loaders import UnstructuredIO
+        from camel.storages.graph_storages.graph_element import GraphElement, Node, Relationship
+
+        with self._lock:
+            self.calls.append(element_id)
+            if self.fail_attempts.get(element_id, 0) > 0:
+                self.fail_attempts[element_id] -= 1
+                raise RuntimeError(f"fake failure for {element_id}")
+        time.sleep(self.delay)
+        names = list(dict.fromkeys(re.findall(r"\b[A-Z][a-z]+\b", text)))
+        nodes = [Node(id=name, type="Concept") for name in names]
+        relationships = [Relationship(subj=subj, obj=obj, type="RELATED_TO") for subj, obj in zip(nodes, nodes[1:])]
+        source = UnstructuredIO().create_element_from_text(text=text, element_id=element_id)
+        return GraphElement(nodes=nodes, relationships=relationships, source=source)
+
+
+@dataclass
+class SourceState:
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+class KGManifest:
+    """Source files whose graph has been written, with the size, mtime and
+    hash they had at the time. Files whose size and mtime still match are
+    not even hashed again."""
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.sources = {source: SourceState(**state) for source, state in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            self.sources = {}
+
+    def save(self):
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({source: vars(state) for source, state in self.sources.items()}, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def plan(self, paths: list[str], everything: bool = False) -> tuple[dict[str, SourceState], list[str]]:
+        """(state of every source to process, sources whose graph in the store
+        is stale: deleted ones, and changed ones whose new graph replaces it).
+        With everything, all paths are processed and all recorded sources
+        count as stale."""
+        todo = {}
+        for path in paths:
+            stat = os.stat(path)
+            recorded = self.sources.get(path)
+            if not everything and recorded is not None and (stat.st_size, stat.st_mtime_ns) == (recorded.size, recorded.mtime_ns):
+                continue
+            digest = ExtractionCache.hash_path(path)
+            if not everything and recorded is not None and digest == recorded.sha256:
+                recorded.mtime_ns = stat.st_mtime_ns
+                continue
+            todo[path] = SourceState(stat.st_size, stat.st_mtime_ns, digest)
+        present = set(paths)
+        stale = [source for source in self.sources if everything or source in todo or source not in present]
+        return todo, stale
+
+
+@dataclass
+class KGDocumentResult:
+    name: str
+    nodes: int = 0
+    relationships: int = 0
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class KGResult:
+    documents: list[KGDocumentResult] = field(default_factory=list)
+    seconds: float = 0.0
+    unchanged: int = 0           # sources skipped because their graph is up to date
+    removed: int = 0             # sources whose previous graph was taken out
+
+    @property
+    def failed(self) -> list[KGDocumentResult]:
+        return [document for document in self.documents if not document.ok]
+
+    @property
+    def documents_per_minute(self) -> float:
+        return 60 * len(self.documents) / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"{len(self.documents) - len(self.failed)}/{len(self.documents)} documents added to the graph "
+                f"in {self.seconds:.1f}s ({self.documents_per_minute:.1f} documents/min), "
+                f"{self.unchanged} unchanged, {self.removed} stale removed")
+
+
 class KGGenerator:
-    def __init__(self):
-        self.n4j = Neo4jGraph(
-        url=os.getenv("NEO4J_URI"),
-        username=os.getenv("NEO4J_USERNAME"),
-        password=os.getenv("NEO4J_PASSWORD"),
-    )   
-        self.refine_agent = ChatAgent(
-            system_message=REFINE_SYSTEM_PROMPT,
-            model = ModelFactory.create(
-            model_platform=ModelPlatformType.QWEN,
-            model_type=ModelType.QWEN_TURBO,
-            model_config_dict=QwenConfig(temperature=0.2).as_dict(),
-        )
-    )
-        self.kg_agent = KnowledgeGraphAgent(
-            model = ModelFactory.create(
-            model_platform=ModelPlatformType.QWEN,
-            model_type=ModelType.QWEN_TURBO,
-            model_config_dict=QwenConfig(temperature=0.2).as_dict(),
-        )
-    )
+    """Build the knowledge graph from the text outputs in a directory.
+
+    Documents flow through three stages: refinement and extraction each run
+    on their own bounded pool, so one document can be extracted while the
+    next is being refined, and a single writer thread buffers the extracted
+    graph elements in a GraphWriter that flushes them in large batches. Failed model calls are retried with
+    backoff; a document that still fails is reported and skipped.
+
+    Documents longer than chunk_threshold tokens skip refinement: they are
+    split into overlapping chunks, every chunk is extracted on the extraction
+    pool, and the chunk graphs are merged before anything is written.
+
+    Runs are incremental: a manifest in the directory records which sources
+    are in the graph and at which content hash, so only new and changed files
+    are processed. The graph of a deleted file is removed first; that of a
+    changed file is replaced in the same flush that writes its new graph, so
+    a file whose extraction fails keeps its old one. Aggregates such as
+    concatenated.txt are never read."""
+
+    def __init__(self, backend=None, writer: GraphWriter | None = None, refine_workers: int = REFINE_WORKERS,
+                 extract_workers: int = EXTRACT_WORKERS, max_retries: int = MAX_RETRIES,
+                 write_batch: int = GRAPH_BATCH_SIZE, chunk_threshold: int = CHUNK_THRESHOLD_TOKENS,
+                 chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS):
+        self.backend = backend if backend is not None else CamelKGBackend()
+        self._writer = writer
+        self.refine_workers = refine_workers
+        self.extract_workers = extract_workers
+        self.max_retries = max_retries
+        self.write_batch = write_batch
+        self.chunk_threshold = chunk_threshold
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @property
+    def writer(self) -> GraphWriter:
+        if self._writer is None:
+            self._writer = GraphWriter(Neo4jGraphBackend.from_env(), batch_size=self.write_batch)
+        return self._writer
 
     @staticmethod
-    def _load_txt_files(save_dir: str):
+    def _txt_paths(save_dir: str) -> list[str]:
         try:
-            # List all files in the directory
-            all_files = os.listdir(save_dir)
-            # Filter out only .txt files
-            txt_files = [file for file in all_files if file.endswith('.txt')]
-
-            if not txt_files:
-                logger.error(f"No files found in {save_dir}")
-                return {}
-            
-            txt_contents = {}
-            for filename in txt_files:
-                file_path = os.path.join(save_dir, filename)
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    txt_contents[filename] = file.read()
-        
-            return txt_contents
+            txt_files = source_names(save_dir)
         except FileNotFoundError:
             logger.error(f"The directory {save_dir} does not exist.")
+            return []
+        if not txt_files:
+            logger.error(f"No files found in {save_dir}")
+        return [os.path.join(save_dir, file) for file in txt_files]
+
+    def _refine(self, path: str, content: str) -> str:
+        return _with_retries(lambda: self.backend.refine(content), f"Refining {path}", self.max_retries)
+
+    def _extract(self, what: str, text: str, element_id: str):
+        logger.info(f"Extracting nodes and relationships from {what}")
+        return _with_retries(lambda: self.backend.extract(text, element_id), f"Extracting {what}", self.max_retries)
+
+    def _flush(self, documents: dict[str, KGDocumentResult], manifest: KGManifest, planned: dict[str, SourceState],
+               replace: set[str]):
+        """Write the buffered documents, first taking out the previous graph
+        of those in `replace`, and record them in the manifest"""
+        sources = sorted(self.writer.pending_sources)
+        if not sources:
+            return
+        replaced = [source for source in sources if source in replace]
+        removed = False
+        try:
+            with metrics.span("kg.graph_write", documents=len(sources)):
+                if replaced:
+                    _with_retries(lambda: self.writer.backend.remove_sources(replaced),
+                                  f"Removing the previous graph of {len(replaced)} sources", self.max_retries)
+                    replace.difference_update(replaced)
+                    removed = True
+                _with_retries(self.writer.flush, f"Writing {len(sources)} documents to the graph", self.max_retries)
+            logger.info(f"Added {', '.join(sources)} to the graph")
+        except Exception as e:
+            logger.error(f"An error occurred while adding {len(sources)} documents to the graph: {e}")
+            for name in sources:
+                documents[name].error = f"graph write failed: {e}"
+            self.writer.clear()
+            if removed:
+                # their old graph is gone and the new one is not there, so they are not in the graph at all
+                for source in replaced:
+                    manifest.sources.pop(source, None)
+                self._save_manifest(manifest)
+            return
+        for source in sources:
+            manifest.sources[source] = planned[source]
+        self._save_manifest(manifest)
+
+    @staticmethod
+    def _save_manifest(manifest: KGManifest):
+        # the graph is written either way; a source missing from the manifest is only processed again next run
+        try:
+            manifest.save()
+        except OSError as e:
+            logger.error(f"Could not save {manifest.path}: {e}")
+
+    def _write_loop(self, writes: queue.Queue, documents: dict[str, KGDocumentResult],
+                    manifest: KGManifest, planned: dict[str, SourceState], replace: set[str]):
+        """Runs on its own thread until it gets None. It never stops early,
+        since extractors block on a full queue: an error is recorded on the
+        document it happened for and the queue keeps being drained."""
+        while (item := writes.get()) is not None:
+            (path, graph_elements) = item
+            try:
+                self.writer.add(graph_elements, source=path)
+                if self.writer.full:
+                    self._flush(documents, manifest, planned, replace)
+            except Exception as e:
+                logger.error(f"Could not write the graph of {path}: {e}")
+                documents[path].error = f"graph write failed: {e}"
+        try:
+            self._flush(documents, manifest, planned, replace)
         except Exception as e:
-            logger.error(f"An error occurred: {e}")
-
-    def generate_kg(self, save_dir: str):
-        txt_contents = self._load_txt_files(save_dir)
-        for filename, content in txt_contents.items():
-            # Create an element from the provided text
-            refined_response= self.refine_agent.step(content)
-            refined_content = refined_response.msgs[0].content
-            element_example = uio.create_element_from_text(text=refined_content, element_id="001")
-
-            # Extract nodes and relationships using the Knowledge Graph Agent
-            logger.info(f"Extracting nodes and relationships from {filename}")
-            graph_elements = self.kg_agent.run(element_example, parse_graph_elements=True)
-            logger.info(f"Extracted {graph_elements} and relationships from {filename}")
-
-            # Add the extracted graph elements to the Neo4j database
+            logger.error(f"Could not write the last graph batch: {e}")
+            for name in self.writer.pending_sources:
+                documents[name].error = f"graph write failed: {e}"
+
+    def generate_kg(self, save_dir: str, incremental: bool = True) -> KGResult:
+        start = time.perf_counter()
+        if not os.path.isdir(save_dir):
+            logger.error(f"The directory {save_dir} does not exist.")
+            return KGResult()
+        self.writer  # connect before any model call is made
+        manifest = KGManifest(os.path.join(save_dir, KG_MANIFEST_NAME))
+        sources = self._txt_paths(save_dir)
+        planned, stale = manifest.plan(sources, everything=not incremental)
+        replace = {source for source in stale if source in planned}
+        gone = [source for source in stale if source not in planned]
+        if gone:
+            logger.info(f"Removing the graph of {len(gone)} sources that no longer exist")
+            self.writer.backend.remove_sources(gone)
+            for source in gone:
+                manifest.sources.pop(source, None)
+        manifest.save()
+        paths = list(planned)
+        logger.info(f"{len(paths)} of {len(sources)} sources in {save_dir} are new or changed")
+
+        documents = {path: KGDocumentResult(name=path) for path in paths}
+        started = {}
+        writes = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = threading.Thread(target=self._write_loop, args=(writes, documents, manifest, planned, replace), name="kg-writer")
+        writer.start()
+
+        def finish(path: str, graph_elements=None, error: Exception | None = None):
+            if error is None:
+                documents[path].nodes = len(graph_elements.nodes)
+                documents[path].relationships = len(graph_elements.relationships)
+                logger.info(f"Extracted {documents[path].nodes} nodes and {documents[path].relationships} relationships from {path}")
+                writes.put((path, graph_elements))
+            else:
+                logger.error(f"Failed to extract a graph from {path}: {error}")
+                documents[path].error = str(error)
+            documents[path].seconds = time.perf_counter() - started[path]
+
+        def extract(path: str, refined_content: str, element_id: str):
             try:
-                self.n4j.add_graph_elements(graph_elements=[graph_elements])
-                logger.info(f"Added {filename.replace('.txt', '')} to the Neo4j database")
+                graph_elements = self._extract(path, refined_content, element_id)
             except Exception as e:
-                logger.error(f"An error occurred while adding {filename.replace('.txt', '')} to the Neo4j database: {e}")
+                finish(path, error=e)
+                return
+            finish(path, graph_elements)
+
+        def extract_chunks(path: str, content: str):
+            chunks = chunk_text(content, self.chunk_tokens, self.overlap_tokens)
+            logger.info(f"Split {path} into {len(chunks)} chunks")
+            results = [None] * len(chunks)
+            lock = threading.Lock()
+            state = {"remaining": len(chunks), "error": None}
+
+            def extract_chunk(chunk):
+                try:
+                    results[chunk.index] = self._extract(f"{path} chunk {chunk.index}", chunk.text, content_id(chunk.text))
+                except Exception as e:
+                    with lock:
+                        state["error"] = state["error"] or e
+                with lock:
+                    state["remaining"] -= 1
+                    if state["remaining"]:
+                        return
+                # the last chunk to finish reduces the document
+                if state["error"] is not None:
+                    finish(path, error=state["error"])
+                    return
+                try:
+                    merged = merge_graph_elements(results, content, content_id(content))
+                except Exception as e:
+                    finish(path, error=e)
+                    return
+                finish(path, merged)
+
+            for chunk in chunks:
+                extractors.submit(extract_chunk, chunk)
+
+        def refine(path: str):
+            started[path] = time.perf_counter()
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    content = file.read()
+                if count_tokens(content) > self.chunk_threshold:
+                    extract_chunks(path, content)
+                    return
+                refined_content = self._refine(path, content)
+            except Exception as e:
+                logger.error(f"Failed to refine {path}: {e}")
+                documents[path].error = str(e)
+                documents[path].seconds = time.perf_counter() - started[path]
+                return
+            extractors.submit(extract, path, refined_content, content_id(content))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.extract_workers, thread_name_prefix="kg-extract") as extractors:
+                with ThreadPoolExecutor(max_workers=self.refine_workers, thread_name_prefix="kg-refine") as refiners:
+                    for path in paths:
+                        refiners.submit(refine, path)
+        finally:
+            writes.put(None)
+            writer.join()
+
+        result = KGResult(documents=list(documents.values()), seconds=time.perf_counter() - start,
+                          unchanged=len(sources) - len(paths), removed=len(stale) - len(replace))
+        logger.info(result.summary())
+        return result
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     kg_generator = KGGenerator()
-    kg_generator.generate_kg("uploads")
\ No newline at end of file
+    kg_generator.generate_kg("uploads")
@@ -0,0 +1,321 @@
+"""Per-stage timings, counters and model call latencies for the ingestion pipeline.
+
+Off unless AI_ANKI_METRICS=1 (or metrics.enable() is called); while off,
+span() returns a shared no-op context and count()/observe() return at once.
+When on, metrics.write() (called at exit when AI_ANKI_METRICS_DIR is set)
+saves metrics.prom in Prometheus text format and trace.json in Chrome trace
+event format, which Perfetto and chrome://tracing open.
+
+AI_ANKI_PROFILE=cprofile or pyinstrument additionally profiles each job
+wrapped in profile(); see JobQueue.
+"""
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENV = "AI_ANKI_METRICS"
+METRICS_DIR_ENV = "AI_ANKI_METRICS_DIR"
+PROFILE_ENV = "AI_ANKI_PROFILE"
+PROFILE_DIR = os.path.join(".cache", "profiles")
+PREFIX = "ai_anki"
+MAX_TRACE_EVENTS = 200000        # spans kept for trace.json; later ones are only aggregated
+# Upper bounds in seconds, from one SSIM comparison up to a long model call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+_NOOP = nullcontext()
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"'.replace("\n", " ") for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Process-wide registry of counters, latency histograms and trace spans"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # trace timestamps are wall-clock microseconds, so spans from worker processes line up
+        self._origin = time.time() - time.perf_counter()
+        self.reset()
+
+    def enable(self):
+        # worker processes started from now on enable themselves from the environment
+        os.environ[METRICS_ENV] = "1"
+        self.enabled = True
+
+    def disable(self):
+        os.environ.pop(METRICS_ENV, None)
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}       # (name, labels) -> value
+            self.histograms = {}     # (name, labels) -> _Histogram
+            self.events = []
+            self.dropped_events = 0
+
+    def count(self, name: str, value: float = 1, **labels):
+        """Add value to the counter name, e.g. bytes or tokens processed"""
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record a duration in the latency histogram name"""
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def span(self, stage: str, timings: dict | None = None, **attrs):
+        """Context manager timing one stage: its duration goes to the
+        stage_seconds histogram and, with attrs, to the trace. timings, when
+        given, receives timings[stage] = seconds even while metrics are off."""
+        if not self.enabled and timings is None:
+            return _NOOP
+        return self._span(stage, timings, attrs)
+
+    @contextmanager
+    def _span(self, stage: str, timings: dict | None, attrs: dict):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(stage)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if timings is not None:
+                timings[stage] = seconds
+            if self.enabled:
+                self.observe("stage_seconds", seconds, stage=stage)
+                if error is not None:
+                    self.count("stage_errors", stage=stage, error=error)
+                self._trace(stage, start, seconds, {**attrs, "parent": stack[-1]} if stack else attrs, error)
+
+    def _trace(self, stage: str, start: float, seconds: float, attrs: dict, error: str | None):
+        event = {"name": stage, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts": round((self._origin + start) * 1e6, 1), "dur": round(seconds * 1e6, 1)}
+        if attrs or error:
+            event["args"] = {name: str(value) for name, value in attrs.items()}
+            if error:
+                event["args"]["error"] = error
+        with self._lock:
+            if len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append(event)
+            else:
+                self.dropped_events += 1
+
+    @contextmanager
+    def model_call(self, model: str, operation: str = "call"):
+        """Time one request to a model or remote API; its latency goes to
+        the model_call_seconds histogram, failures to model_call_errors"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            with self.span(f"{model}.{operation}"):
+                yield
+        except Exception as e:
+            self.count("model_call_errors", model=model, operation=operation, error=type(e).__name__)
+            raise
+        finally:
+            self.observe("model_call_seconds", time.perf_counter() - start, model=model, operation=operation)
+
+    def record_usage(self, model: str, usage: dict | None):
+        """Count the prompt and completion tokens of an OpenAI-style usage dict"""
+        if not self.enabled or not usage:
+            return
+        for direction in ("prompt", "completion"):
+            tokens = usage.get(f"{direction}_tokens")
+            if tokens:
+                self.count("model_tokens", tokens, model=model, direction=direction)
+
+    def timed_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """Iterate over iterable, timing each step under stage, e.g. decoding
+        the frames a generator yields"""
+        if not self.enabled:
+            return iter(iterable)
+        return self._timed_iter(stage, iter(iterable))
+
+    def _timed_iter(self, stage: str, iterator: Iterator) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage)
+            yield item
+
+    # State crosses process boundaries as plain data, so worker process results can be merged
+
+    def collect(self) -> dict:
+        """Everything recorded so far as plain data, clearing it"""
+        with self._lock:
+            state = {
+                "counters": [[name, list(map(list, key)), value] for (name, key), value in self.counters.items()],
+                "histograms": [[name, list(map(list, key)), h.counts, h.sum, h.count]
+                               for (name, key), h in self.histograms.items()],
+                "events": self.events,
+            }
+        self.reset()
+        return state
+
+    def merge(self, state: dict | None):
+        if not state:
+            return
+        with self._lock:
+            for (name, key, value) in state["counters"]:
+                key = (name, tuple(map(tuple, key)))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for (name, key, counts, total, count) in state["histograms"]:
+                histogram = self.histograms.setdefault((name, tuple(map(tuple, key))), _Histogram())
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+            room = MAX_TRACE_EVENTS - len(self.events)
+            self.events.extend(state["events"][:room])
+            self.dropped_events += max(len(state["events"]) - room, 0)
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        typed = set()
+        for ((name, key), value) in counters:
+            metric = f"{PREFIX}_{_NAME_RE.sub('_', name)}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_format_labels(key)} {value:g}")
+        for ((name, key), histogram) in histograms:
+            metric = f"{PREFIX}_{_NAME_RE.sub('_', name)}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                bucket = 'le="%s"' % bound
+                lines.append(f"{metric}_bucket{_format_labels(key, bucket)} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def trace(self) -> dict:
+        with self._lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                    "otherData": {"dropped_events": self.dropped_events}}
+
+    def summary(self) -> str:
+        """Stages by total time, one line each"""
+        with self._lock:
+            stages = [(dict(key).get("stage"), h) for (name, key), h in self.histograms.items() if name == "stage_seconds"]
+        stages.sort(key=lambda item: item[1].sum, reverse=True)
+        return "\n".join(f"{stage:<32}{h.count:>8} x {h.sum / h.count * 1000:>9.1f}ms = {h.sum:>8.2f}s"
+                         for stage, h in stages)
+
+    def write(self, directory: str) -> tuple[str, str]:
+        """Save metrics.prom and trace.json in directory; returns their paths"""
+        os.makedirs(directory, exist_ok=True)
+        paths = (os.path.join(directory, "metrics.prom"), os.path.join(directory, "trace.json"))
+        for path, text in zip(paths, (self.prometheus_text(), json.dumps(self.trace()))):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        logger.info(f"Metrics written to {paths[0]} and {paths[1]}")
+        return paths
+
+
+@contextmanager
+def profile(job: str, directory: str = PROFILE_DIR, profiler: str | None = None):
+    """Profile the enclosed block with cProfile (job.prof) or pyinstrument
+    (job.html) in directory, as chosen by profiler or $AI_ANKI_PROFILE; does
+    nothing when neither is set"""
+    profiler = profiler if profiler is not None else os.getenv(PROFILE_ENV, "")
+    if not profiler:
+        yield
+        return
+    os.makedirs(directory, exist_ok=True)
+    name = _NAME_RE.sub("_", job)
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+        instrument = Profiler()
+        instrument.start()
+        try:
+            yield
+        finally:
+            instrument.stop()
+            path = os.path.join(directory, f"{name}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(instrument.output_html())
+            logger.info(f"Profile of {job} written to {path}")
+    elif profiler == "cprofile":
+        import cProfile
+        instrument = cProfile.Profile()
+        instrument.enable()
+        try:
+            yield
+        finally:
+            instrument.disable()
+            path = os.path.join(directory, f"{name}.prof")
+            instrument.dump_stats(path)
+            logger.info(f"Profile of {job} written to {path}")
+    else:
+        raise ValueError(f"unknown profiler {profiler}")
+
+
+metrics = Metrics(enabled=os.getenv(METRICS_ENV, "") not in ("", "0"))
+
+if os.getenv(METRICS_DIR_ENV) and multiprocessing.parent_process() is None:
+    atexit.register(lambda: metrics.enabled and metrics.write(os.environ[METRICS_DIR_ENV]))
@@ -0,0 +1,243 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from metrics import metrics
+from pdf_triage import OCR_TEXT_CHARS_MAX, TEXT_CHARS_MIN, Route, triage_pdf
+from processors import PDF_POOL_WORKERS, processors
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_SHARD = 8              # pages converted by one docling call
+PDF_WORKERS = PDF_POOL_WORKERS  # shards converted at the same time in the shared "pdf_pool"
+PARALLEL_MIN_PAGES = 4 * PAGES_PER_SHARD  # shorter documents are converted in the calling process
+PAGE_SEPARATOR = "\n\n"
+
+
+def count_pages(pdf_path: str) -> int:
+    from PyPDF2 import PdfReader
+    with open(pdf_path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+def plan_shards(page_count: int, pages_per_shard: int = PAGES_PER_SHARD) -> list[tuple[int, int]]:
+    """1-based inclusive (first, last) page ranges covering the document"""
+    return [(first, min(first + pages_per_shard - 1, page_count)) for first in range(1, page_count + 1, pages_per_shard)]
+
+
+ROUTE_CONVERTERS = {
+    Route.LAYOUT: "pdf_layout_converter",
+    Route.OCR: "pdf_ocr_converter",
+}
+
+
+def _docling_pages(pdf_path: str, first: int, last: int, route: Route | None = None) -> list[str]:
+    converter = processors.get(ROUTE_CONVERTERS.get(route, "pdf_converter"))
+    result = converter.convert(pdf_path, page_range=(first, last))
+    return [result.document.export_to_markdown(page_no=page_no) for page_no in range(first, last + 1)]
+
+
+def _pypdf_texts(pdf_path: str, page_numbers: list[int]) -> list[str | None]:
+    """Text layer of each page, reading the file once; None for a page
+    PyPDF2 cannot extract"""
+    if not page_numbers:
+        return []
+    from PyPDF2 import PdfReader
+    texts = []
+    try:
+        with open(pdf_path, "rb") as f:
+            reader = PdfReader(f)
+            for page_no in page_numbers:
+                try:
+                    texts.append(reader.pages[page_no - 1].extract_text() or "")
+                except Exception as e:
+                    logger.warning(f"PyPDF2 failed on page {page_no} of {pdf_path}: {e}")
+                    texts.append(None)
+    except Exception as e:
+        logger.warning(f"PyPDF2 could not read {pdf_path}: {e}")
+    return texts + [None] * (len(page_numbers) - len(texts))
+
+
+def _convert_run(pdf_path: str, first: int, last: int, route: Route | None) -> list[tuple[int, str, str]]:
+    method = route.value if route is not None else "docling"
+    with metrics.span(f"pdf.{method}", pages=last - first + 1):
+        return _convert_pages(pdf_path, first, last, route, method)
+
+
+def _convert_pages(pdf_path: str, first: int, last: int, route: Route | None, method: str) -> list[tuple[int, str, str]]:
+    page_numbers = list(range(first, last + 1))
+    if route == Route.TEXT:
+        texts = _pypdf_texts(pdf_path, page_numbers)
+        pages = {page_no: (page_no, text, method) for page_no, text in zip(page_numbers, texts)
+                 if text is not None and len(text.strip()) >= TEXT_CHARS_MIN}
+        # triage only sampled some pages, so a text-route page may still have an unreadable or
+        # (nearly) empty text layer, e.g. a scanned page; those go to docling like an unsampled page would
+        for page_no, text in zip(page_numbers, texts):
+            if page_no in pages:
+                continue
+            fallback = Route.OCR if text is not None and len(text.strip()) < OCR_TEXT_CHARS_MAX else Route.LAYOUT
+            try:
+                pages[page_no] = (page_no, _docling_pages(pdf_path, page_no, page_no, fallback)[0], fallback.value)
+            except Exception as e:
+                if text:
+                    logger.warning(f"Docling failed on page {page_no} of {pdf_path}, keeping its short text layer: {e}")
+                    pages[page_no] = (page_no, text, "pypdf")
+                else:
+                    logger.error(f"Could not extract page {page_no} of {pdf_path}: {e}")
+                    pages[page_no] = (page_no, "", "failed")
+        return [pages[page_no] for page_no in page_numbers]
+    try:
+        return [(page_no, text, method) for page_no, text in zip(page_numbers, _docling_pages(pdf_path, first, last, route))]
+    except Exception as e:
+        logger.warning(f"Docling failed on pages {first}-{last} of {pdf_path}, retrying page by page: {e}")
+
+    pages = {}
+    for page_no in page_numbers:
+        try:
+            pages[page_no] = (page_no, _docling_pages(pdf_path, page_no, page_no, route)[0], method)
+        except Exception as e:
+            logger.warning(f"Docling failed on page {page_no} of {pdf_path}, using PyPDF2 fallback: {e}")
+    failed = [page_no for page_no in page_numbers if page_no not in pages]
+    for page_no, text in zip(failed, _pypdf_texts(pdf_path, failed)):
+        if text is None:
+            logger.error(f"Could not extract page {page_no} of {pdf_path}")
+            pages[page_no] = (page_no, "", "failed")
+        else:
+            pages[page_no] = (page_no, text, "pypdf")
+    return [pages[page_no] for page_no in page_numbers]
+
+
+def extract_shard(pdf_path: str, first: int, last: int, routes: dict[int, Route] | None = None) -> list[tuple[int, str, str]]:
+    """(page number, markdown, method) for every page in the range. Runs of
+    pages with the same triage route are converted together: text-route pages
+    straight from the text layer, the others with docling. A text-route page
+    whose text layer cannot be read or is shorter than TEXT_CHARS_MIN goes to
+    docling instead, with OCR when it has next to no text; a failed docling
+    run is retried page by page, and only a page docling cannot convert falls
+    back to PyPDF2's text layer."""
+    pages = []
+    run_first = first
+    for page_no in range(first, last + 1):
+        route = routes.get(page_no) if routes else None
+        if page_no == last or (routes.get(page_no + 1) if routes else None) != route:
+            pages.extend(_convert_run(pdf_path, run_first, page_no, route))
+            run_first = page_no + 1
+    return pages
+
+
+def _extract_shard_in_worker(pdf_path: str, first: int, last: int, routes: dict[int, Route] | None):
+    """extract_shard in a worker process, with the metrics it recorded"""
+    return extract_shard(pdf_path, first, last, routes), metrics.collect()
+
+
+def _in_worker_process() -> bool:
+    # e.g. a pdf_pool or slide_pool worker; splitting further would multiply the converters loaded
+    return multiprocessing.parent_process() is not None
+
+
+def extract_pdf(pdf_path: str, output_path: str, pages_per_shard: int = PAGES_PER_SHARD, workers: int = PDF_WORKERS,
+                progress: Callable[[int, int], None] | None = None, triage: bool = True) -> dict[str, int]:
+    """Convert a PDF shard by shard and write the markdown to output_path in
+    page order as soon as each leading run of pages is done. The file is
+    complete once it is renamed from output_path.part. Documents of at least
+    PARALLEL_MIN_PAGES pages are spread over the shared "pdf_pool" worker
+    processes, at most `workers` shards at a time, unless this already is a
+    worker process; shorter ones are converted here with this process's
+    converters. With triage each page takes the text, layout or OCR route
+    picked by pdf_triage. Returns how many pages each route or method handled."""
+    routes = None
+    try:
+        if triage:
+            with metrics.span("pdf.triage"):
+                routes = triage_pdf(pdf_path)
+            page_count = len(routes)
+        else:
+            page_count = count_pages(pdf_path)
+    except Exception as e:
+        logger.warning(f"Could not read pages of {pdf_path}, converting it in one piece: {e}")
+        page_count = None
+
+    if page_count == 0:
+        logger.warning(f"{pdf_path} has no pages")
+        with open(output_path, "w", encoding="utf-8"):
+            pass
+        return {}
+
+    partial_path = f"{output_path}.part"
+    methods = {}
+    with open(partial_path, "w", encoding="utf-8") as output:
+        def write_pages(pages):
+            for (page_no, text, method) in pages:
+                if page_no > 1:
+                    output.write(PAGE_SEPARATOR)
+                output.write(text)
+                methods[method] = methods.get(method, 0) + 1
+            output.flush()
+
+        if page_count is None:
+            with metrics.span("pdf.docling"):
+                markdown = processors.get("pdf_converter").convert(pdf_path).document.export_to_markdown()
+            write_pages([(1, markdown, "docling")])
+        else:
+            shards = plan_shards(page_count, pages_per_shard)
+            if len(shards) == 1 or workers <= 1 or page_count < PARALLEL_MIN_PAGES or _in_worker_process():
+                for (first, last) in shards:
+                    write_pages(extract_shard(pdf_path, first, last, routes))
+                    if progress is not None:
+                        progress(last, page_count)
+            else:
+                remaining = iter(shards)
+                futures = {}
+                finished = {}
+                retried = set()
+                next_first = 1
+
+                def submit(first, last):
+                    shard_routes = {page_no: routes[page_no] for page_no in range(first, last + 1)} if routes else None
+                    futures[processors.submit("pdf_pool", _extract_shard_in_worker, pdf_path, first, last, shard_routes)] = (first, last)
+
+                def submit_next():
+                    shard = next(remaining, None)
+                    if shard is not None:
+                        submit(*shard)
+
+                for _ in range(workers):
+                    submit_next()
+                try:
+                    while futures:
+                        (done, _) = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            (first, last) = futures.pop(future)
+                            try:
+                                (finished[first], recorded) = future.result()
+                            except BrokenProcessPool:
+                                # a worker died, maybe converting another document's shard; the pool is
+                                # rebuilt, so each lost shard gets one more try before the document fails
+                                if first in retried:
+                                    raise
+                                logger.warning(f"PDF worker died, retrying pages {first}-{last} of {pdf_path}")
+                                retried.add(first)
+                                submit(first, last)
+                                continue
+                            metrics.merge(recorded)
+                            submit_next()
+                        # write every shard whose predecessors are all on disk
+                        while next_first in finished:
+                            pages = finished.pop(next_first)
+                            write_pages(pages)
+                            next_first = pages[-1][0] + 1
+                            if progress is not None:
+                                progress(next_first - 1, page_count)
+                finally:
+                    # the pool outlives this document, so drop its queued shards on failure
+                    for future in futures:
+                        future.cancel()
+
+    os.replace(partial_path, output_path)
+    for method, pages in methods.items():
+        metrics.count("pdf_pages", pages, method=method)
+    logger.info(f"Extracted {page_count or 'all'} pages of {pdf_path} ({methods})")
+    return methods
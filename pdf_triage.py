@@ -0,0 +1,113 @@
+import logging
+from dataclasses import dataclass
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_PAGES = 8                 # pages inspected before deciding whether the whole document takes one route
+TEXT_CHARS_MIN = 200             # characters a page's text layer needs to be extracted as-is
+IMAGE_COVERAGE_MAX = 0.5         # share of the page images may cover on a text-route page
+OCR_TEXT_CHARS_MAX = 20          # pages with less text than this that are mostly image go to OCR
+OCR_IMAGE_COVERAGE_MIN = 0.3
+
+
+class Route(Enum):
+    TEXT = "text"        # PyPDF2 text layer, no layout analysis
+    LAYOUT = "layout"    # docling layout analysis without OCR
+    OCR = "ocr"          # docling with full-page OCR
+
+
+@dataclass
+class PageStats:
+    page_no: int
+    text_chars: int
+    image_coverage: float
+
+    @property
+    def route(self) -> Route:
+        if self.text_chars < OCR_TEXT_CHARS_MAX and self.image_coverage >= OCR_IMAGE_COVERAGE_MIN:
+            return Route.OCR
+        if self.text_chars >= TEXT_CHARS_MIN and self.image_coverage <= IMAGE_COVERAGE_MAX:
+            return Route.TEXT
+        return Route.LAYOUT
+
+
+def _image_coverage(page) -> float:
+    """Share of the page area covered by image XObjects drawn in its content
+    stream. Only the determinant of the transformation matrix is tracked,
+    since that is all the area of the unit square an image is drawn into needs."""
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    if xobjects is None:
+        return 0.0
+    xobjects = xobjects.get_object()
+    images = {name for name, ref in xobjects.items() if ref.get_object().get("/Subtype") == "/Image"}
+    if not images:
+        return 0.0
+
+    contents = page.get_contents()
+    if contents is None:
+        return 0.0
+
+    scale = 1.0
+    stack = []
+    covered = 0.0
+    for operands, operator in contents.operations:
+        if operator == b"q":
+            stack.append(scale)
+        elif operator == b"Q":
+            scale = stack.pop() if stack else 1.0
+        elif operator == b"cm" and len(operands) == 6:
+            (a, b, c, d) = (float(value) for value in operands[:4])
+            scale *= a * d - b * c
+        elif operator == b"Do" and operands and operands[0] in images:
+            covered += abs(scale)
+
+    box = page.mediabox
+    page_area = abs(float(box.width) * float(box.height))
+    return min(1.0, covered / page_area) if page_area else 0.0
+
+
+def page_stats(page, page_no: int) -> PageStats:
+    try:
+        text_chars = len((page.extract_text() or "").strip())
+    except Exception:
+        text_chars = 0
+    try:
+        coverage = _image_coverage(page)
+    except Exception as e:
+        logger.debug(f"Could not measure image coverage of page {page_no}: {e}")
+        coverage = 0.0
+    return PageStats(page_no, text_chars, coverage)
+
+
+def triage_pdf(pdf_path: str, sample_pages: int = SAMPLE_PAGES) -> dict[int, Route]:
+    """Route for every page. A sample of evenly spaced pages is inspected
+    first; if they all agree the whole document takes that route, otherwise
+    every page is inspected and routed on its own."""
+    from PyPDF2 import PdfReader
+
+    with open(pdf_path, "rb") as f:
+        reader = PdfReader(f)
+        page_count = len(reader.pages)
+        if page_count == 0:
+            return {}
+
+        step = max(1, page_count / sample_pages)
+        sample = sorted({int(index * step) + 1 for index in range(min(sample_pages, page_count))})
+        stats = {page_no: page_stats(reader.pages[page_no - 1], page_no) for page_no in sample}
+        sampled_routes = {page.route for page in stats.values()}
+        if len(sampled_routes) == 1:
+            route = sampled_routes.pop()
+            logger.info(f"{pdf_path}: {page_count} pages, all routed to {route.value}")
+            return {page_no: route for page_no in range(1, page_count + 1)}
+
+        for page_no in range(1, page_count + 1):
+            if page_no not in stats:
+                stats[page_no] = page_stats(reader.pages[page_no - 1], page_no)
+
+    routes = {page_no: page.route for page_no, page in stats.items()}
+    counts = {route.value: sum(1 for value in routes.values() if value == route) for route in Route}
+    logger.info(f"{pdf_path}: {page_count} pages routed per page {counts}")
+    return dict(sorted(routes.items()))
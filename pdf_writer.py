@@ -0,0 +1,81 @@
+PDF_DPI = 96                     # pixels per inch assumed for page images, same default as img2pdf
+
+
+class StreamingPdfWriter:
+    '''Write a PDF of full-page JPEG images one page at a time.
+
+    Each page's image, content stream and page object go to disk as soon as
+    add_jpeg() is called, so only the current page is ever held in memory.
+    The page tree and cross-reference table are written by close().'''
+
+    def __init__(self, path, dpi=PDF_DPI):
+        self.path = path
+        self.scale = 72 / dpi
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3      # 1 is the catalog, 2 the page tree
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _allocate(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body, stream=None):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode())
+        self._file.write(body)
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+
+    def add_jpeg(self, jpeg, width, height, grayscale=False):
+        '''Append a page showing the JPEG bytes at full size and return its page number'''
+        image_id = self._allocate()
+        content_id = self._allocate()
+        page_id = self._allocate()
+        (page_width, page_height) = (width * self.scale, height * self.scale)
+
+        colorspace = "/DeviceGray" if grayscale else "/DeviceRGB"
+        self._write_object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>"
+        ).encode(), jpeg)
+
+        content = f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode()
+        self._write_object(content_id, f"<< /Length {len(content)} >>".encode(), content)
+
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        self._page_ids.append(page_id)
+        return len(self._page_ids)
+
+    def close(self):
+        if self._file.closed:
+            return
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode())
+
+        xref_offset = self._file.tell()
+        self._file.write(f"xref\n0 {self._next_id}\n".encode())
+        self._file.write(b"0000000000 65535 f \n")
+        for object_id in range(1, self._next_id):
+            self._file.write(f"{self._offsets[object_id]:010} 00000 n \n".encode())
+        self._file.write(f"trailer\n<< /Size {self._next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        self._file.close()
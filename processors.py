@@ -0,0 +1,194 @@
+import atexit
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS_ENV = "AI_ANKI_PDF_WORKERS"  # overrides the size of the shared "pdf_pool"
+# every pdf_pool worker loads the docling converter of each triage route it meets, about 1-2 GB each
+PDF_POOL_WORKERS = int(os.getenv(PDF_WORKERS_ENV, "0")) or min(2, os.cpu_count() or 1)
+
+
+class ProcessorRegistry:
+    """Builds each backend on first use and hands the same instance to every
+    later caller, so nothing heavy is imported or constructed until an upload
+    actually needs it. Building one backend does not block the others."""
+
+    def __init__(self):
+        self._factories: dict[str, Callable[[], Any]] = {}
+        self._instances: dict[str, Any] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self.build_seconds: dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.build_seconds[name] = time.perf_counter() - start
+                metrics.observe("stage_seconds", self.build_seconds[name], stage=f"build.{name}")
+                logger.info(f"Initialized {name} in {self.build_seconds[name]:.2f}s")
+        return self._instances[name]
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def discard(self, name: str, instance: Any):
+        """Forget instance so the next get builds a new one, unless another
+        caller already replaced it"""
+        with self._locks[name]:
+            if self._instances.get(name) is instance:
+                del self._instances[name]
+                logger.warning(f"Discarded {name}, it will be rebuilt on next use")
+
+    def submit(self, name: str, fn: Callable, *args) -> Future:
+        """Run fn(*args) on the process pool registered as name. A pool is
+        broken for good once one of its workers dies (a crash, the OOM
+        killer), so it is discarded as soon as a future reports that, and a
+        submit to a pool found broken is retried once on a rebuilt one."""
+        for attempt in range(2):
+            pool = self.get(name)
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                self.discard(name, pool)
+                if attempt:
+                    raise
+                continue
+
+            def discard_if_broken(done: Future, pool=pool):
+                if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                    self.discard(name, pool)
+
+            future.add_done_callback(discard_if_broken)
+            return future
+
+
+def _build_audio_model():
+    from camel.models import FishAudioModel
+    return FishAudioModel()
+
+
+def _build_pdf_converter():
+    from docling.datamodel.base_models import InputFormat
+    from docling.document_converter import DocumentConverter
+    converter = DocumentConverter()
+    # load the layout models now rather than inside the first conversion
+    if hasattr(converter, "initialize_pipeline"):
+        converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+
+def _build_pdf_converter_with(**pipeline_options):
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    converter = DocumentConverter(format_options={
+        InputFormat.PDF: PdfFormatOption(pipeline_options=PdfPipelineOptions(**pipeline_options)),
+    })
+    converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+
+def _build_pdf_layout_converter():
+    # born-digital pages: layout analysis on the existing text layer, no OCR models
+    return _build_pdf_converter_with(do_ocr=False)
+
+
+def _build_pdf_ocr_converter():
+    # image-only pages, e.g. slide decks rendered from video frames
+    from docling.datamodel.pipeline_options import EasyOcrOptions
+    return _build_pdf_converter_with(do_ocr=True, ocr_options=EasyOcrOptions(force_full_page_ocr=True))
+
+
+def _build_crawler():
+    from camel.loaders import Firecrawl
+    return Firecrawl()
+
+
+def _build_vl_model():
+    from camel.configs import QwenConfig
+    from camel.models import ModelFactory
+    from camel.types import ModelPlatformType, ModelType
+    return ModelFactory.create(
+        model_platform=ModelPlatformType.QWEN,
+        model_type=ModelType.QWEN_VL_PLUS,
+        model_config_dict=QwenConfig(temperature=0.2).as_dict(),
+    )
+
+
+def _build_kg_model():
+    from camel.configs import QwenConfig
+    from camel.models import ModelFactory
+    from camel.types import ModelPlatformType, ModelType
+    return ModelFactory.create(
+        model_platform=ModelPlatformType.QWEN,
+        model_type=ModelType.QWEN_TURBO,
+        model_config_dict=QwenConfig(temperature=0.2).as_dict(),
+    )
+
+
+def _build_qa_model():
+    from camel.configs import QwenConfig
+    from camel.models import ModelFactory
+    from camel.types import ModelPlatformType, ModelType
+    return ModelFactory.create(
+        model_platform=ModelPlatformType.QWEN,
+        model_type=ModelType.QWEN_LONG,
+        model_config_dict=QwenConfig(temperature=0.8, max_tokens=8092).as_dict(),
+    )
+
+
+def _build_slide_detection():
+    # OpenCV, scikit-image and the detection pipeline
+    return importlib.import_module("video_to_pdf")
+
+
+def worker_context():
+    """Start method for worker process pools. Forking a process that runs
+    other threads (Gradio, the job queue) can copy a lock one of them holds
+    into the child, so workers come from a forkserver, or are spawned where
+    there is none."""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def _build_process_pool(workers: int):
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=worker_context())
+    atexit.register(pool.shutdown, cancel_futures=True)
+    return pool
+
+
+# Shared by every FileManager in the process, so e.g. one DocumentConverter is reused for all PDFs
+processors = ProcessorRegistry()
+processors.register("audio_model", _build_audio_model)
+processors.register("pdf_converter", _build_pdf_converter)
+processors.register("pdf_layout_converter", _build_pdf_layout_converter)
+processors.register("pdf_ocr_converter", _build_pdf_ocr_converter)
+processors.register("crawler", _build_crawler)
+processors.register("vl_model", _build_vl_model)
+processors.register("kg_model", _build_kg_model)
+processors.register("qa_model", _build_qa_model)
+processors.register("slide_detection", _build_slide_detection)
+# one process for the slide branch of every video upload, see FileManager._process_video
+processors.register("slide_pool", lambda: _build_process_pool(1))
+# PDF shard converters; each worker keeps its docling models loaded across PDFs, see pdf_extraction
+processors.register("pdf_pool", lambda: _build_process_pool(PDF_POOL_WORKERS))
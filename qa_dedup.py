@@ -0,0 +1,258 @@
+import logging
+import re
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEDUP_THRESHOLD = 0.7            # min estimated Jaccard similarity of question shingles to count as a duplicate
+EMBEDDING_THRESHOLD = 0.92       # min cosine similarity of question embeddings to count as a duplicate
+NUM_PERM = 128                   # MinHash permutations per question
+LSH_MARGIN = 0.1                 # LSH bands turn this far below the threshold, so pairs just above it are still candidates
+SHINGLE_CHARS = 5                # bytes of normalized UTF-8 text per shingle
+EMBEDDING_BANDS = 32             # random-hyperplane LSH bands of an EmbeddingIndex
+EMBEDDING_ROWS = 12              # hyperplanes per band; a 0.92 cosine pair shares a band with p > 0.999
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_SHIFT = np.uint64(32)           # permutations are (a * x + b) mod 2**64, top 32 bits kept
+_NORMALIZE_RE = re.compile(r"[^\w]+")
+# words a restatement may add, drop or swap; any other word only one of two questions has makes them distinct
+STOP_WORDS = frozenset("""a an the this that these those of in on at to for from by with about as into
+    is are was were be been being do does did can could would should will shall may might must
+    please exactly briefly explain describe""".split())
+NEGATIONS = frozenset("no not never without nor cannot isn aren wasn weren doesn don didn can won t".split())
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(_NORMALIZE_RE.sub(" ", question.casefold()).split())
+
+
+def _shingles(text: str, size: int) -> np.ndarray:
+    """Distinct character n-grams of normalized text, each read as a
+    big-endian integer of `size` bytes (wrapping past 8). Unlike word
+    n-grams, one inserted or changed word only alters the few shingles that
+    overlap it, so restatements stay above the threshold."""
+    data = np.frombuffer(normalize_question(text).encode("utf-8"), dtype=np.uint8)
+    if len(data) < size:
+        data = np.pad(data, (0, size - len(data)))
+    weights = np.uint64(256) ** np.arange(size - 1, -1, -1, dtype=np.uint64)
+    grams = np.lib.stride_tricks.sliding_window_view(data, size).astype(np.uint64) @ weights
+    return np.unique(grams)
+
+
+def content_words(question: str) -> frozenset:
+    return frozenset(normalize_question(question).split()) - STOP_WORDS
+
+
+def same_question(words: frozenset, other: frozenset) -> bool:
+    """Token-level check of a near-duplicate pair: one question only adds
+    words to the other, and not a negation. Character shingles score a
+    single swapped word ("advantage" / "disadvantage", "quicksort" /
+    "heapsort") as a close match, although it asks something else."""
+    if words <= other:
+        added = other - words
+    elif other <= words:
+        added = words - other
+    else:
+        return False
+    return not (added & NEGATIONS)
+
+
+def lsh_bands(threshold: float, num_perm: int) -> tuple[int, int]:
+    """(bands, rows) with bands * rows <= num_perm whose LSH S-curve turns at
+    (1 / bands) ** (1 / rows), as close to threshold as possible"""
+    candidates = [(num_perm // rows, rows) for rows in range(1, num_perm + 1)]
+    return min(candidates, key=lambda band_rows: abs((1 / band_rows[0]) ** (1 / band_rows[1]) - threshold))
+
+
+class ExactIndex:
+    """Duplicates are questions that normalize to the same text"""
+
+    def __init__(self):
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, question: str) -> int | None:
+        key = normalize_question(question)
+        if key in self.keys:
+            return self.keys[key]
+        self.keys[key] = len(self.keys)
+        return None
+
+
+class MinHashIndex:
+    """MinHash-LSH over character shingles. A new question is only compared with
+    the questions sharing one of its LSH band buckets, so adding n questions
+    takes roughly linear time; candidates are confirmed on the fraction of
+    equal signature values, which estimates their Jaccard similarity, and
+    then on their words with same_question."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = NUM_PERM,
+                 shingle_chars: int = SHINGLE_CHARS, seed: int = 0):
+        self.threshold = threshold
+        self.shingle_chars = shingle_chars
+        (self.bands, self.rows) = lsh_bands(threshold - LSH_MARGIN, num_perm)
+        self.num_perm = self.bands * self.rows
+        rng = np.random.default_rng(seed)
+        # multiply-add-shift hashing: odd a, any b, no modulo in the hot loop
+        self._a = rng.integers(0, 2 ** 64, size=(self.num_perm, 1), dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 64, size=(self.num_perm, 1), dtype=np.uint64, endpoint=False)
+        self._buckets = [{} for _ in range(self.bands)]
+        self.signatures = np.empty((64, self.num_perm), dtype=np.uint32)
+        self.words = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def signature(self, question: str) -> np.ndarray:
+        shingles = _shingles(question, self.shingle_chars)
+        if not len(shingles):
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        return ((self._a * shingles[None, :] + self._b) >> _SHIFT).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def query(self, signature: np.ndarray, words: frozenset) -> int | None:
+        """Id of a stored question at least threshold similar to signature
+        that same_question confirms, or None"""
+        candidates = set()
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(key, ()))
+        if not candidates:
+            return None
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self.signatures[ids] == signature).mean(axis=1)
+        for index in np.argsort(-similarity, kind="stable"):
+            if similarity[index] < self.threshold:
+                break
+            if same_question(words, self.words[ids[index]]):
+                return int(ids[index])
+        return None
+
+    def insert(self, signature: np.ndarray, words: frozenset) -> int:
+        if self.size == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, np.empty_like(self.signatures)])
+        self.signatures[self.size] = signature
+        self.words.append(words)
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(key, []).append(self.size)
+        self.size += 1
+        return self.size - 1
+
+    def add(self, question: str) -> int | None:
+        """Store question unless it duplicates one already stored; returns the
+        id of that earlier question, or None when question was new"""
+        signature = self.signature(question)
+        words = content_words(question)
+        duplicate = self.query(signature, words)
+        if duplicate is None:
+            self.insert(signature, words)
+        return duplicate
+
+
+class EmbeddingIndex:
+    """Cosine similarity of sentence embeddings from a small local model.
+    Catches paraphrases MinHash misses, at the cost of a model forward pass
+    per question. Vectors are bucketed by random-hyperplane LSH (the sign of
+    their projections, EMBEDDING_ROWS hyperplanes to a band), so a question
+    is only compared with the stored ones sharing a band. encode maps a list
+    of texts to a 2-D array; by default it is a sentence-transformers model
+    on the CPU."""
+
+    def __init__(self, threshold: float = EMBEDDING_THRESHOLD, encode: Callable[[list[str]], np.ndarray] | None = None,
+                 model_name: str = EMBEDDING_MODEL, bands: int = EMBEDDING_BANDS, rows: int = EMBEDDING_ROWS,
+                 seed: int = 0):
+        self.threshold = threshold
+        self.model_name = model_name
+        self.bands = bands
+        self.rows = rows
+        self._encode = encode
+        self._rng = np.random.default_rng(seed)
+        self._hyperplanes = None
+        self._buckets = [{} for _ in range(bands)]
+        self.vectors = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if self._encode is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(self.model_name, device="cpu")
+            self._encode = lambda batch: model.encode(batch, convert_to_numpy=True)
+        vectors = np.asarray(self._encode(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _band_keys(self, vector: np.ndarray) -> list[bytes]:
+        if self._hyperplanes is None:
+            self._hyperplanes = self._rng.standard_normal((len(vector), self.bands * self.rows)).astype(np.float32)
+        bits = np.packbits((vector @ self._hyperplanes > 0).reshape(self.bands, self.rows), axis=1)
+        return [band.tobytes() for band in bits]
+
+    def add_vector(self, vector: np.ndarray) -> int | None:
+        keys = self._band_keys(vector)
+        candidates = set()
+        for buckets, key in zip(self._buckets, keys):
+            candidates.update(buckets.get(key, ()))
+        if candidates:
+            ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarity = self.vectors[ids] @ vector
+            best = int(similarity.argmax())
+            if similarity[best] >= self.threshold:
+                return int(ids[best])
+        if self.vectors is None:
+            self.vectors = np.empty((64, len(vector)), dtype=np.float32)
+        elif self.size == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.empty_like(self.vectors)])
+        self.vectors[self.size] = vector
+        for buckets, key in zip(self._buckets, keys):
+            buckets.setdefault(key, []).append(self.size)
+        self.size += 1
+        return None
+
+    def add(self, question: str) -> int | None:
+        return self.add_vector(self.encode([question])[0])
+
+    def add_many(self, questions: list[str]) -> list[int | None]:
+        """Like add for each question in order, encoding them in one batch"""
+        return [self.add_vector(vector) for vector in self.encode(questions)]
+
+
+def make_dedup_index(name: str, threshold: float | None = None):
+    """Build a fresh index by name: "exact", "minhash" or "embedding" """
+    if name == "exact":
+        return ExactIndex()
+    if name == "minhash":
+        return MinHashIndex(threshold if threshold is not None else DEDUP_THRESHOLD)
+    if name == "embedding":
+        return EmbeddingIndex(threshold if threshold is not None else EMBEDDING_THRESHOLD)
+    raise ValueError(f"unknown dedup index {name}")
+
+
+class QADeduplicator:
+    """Streaming filter over generated QA pairs: a pair is kept unless its
+    question duplicates one kept before, according to index."""
+
+    def __init__(self, index=None):
+        self.index = index if index is not None else MinHashIndex()
+        self.kept = 0
+        self.dropped = 0
+
+    def is_new(self, question: str) -> bool:
+        if self.index.add(question) is None:
+            self.kept += 1
+            return True
+        self.dropped += 1
+        return False
+
+    def filter(self, pairs: Iterable, question: Callable = lambda pair: pair["question"]) -> Iterator:
+        for pair in pairs:
+            if self.is_new(question(pair)):
+                yield pair
@@ -1,17 +1,36 @@
+"""Generate question-answer pairs from extracted text.
+
+Run with e.g. `python qa_generation.py concatenated_text.txt -o qa_pairs.jsonl`.
+"""
+import argparse
 import json
-from camel.agents import ChatAgent
-from camel.configs import QwenConfig
-from camel.models import ModelFactory
-from camel.types import ModelPlatformType, ModelType
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from metrics import metrics
+from processors import processors
+from qa_dedup import QADeduplicator, make_dedup_index
+from text_chunking import chunk_text
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
 
-model = ModelFactory.create(
-    model_platform=ModelPlatformType.QWEN,
-    model_type=ModelType.QWEN_LONG ,
-    model_config_dict=QwenConfig(temperature=0.8,max_tokens=8092).as_dict(),
-)
+QA_CHUNK_TOKENS = 3000           # source tokens sent with one generation request
+QA_OVERLAP_TOKENS = 150
+QA_WORKERS = 4                   # generation requests in flight at the same time
+MAX_RETRIES = 2                  # extra attempts for a chunk whose request failed or returned no valid JSON
+RETRY_BACKOFF = 2                # seconds before the first retry, doubled every round
 
 # Define system message
-sys_msg = """你是一个善于对用户给出的内容详细思考过后，一步一步去生成高质量的问题答案对的助手，内容例子如下
+QA_SYSTEM_PROMPT = """你是一个善于对用户给出的内容详细思考过后，一步一步去生成高质量的问题答案对的助手，内容例子如下
 
 
 {
@@ -21,13 +40,221 @@ sys_msg = """你是一个善于对用户给出的内容详细思考过后，一
 
 
 """
+QA_USER_PROMPT = "{text}\n\nReturn only a JSON object that maps each question about the text above to its answer."
+
+# greedy, so a ``` inside an answer does not end the block early
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*)```", re.DOTALL)
+_JSON_START_RE = re.compile(r"[{\[]")
+
+
+class QAGenerationError(Exception):
+    def __init__(self, message: str, parse_failures: int = 0):
+        super().__init__(message)
+        self.parse_failures = parse_failures
+
+
+@dataclass
+class QAPair:
+    question: str
+    answer: str
+    chunk: int           # index of the source chunk the pair was generated from
+
+
+def _is_qa_json(data) -> bool:
+    return isinstance(data, dict) or (isinstance(data, list) and any(isinstance(item, dict) for item in data))
+
+
+def _find_qa_json(text: str):
+    """The QA object or list in a response: the whole fenced body (or the
+    whole response) when it parses, otherwise the first object or list of
+    objects that decodes from some { or [ onwards, so prose such as "[1]"
+    before the JSON or text after it does not matter"""
+    fenced = _FENCE_RE.search(text)
+    candidates = [fenced.group(1), text] if fenced else [text]
+    error = "no JSON in response"
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+            if _is_qa_json(data):
+                return data
+        except ValueError as e:
+            error = f"invalid JSON in response: {e}"
+    decoder = json.JSONDecoder()
+    for match in _JSON_START_RE.finditer(text):
+        try:
+            (data, _) = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if _is_qa_json(data):
+            return data
+    raise QAGenerationError(error)
+
+
+def parse_qa_pairs(text: str) -> list[tuple[str, str]]:
+    """(question, answer) pairs from a model response: a JSON object mapping
+    questions to answers, or a list of {"question", "answer"} objects,
+    optionally inside a code fence or surrounded by prose. Raises
+    QAGenerationError when there is no valid JSON at all; entries that are
+    not a question and an answer are logged and skipped."""
+    data = _find_qa_json(text)
+    if isinstance(data, dict):
+        items = list(data.items())
+    else:
+        items = [(item.get("question"), item.get("answer")) if isinstance(item, dict) else (None, None) for item in data]
+    pairs = []
+    for question, answer in items:
+        if isinstance(answer, (int, float)) and not isinstance(answer, bool):
+            answer = str(answer)
+        if isinstance(question, str) and isinstance(answer, str) and question.strip() and answer.strip():
+            pairs.append((question.strip(), answer.strip()))
+    if len(pairs) < len(items):
+        logger.warning(f"Skipped {len(items) - len(pairs)} of {len(items)} entries that are not a question and an answer")
+        metrics.count("qa_invalid_entries", len(items) - len(pairs))
+    return pairs
+
+
+class CamelQABackend:
+    """Generate pairs with a camel model; a fresh ChatAgent per chunk keeps
+    earlier chunks out of the prompt."""
+
+    def __init__(self, model_factory: Callable[[], object] = lambda: processors.get("qa_model")):
+        self.model_factory = model_factory
+
+    def generate(self, text: str) -> str:
+        from camel.agents import ChatAgent
+        agent = ChatAgent(system_message=QA_SYSTEM_PROMPT, model=self.model_factory())
+        with metrics.model_call("qa_model", "generate"):
+            response = agent.step(QA_USER_PROMPT.format(text=text))
+        metrics.record_usage("qa_model", response.info.get("usage"))
+        return response.msgs[0].content
+
+
+class FakeQABackend:
+    """Offline backend: asks what each sentence of the chunk says, in a code
+    fence like a chat model would. delay simulates latency per request."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, text: str) -> str:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        sentences = [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text) if len(sentence.split()) >= 3]
+        pairs = {f"What does the text say about {' '.join(sentence.split()[:3])}?": sentence for sentence in sentences}
+        return f"```json\n{json.dumps(pairs, ensure_ascii=False)}\n```"
+
+
+@dataclass
+class QAResult:
+    chunks: int
+    failed_chunks: int
+    pairs: int
+    duplicates: int
+    seconds: float
+    parse_failures: int = 0      # responses without valid QA JSON, retried ones included
+
+    def summary(self) -> str:
+        return (f"{self.pairs} QA pairs from {self.chunks - self.failed_chunks}/{self.chunks} chunks "
+                f"({self.duplicates} duplicates dropped, {self.parse_failures} unparseable responses) "
+                f"in {self.seconds:.1f}s")
+
+
+class QAGenerator:
+    """Chunk a text, generate pairs for the chunks concurrently, and append
+    each chunk's valid pairs to a JSONL file as soon as that chunk is done,
+    minus questions the dedup index (see qa_dedup) has seen before. A chunk
+    whose request fails or whose response has no valid JSON is retried; one
+    that keeps failing is skipped and counted."""
+
+    def __init__(self, backend=None, chunk_tokens: int = QA_CHUNK_TOKENS, overlap_tokens: int = QA_OVERLAP_TOKENS,
+                 workers: int = QA_WORKERS, max_retries: int = MAX_RETRIES, dedup: str = "minhash",
+                 dedup_threshold: float | None = None):
+        self.backend = backend if backend is not None else CamelQABackend()
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.workers = workers
+        self.max_retries = max_retries
+        self.dedup = dedup
+        self.dedup_threshold = dedup_threshold
+
+    def _generate_chunk(self, text: str) -> tuple[list[tuple[str, str]], int]:
+        """(pairs, responses that could not be parsed before them)"""
+        parse_failures = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                response = self.backend.generate(text)
+            except Exception as e:
+                logger.warning(f"QA generation failed (attempt {attempt + 1}): {e}")
+                error = e
+                continue
+            try:
+                return parse_qa_pairs(response), parse_failures
+            except QAGenerationError as e:
+                parse_failures += 1
+                metrics.count("qa_parse_failures")
+                logger.warning(f"Unparseable QA response (attempt {attempt + 1}): {e}; response starts {response[:200]!r}")
+                error = e
+        raise QAGenerationError(f"failed after {self.max_retries} retries ({parse_failures} unparseable responses): {error}",
+                                parse_failures)
+
+    def generate(self, text: str, output_path: str) -> QAResult:
+        start = time.perf_counter()
+        chunks = chunk_text(text, self.chunk_tokens, self.overlap_tokens)
+        deduplicator = QADeduplicator(make_dedup_index(self.dedup, self.dedup_threshold))
+        failed = 0
+        parse_failures = 0
+        with open(output_path, "w", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._generate_chunk, chunk.text): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    (generated, chunk_parse_failures) = future.result()
+                except Exception as e:
+                    logger.error(f"Skipping chunk {chunk.index}: {e}")
+                    failed += 1
+                    parse_failures += getattr(e, "parse_failures", 0)
+                    continue
+                parse_failures += chunk_parse_failures
+                for (question, answer) in generated:
+                    if deduplicator.is_new(question):
+                        output.write(json.dumps(asdict(QAPair(question, answer, chunk.index)), ensure_ascii=False) + "\n")
+                output.flush()
+                logger.info(f"Chunk {chunk.index}: {len(generated)} pairs ({deduplicator.kept} written so far)")
+
+        result = QAResult(len(chunks), failed, deduplicator.kept, deduplicator.dropped, time.perf_counter() - start,
+                          parse_failures)
+        logger.info(result.summary())
+        return result
+
+    def generate_file(self, source_path: str, output_path: str) -> QAResult:
+        with open(source_path, "r", encoding="utf-8") as f:
+            return self.generate(f.read(), output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", nargs="?", default="concatenated_text.txt")
+    parser.add_argument("-o", "--output", default="qa_pairs.jsonl")
+    parser.add_argument("--workers", type=int, default=QA_WORKERS)
+    parser.add_argument("--chunk-tokens", type=int, default=QA_CHUNK_TOKENS)
+    parser.add_argument("--dedup", choices=["exact", "minhash", "embedding"], default="minhash")
+    parser.add_argument("--dedup-threshold", type=float, default=None)
+    parser.add_argument("--fake", action="store_true", help="use the offline fake model")
+    args = parser.parse_args()
 
-# Set agent
-camel_agent = ChatAgent(system_message=sys_msg, model=model)
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    generator = QAGenerator(FakeQABackend() if args.fake else None, chunk_tokens=args.chunk_tokens, workers=args.workers,
+                            dedup=args.dedup, dedup_threshold=args.dedup_threshold)
+    print(generator.generate_file(args.source, args.output).summary())
 
-with open("concatenated_text.txt", "r") as f:
-    user_msg = f.read()
 
-# Get response information
-response = camel_agent.step(user_msg)
-json.dump(response.msgs[0].content, open("test.json", "w"), ensure_ascii=False, indent=4)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+from skimage.metrics import structural_similarity
+
+DOWNSCALE_WIDTH = 320            # width of the grayscale copy compared by the downscaled SSIM backend
+THUMBNAIL_SIZE = (40, 22)        # grayscale thumbnail used to pick which captured slides get a full SSIM check
+SSIM_CANDIDATES = 4              # captured slides closest to a frame's thumbnail that are checked with SSIM
+HASH_SIZE = 16                   # hashes are HASH_SIZE x HASH_SIZE bits; 8x8 cannot tell apart slides sharing a layout
+PHASH_OVERSAMPLE = 4             # the pHash DCT runs on a (HASH_SIZE * PHASH_OVERSAMPLE)^2 grayscale image
+# min fraction of equal hash bits for two slides to count as the same; on 1080p slides sharing one layout,
+# captures of one slide agree on >= 0.99 of 256 bits and different slides on <= 0.90
+HASH_THRESHOLD = 0.95
+
+
+class SimilarityBackend(ABC):
+    '''Decides whether a frame repeats a slide that was already captured.
+
+    fingerprint() turns a full-resolution BGR frame into whatever the backend
+    compares, similarity() is a pure function of two fingerprints (so it can
+    run in a worker process), and is_duplicate()/add() keep the backend's view
+    of the captured slides. Backends with compare_all set check a frame against
+    every captured slide, the others only against the last one.'''
+    compare_all = False
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.last = None
+
+    def fingerprint(self, frame):
+        return frame
+
+    @staticmethod
+    @abstractmethod
+    def similarity(first, second):
+        '''Score in [0, 1], compared against threshold'''
+
+    def is_duplicate(self, fingerprint):
+        if self.last is None:
+            return False
+        return self.similarity(self.last, fingerprint) >= self.threshold
+
+    def add(self, fingerprint):
+        self.last = fingerprint
+
+
+class ExactSSIM(SimilarityBackend):
+    '''Full-resolution colour SSIM against the previous slide'''
+
+    @staticmethod
+    def similarity(first, second):
+        return structural_similarity(first, second, channel_axis=2, data_range=255)
+
+
+class DownscaledSSIM(SimilarityBackend):
+    '''SSIM on a small grayscale copy, checked against every captured slide.
+
+    A thumbnail of each captured slide is kept in one matrix; a frame is only
+    compared with SSIM against the SSIM_CANDIDATES slides whose thumbnails
+    are closest to its own, so a slide shown again later is still caught
+    while the cost per frame stays flat.'''
+    compare_all = True
+
+    def __init__(self, threshold, width=DOWNSCALE_WIDTH, candidates=SSIM_CANDIDATES):
+        super().__init__(threshold)
+        self.width = width
+        self.candidates = candidates
+        self.slides = []
+        self.thumbnails = np.empty((64, THUMBNAIL_SIZE[0] * THUMBNAIL_SIZE[1]), dtype=np.float32)
+
+    def fingerprint(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        (h, w) = gray.shape[:2]
+        if w <= self.width:
+            return gray
+        height = max(1, round(h * self.width / w))
+        return cv2.resize(gray, (self.width, height), interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def similarity(first, second):
+        return structural_similarity(first, second, data_range=255)
+
+    @staticmethod
+    def _thumbnail(fingerprint):
+        return cv2.resize(fingerprint, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+
+    def is_duplicate(self, fingerprint):
+        if not self.slides:
+            return False
+        distances = np.abs(self.thumbnails[:len(self.slides)] - self._thumbnail(fingerprint)).mean(axis=1)
+        nearest = np.argsort(distances)[:self.candidates]
+        return any(self.similarity(self.slides[index], fingerprint) >= self.threshold for index in nearest)
+
+    def add(self, fingerprint):
+        super().add(fingerprint)
+        if len(self.slides) == len(self.thumbnails):
+            self.thumbnails = np.concatenate([self.thumbnails, np.empty_like(self.thumbnails)])
+        self.thumbnails[len(self.slides)] = self._thumbnail(fingerprint)
+        self.slides.append(fingerprint)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+# number of set bits for every byte value, used to popcount XORed hashes
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+class HashIndex:
+    '''In-memory index of packed bit hashes, queried with one vectorized XOR'''
+
+    def __init__(self, hash_bytes, capacity=64):
+        self.hashes = np.empty((capacity, hash_bytes), dtype=np.uint8)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, packed):
+        if self.size == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.empty_like(self.hashes)])
+        self.hashes[self.size] = packed
+        self.size += 1
+
+    def distances(self, packed):
+        '''Hamming distance from packed to every stored hash'''
+        return _POPCOUNT[np.bitwise_xor(self.hashes[:self.size], packed)].sum(axis=1)
+
+
+class PerceptualHash(SimilarityBackend):
+    '''dHash or pHash of the frame, checked against every captured slide'''
+    compare_all = True
+
+    def __init__(self, threshold, method="dhash", hash_size=HASH_SIZE):
+        if method not in ("dhash", "phash"):
+            raise ValueError(f"unknown hash method {method}")
+        super().__init__(threshold)
+        self.method = method
+        self.hash_size = hash_size
+        self.bits = hash_size * hash_size
+        self.index = HashIndex(self.bits // 8)
+        self.sample_size = hash_size * PHASH_OVERSAMPLE
+        if method == "phash":
+            self._dct = _dct_matrix(self.sample_size)
+
+    def fingerprint(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.method == "dhash":
+            small = cv2.resize(gray, (self.hash_size + 1, self.hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+            bits = small[:, 1:] > small[:, :-1]
+        else:
+            small = cv2.resize(gray, (self.sample_size, self.sample_size), interpolation=cv2.INTER_AREA).astype(np.float64)
+            low = (self._dct @ small @ self._dct.T)[:self.hash_size, :self.hash_size]
+            bits = low > np.median(low.ravel()[1:])
+        return np.packbits(bits.ravel())
+
+    @staticmethod
+    def similarity(first, second):
+        bits = len(first) * 8
+        return 1 - int(_POPCOUNT[np.bitwise_xor(first, second)].sum()) / bits
+
+    def is_duplicate(self, fingerprint):
+        if len(self.index) == 0:
+            return False
+        max_distance = (1 - self.threshold) * self.bits
+        return bool(self.index.distances(fingerprint).min() <= max_distance)
+
+    def add(self, fingerprint):
+        super().add(fingerprint)
+        self.index.add(fingerprint)
+
+
+SIMILARITY_BACKENDS = ("ssim", "ssim-downscaled", "dhash", "phash")
+
+
+def make_similarity_backend(name, ssim_threshold, hash_threshold=HASH_THRESHOLD, hash_size=HASH_SIZE):
+    '''Build a fresh backend by name; see SIMILARITY_BACKENDS'''
+    if name == "ssim":
+        return ExactSSIM(ssim_threshold)
+    if name == "ssim-downscaled":
+        return DownscaledSSIM(ssim_threshold)
+    if name in ("dhash", "phash"):
+        return PerceptualHash(hash_threshold, method=name, hash_size=hash_size)
+    raise ValueError(f"unknown similarity backend {name}")
@@ -0,0 +1,112 @@
+import json
+import sqlite3
+import zipfile
+
+from anki_export import FIELD_SEPARATOR, ApkgWriter, export_apkg, note_guid, read_pairs
+
+PAIRS = [
+    {"question": "What does a hash index speed up?", "answer": "Equality lookups", "chunk": 0},
+    {"question": "What is the main disadvantage of a hash index?", "answer": "No range scans", "chunk": 0},
+    {"question": "Which sort is stable?", "answer": "Merge sort", "chunk": 1},
+]
+
+
+def _write_pairs(path, pairs, extra_lines=()):
+    with open(path, "w", encoding="utf-8") as f:
+        for pair in pairs:
+            f.write(json.dumps(pair) + "\n")
+        for line in extra_lines:
+            f.write(line + "\n")
+
+
+def _open_apkg(apkg_path, tmp_path):
+    """(notes, cards, media map, zip member names) of an exported deck"""
+    with zipfile.ZipFile(apkg_path) as apkg:
+        apkg.extract("collection.anki2", tmp_path)
+        media = json.loads(apkg.read("media"))
+        members = {name: apkg.read(name) for name in apkg.namelist()}
+    with sqlite3.connect(tmp_path / "collection.anki2") as conn:
+        conn.row_factory = sqlite3.Row
+        notes = [dict(row) for row in conn.execute("SELECT * FROM notes ORDER BY id")]
+        cards = [dict(row) for row in conn.execute("SELECT * FROM cards ORDER BY id")]
+        (decks,) = conn.execute("SELECT decks FROM col").fetchone()
+    return notes, cards, media, members, json.loads(decks)
+
+
+def test_every_pair_becomes_a_note_with_one_card(tmp_path):
+    _write_pairs(tmp_path / "pairs.jsonl", PAIRS)
+
+    export_apkg(str(tmp_path / "pairs.jsonl"), str(tmp_path / "deck.apkg"), "Databases", tags=["week 1"])
+    (notes, cards, media, _, decks) = _open_apkg(tmp_path / "deck.apkg", tmp_path)
+
+    assert sorted(note["flds"].split(FIELD_SEPARATOR)[0] for note in notes) == sorted(pair["question"] for pair in PAIRS)
+    assert {note["guid"] for note in notes} == {note_guid(pair["question"]) for pair in PAIRS}
+    assert all(note["tags"] == " week_1 " for note in notes)
+    assert sorted(card["nid"] for card in cards) == sorted(note["id"] for note in notes)
+    assert {card["did"] for card in cards} == {int(deck_id) for deck_id, deck in decks.items() if deck["name"] == "Databases"}
+    assert media == {}
+
+
+def test_ids_and_guids_are_stable_across_exports(tmp_path):
+    _write_pairs(tmp_path / "pairs.jsonl", PAIRS)
+
+    export_apkg(str(tmp_path / "pairs.jsonl"), str(tmp_path / "first.apkg"))
+    (first_notes, first_cards, *_) = _open_apkg(tmp_path / "first.apkg", tmp_path)
+    _write_pairs(tmp_path / "pairs.jsonl", list(reversed(PAIRS)))
+    export_apkg(str(tmp_path / "pairs.jsonl"), str(tmp_path / "second.apkg"))
+    (second_notes, second_cards, *_) = _open_apkg(tmp_path / "second.apkg", tmp_path)
+
+    assert [(note["id"], note["guid"]) for note in first_notes] == [(note["id"], note["guid"]) for note in second_notes]
+    assert [card["id"] for card in first_cards] == [card["id"] for card in second_cards]
+
+
+def test_guid_ignores_whitespace_and_a_repeated_question_updates_its_note(tmp_path):
+    assert note_guid("What is  a\nB-tree?") == note_guid("What is a B-tree?")
+
+    with ApkgWriter(str(tmp_path / "deck.apkg")) as writer:
+        writer.add_note("What is a B-tree?", "A balanced search tree")
+        writer.add_note("What is a B-tree?", "A self-balancing tree")
+    (notes, cards, *_) = _open_apkg(tmp_path / "deck.apkg", tmp_path)
+
+    assert len(notes) == 1 and len(cards) == 1
+    assert notes[0]["flds"].endswith("A self-balancing tree")
+
+
+def test_pair_images_are_shipped_and_referenced(tmp_path):
+    image = tmp_path / "slide_003.png"
+    image.write_bytes(b"\x89PNG fake image bytes")
+    pairs = [dict(PAIRS[0], image=str(image)), dict(PAIRS[1], image=str(image)), PAIRS[2]]
+    _write_pairs(tmp_path / "pairs.jsonl", pairs)
+
+    export_apkg(str(tmp_path / "pairs.jsonl"), str(tmp_path / "deck.apkg"))
+    (notes, _, media, members, _) = _open_apkg(tmp_path / "deck.apkg", tmp_path)
+
+    assert media == {"0": "slide_003.png"}
+    assert members["0"] == image.read_bytes()
+    backs = {note["flds"].split(FIELD_SEPARATOR)[0]: note["flds"].split(FIELD_SEPARATOR)[1] for note in notes}
+    assert backs[PAIRS[0]["question"]].endswith('<img src="slide_003.png">')
+    assert backs[PAIRS[1]["question"]].endswith('<img src="slide_003.png">')
+    assert "<img" not in backs[PAIRS[2]["question"]]
+
+
+def test_media_with_the_same_name_get_distinct_names(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    writer = ApkgWriter(str(tmp_path / "deck.apkg"))
+    first = writer.add_media(str(tmp_path / "a" / "slide.png"))
+    second = writer.add_media(str(tmp_path / "b" / "slide.png"))
+    again = writer.add_media(str(tmp_path / "a" / "slide.png"))
+    writer.discard()
+    assert (first, second, again) == ("slide.png", "slide_1.png", "slide.png")
+
+
+def test_fields_are_escaped(tmp_path):
+    with ApkgWriter(str(tmp_path / "deck.apkg")) as writer:
+        writer.add_note("Is 1 < 2?", "Yes\nalways")
+    (notes, *_) = _open_apkg(tmp_path / "deck.apkg", tmp_path)
+    assert notes[0]["flds"] == "Is 1 &lt; 2?" + FIELD_SEPARATOR + "Yes<br>always"
+
+
+def test_unreadable_and_incomplete_lines_are_skipped(tmp_path):
+    _write_pairs(tmp_path / "pairs.jsonl", PAIRS[:1], extra_lines=["", "{not json", json.dumps({"question": "No answer?"})])
+    assert [pair["question"] for pair in read_pairs(str(tmp_path / "pairs.jsonl"))] == [PAIRS[0]["question"]]
@@ -0,0 +1,205 @@
+import gzip
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+import crawler
+from crawler import CrawlError, LocalBackend, ValidatorCache, WebCrawler, check_public
+
+PAGE = "<html><head><title>x</title><script>var a;</script></head><body><h1>Title</h1><p>Some <b>bold</b> text.</p></body></html>"
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    hosts = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for (name, value) in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        Handler.hosts.append(self.headers["Host"])
+        base = f"http://{self.headers['Host']}"
+        pages = "".join(f"<url><loc>{base}/page/{index}</loc></url>" for index in range(3))
+        sitemap = f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{pages}</urlset>'
+        if self.path.startswith("/page"):
+            if self.headers.get("If-None-Match") == ETAG:
+                self._send(304)
+            else:
+                self._send(200, PAGE.encode(), {"Content-Type": "text/html", "ETag": ETAG})
+        elif self.path == "/notes.txt":
+            self._send(200, "plain text é".encode(), {"Content-Type": "text/plain"})
+        elif self.path == "/sitemap.xml":
+            self._send(200, sitemap.encode(), {"Content-Type": "application/xml"})
+        elif self.path == "/sitemap.xml.gz":
+            self._send(200, gzip.compress(sitemap.encode()), {"Content-Type": "application/gzip"})
+        elif self.path == "/sitemap_index.xml":
+            index = (f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                     f"<sitemap><loc>{base}/sitemap.xml.gz</loc></sitemap></sitemapindex>")
+            self._send(200, index.encode(), {"Content-Type": "application/xml"})
+        elif self.path.startswith("/redirect?to="):
+            self._send(302, headers={"Location": self.path.split("=", 1)[1]})
+        elif self.path == "/loop":
+            self._send(302, headers={"Location": "/loop"})
+        elif self.path == "/busy":
+            self._send(503, headers={"Retry-After": "7"})
+        else:
+            self._send(404)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    Handler.hosts = []
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _crawler(tmp_path, backend=None):
+    return WebCrawler(backend or LocalBackend(allow_private=True), workers=2, host_interval=0,
+                      cache=ValidatorCache(str(tmp_path / "cache")), max_retries=0)
+
+
+def test_fetch_converts_html_to_markdown(server):
+    fetched = LocalBackend(allow_private=True).fetch(f"{server}/page/1")
+
+    assert fetched.markdown == "# Title\n\nSome **bold** text.\n"
+    assert fetched.etag == ETAG
+
+
+def test_fetch_decodes_text_as_utf8(server):
+    assert LocalBackend(allow_private=True).fetch(f"{server}/notes.txt").markdown == "plain text é"
+
+
+def test_unchanged_page_is_served_from_the_validator_cache(server, tmp_path):
+    web = _crawler(tmp_path)
+    first = web.crawl([f"{server}/page/1"]).results[0]
+    second = web.crawl([f"{server}/page/1"]).results[0]
+
+    assert first.ok and not first.not_modified
+    assert second.not_modified and second.markdown == first.markdown
+
+
+@pytest.mark.parametrize("sitemap", ["sitemap.xml", "sitemap.xml.gz", "sitemap_index.xml"])
+def test_sitemap_expands_to_its_pages(server, tmp_path, sitemap):
+    (urls, duplicates) = _crawler(tmp_path).expand([f"{server}/{sitemap}", f"{server}/page/0"])
+
+    assert urls == [f"{server}/page/{index}" for index in range(3)]
+    assert duplicates == 1
+
+
+def test_crawl_reports_failed_pages_without_stopping(server, tmp_path):
+    report = _crawler(tmp_path).crawl([f"{server}/page/1", f"{server}/missing", f"{server}/busy"])
+
+    assert [result.ok for result in report.results] == [True, False, False]
+    assert "HTTP 404" in report.results[1].error
+    assert "HTTP 503" in report.results[2].error
+
+
+def test_server_errors_carry_retry_after(server):
+    with pytest.raises(CrawlError) as error:
+        LocalBackend(allow_private=True).get(f"{server}/busy")
+    assert (error.value.status, error.value.retry_after, error.value.retryable) == (503, 7.0, True)
+
+
+def test_redirects_are_followed_up_to_the_limit(server):
+    assert LocalBackend(allow_private=True).fetch(f"{server}/redirect?to=/page/2").markdown.startswith("# Title")
+    with pytest.raises(CrawlError, match="redirects"):
+        LocalBackend(allow_private=True).get(f"{server}/loop")
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1/", "http://localhost:8080/", "http://10.0.0.1/",
+                                 "http://192.168.1.1/", "http://169.254.169.254/latest/meta-data/", "http://[::1]/"])
+def test_check_public_rejects_non_public_hosts(url):
+    with pytest.raises(CrawlError) as error:
+        check_public(url)
+    assert error.value.status == 403 and not error.value.retryable
+
+
+@pytest.mark.parametrize("url", ["file:///etc/passwd", "ftp://example.com/", "http:///path"])
+def test_check_public_rejects_other_schemes(url):
+    with pytest.raises(CrawlError) as error:
+        check_public(url)
+    assert error.value.status == 400
+
+
+def test_check_public_accepts_public_addresses(monkeypatch):
+    monkeypatch.setattr(socket, "getaddrinfo",
+                        lambda host, port, *args, **kwargs: [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.216.34", port))])
+    check_public("https://example.com/page")
+
+
+def test_private_hosts_are_not_fetched_by_default(server, monkeypatch):
+    monkeypatch.delenv(crawler.ALLOW_PRIVATE_ENV, raising=False)
+    with pytest.raises(CrawlError) as error:
+        LocalBackend().fetch(f"{server}/page/1")
+    assert error.value.status == 403
+    assert Handler.hosts == []
+
+
+def _port(server):
+    return int(server.rsplit(":", 1)[1])
+
+
+def test_redirect_to_a_private_host_is_not_followed(server, monkeypatch):
+    # the loopback server stands in for a public host; its redirect to localhost must be refused
+    real_public_addresses = crawler.public_addresses
+    monkeypatch.setattr(crawler, "public_addresses",
+                        lambda host, port: ["127.0.0.1"] if host == "127.0.0.1" else real_public_addresses(host, port))
+
+    with pytest.raises(CrawlError) as error:
+        LocalBackend(allow_private=False).get(f"{server}/redirect?to=http://localhost:{_port(server)}/page/1")
+    assert error.value.status == 403
+    assert len(Handler.hosts) == 1
+
+
+def test_connection_goes_to_the_checked_address(server, monkeypatch):
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, *args, **kwargs):
+        if host == "site.test":
+            raise socket.gaierror("a second lookup of site.test is not allowed")
+        return real_getaddrinfo(host, *args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(crawler, "public_addresses", lambda host, port: ["127.0.0.1"])
+
+    fetched = LocalBackend(allow_private=False).fetch(f"http://site.test:{_port(server)}/page/1")
+
+    assert fetched.markdown.startswith("# Title")
+    assert Handler.hosts == [f"site.test:{_port(server)}"]
+
+
+def test_host_rebound_to_a_private_address_is_not_reached(server, monkeypatch):
+    # the first lookup answers with a public address and every later one with loopback
+    real_getaddrinfo = socket.getaddrinfo
+    lookups = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host != "rebind.test":
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        lookups.append(host)
+        address = "93.184.216.34" if len(lookups) == 1 else "127.0.0.1"
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+
+    with pytest.raises(CrawlError) as error:
+        LocalBackend(allow_private=False).fetch(f"http://rebind.test:{_port(server)}/page/1")
+    assert error.value.status == 403
+    assert "rebind.test:" in str(error.value)
+    assert Handler.hosts == []
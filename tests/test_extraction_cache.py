@@ -0,0 +1,59 @@
+import os
+import threading
+
+import extraction_cache
+from extraction_cache import ExtractionCache, normalize_url
+
+
+def _files(root):
+    return sorted(name for _, _, names in os.walk(root) for name in names)
+
+
+def test_put_then_get(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    key = cache.key("ab" * 32, "pdf", 1)
+    assert cache.get(key) is None
+    cache.put(key, "extracted text")
+    assert cache.get(key) == "extracted text"
+    assert cache.get(cache.key("ab" * 32, "pdf", 2)) is None
+
+
+def test_concurrent_writes_of_one_key_leave_no_temporary_files(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    key = cache.key("cd" * 32, "audio", 1)
+    threads = [threading.Thread(target=cache.put, args=(key, f"text {index}" * 1000)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.get(key) in {f"text {index}" * 1000 for index in range(8)}
+    assert [name for name in _files(tmp_path) if not name.endswith(".txt")] == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction_cache, "CACHE_EVICT_TO", 0.5)
+    cache = ExtractionCache(str(tmp_path), max_bytes=400)
+    keys = [cache.key(f"{index:064x}", "pdf", 1) for index in range(4)]
+    for index, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        os.utime(cache._path(key), (index, index))
+    cache.get(keys[0])  # now the most recently used
+
+    cache.put(cache.key("f" * 64, "pdf", 1), "y" * 100)
+
+    assert [cache.get(key) is not None for key in keys] == [True, False, False, False]
+
+
+def test_size_is_tracked_across_overwrites(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1000)
+    key = cache.key("ee" * 32, "pdf", 1)
+    for length in (600, 300, 900):
+        cache.put(key, "z" * length)
+    assert cache._size == 900
+    assert cache.get(key) == "z" * 900
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://Example.com:443/docs/#intro") == "https://example.com/docs"
+    assert normalize_url("http://example.com:8080/a?b=1") == "http://example.com:8080/a?b=1"
@@ -0,0 +1,98 @@
+import io
+import os
+
+import pytest
+
+from file_detection import HEADER_BYTES, detect, read_header, sniff
+
+
+def _iso(brand):
+    return b"\x00\x00\x00\x20ftyp" + brand + b"\x00\x00\x02\x00isomiso2mp41" + bytes(16)
+
+
+def _riff(form):
+    return b"RIFF\x24\x00\x00\x00" + form + bytes(32)
+
+
+SAMPLES = {
+    "pdf": [("doc.pdf", b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")],
+    "image": [("a.png", b"\x89PNG\r\n\x1a\n" + bytes(24)), ("a.jpg", b"\xff\xd8\xff\xe0\x00\x10JFIF" + bytes(8)),
+              ("a.gif", b"GIF89a" + bytes(16)), ("a.bmp", b"BM\x36\x00\x0c\x00\x00\x00\x00\x00" + bytes(16)),
+              ("a.webp", _riff(b"WEBP")), ("a.tiff", b"II*\x00" + bytes(16)), ("a.heic", _iso(b"heic")),
+              ("a.svg", b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg"></svg>')],
+    "audio": [("a.mp3", b"ID3\x04\x00" + bytes(16)), ("b.mp3", b"\xff\xfb\x90\x64" + bytes(16)),
+              ("a.wav", _riff(b"WAVE")), ("a.flac", b"fLaC" + bytes(16)), ("a.ogg", b"OggS" + bytes(16)),
+              ("a.m4a", _iso(b"M4A ")), ("b.m4a", _iso(b"isom")), ("a.aiff", b"FORM\x00\x00\x10\x00AIFF" + bytes(8)),
+              ("a.aac", b"\xff\xf1\x50\x80" + bytes(16))],
+    "video": [("a.mp4", _iso(b"isom")), ("a.mov", _iso(b"qt  ")), ("b.mov", b"\x00\x00\x00\x08wide" + bytes(16)),
+              ("a.3gp", _iso(b"3gp5")), ("a.mkv", b"\x1a\x45\xdf\xa3" + bytes(16)), ("a.avi", _riff(b"AVI ")),
+              ("a.flv", b"FLV\x01\x05" + bytes(16)), ("a.mpg", b"\x00\x00\x01\xba" + bytes(16))],
+}
+
+
+def _sniffed_corpus():
+    """(name, content, expected kind) for every sniffed format, under its
+    own name, renamed to .bin and without an extension"""
+    corpus = []
+    for expected, files in SAMPLES.items():
+        for (name, content) in files:
+            (base, ext) = os.path.splitext(name)
+            # only the extension tells audio-only MP4 with a generic brand from video
+            renamed = "video" if content == _iso(b"isom") else expected
+            corpus += [(name, content, expected), (f"{base}_renamed.bin", content, renamed),
+                       (f"{base}_{ext[1:]}_no_extension", content, renamed)]
+    return corpus
+
+
+# content sniffing finds nothing, so names decide
+NAMED = [("notes.txt", b"Lecture notes, not a link", None), ("readme", b"plain text", None),
+         ("empty.pdf", b"", "pdf"), ("cover.png", b"not really a png", "image"),
+         ("I'm free.txt", b"I'm free to go", None), ("example.txt", b"example.txt", None),
+         ("lecture.mp4.txt", b"transcript", None)]
+
+URLS = ["https://example.com", "http://example.org/notes.txt", "www.example.edu/course?id=3#week2",
+        "http://localhost:8000/slides", "localhost/page", "https://example.com/paper.pdf"]
+
+
+@pytest.mark.parametrize(("name", "content", "expected"), _sniffed_corpus() + NAMED)
+def test_files_on_disk(tmp_path, name, content, expected):
+    path = tmp_path / name
+    path.write_bytes(content)
+    with open(path, "rb") as f:
+        assert detect(name, read_header(f)) == expected
+        assert f.tell() == 0
+
+
+@pytest.mark.parametrize(("name", "content", "expected"), _sniffed_corpus() + NAMED)
+def test_in_memory_uploads(name, content, expected):
+    buffer = io.BytesIO(content)
+    buffer.name = name
+    assert detect(buffer.name, read_header(buffer)) == expected
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_urls(url):
+    buffer = io.BytesIO(url.encode("utf-8"))
+    assert detect(url, read_header(buffer)) == "weblink"
+
+
+def test_read_header_keeps_the_position():
+    buffer = io.BytesIO(bytes(range(256)) * 4)
+    buffer.seek(100)
+    assert read_header(buffer) == (bytes(range(256)) * 4)[:HEADER_BYTES]
+    assert buffer.tell() == 100
+
+
+def test_read_header_of_unreadable_files_is_empty(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("text")
+    with open(path, "r", encoding="utf-8") as f:
+        assert read_header(f) == b""
+    assert read_header(object()) == b""
+
+
+def test_sniff_short_or_unknown_headers():
+    assert sniff(b"") is None
+    assert sniff(b"RIFF") is None
+    assert sniff(_riff(b"XXXX")) is None
+    assert sniff(_iso(b"isom")) == "media"
@@ -0,0 +1,143 @@
+import sqlite3
+
+import pytest
+
+from graph_writer import (GraphWriter, SQLiteGraphBackend, document_key, normalize_name, normalize_relation,
+                          normalize_type)
+
+
+class RecordingBackend(SQLiteGraphBackend):
+    """SQLite backend that records the size of every batch it is given"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.batches = []
+
+    def merge_nodes(self, rows):
+        self.batches.append(("nodes", len(rows)))
+        super().merge_nodes(rows)
+
+    def merge_relationships(self, relation, rows):
+        self.batches.append((relation, len(rows)))
+        super().merge_relationships(relation, rows)
+
+
+def _write_document(writer, source, document_id, names, relation="RELATED_TO"):
+    keys = [writer.add_node(name, "Concept") for name in names]
+    for subj, obj in zip(names, names[1:]):
+        writer.add_relationship(subj, obj, relation, source)
+    writer.add_document(document_id, source, keys)
+
+
+def _relationships(store):
+    return {(subj, obj, relation): sources for (subj, obj, relation, sources)
+            in store.conn.execute("SELECT subj, obj, type, sources FROM relationships")}
+
+
+def test_normalization():
+    assert normalize_name('  "Alan   Turing" ') == normalize_name("alan turing")
+    assert normalize_relation("works for") == "WORKS_FOR"
+    assert normalize_relation("--") == "RELATED_TO"
+    assert normalize_type("programming language") == "ProgrammingLanguage"
+    assert normalize_type("") == "Entity"
+
+
+def test_document_key_separates_sources_with_the_same_content():
+    assert document_key("a.txt", "id") != document_key("b.txt", "id")
+    assert document_key("a.txt", "id") == document_key("a.txt", "id")
+
+
+def test_writing_the_same_graph_twice_changes_nothing(tmp_path):
+    store = SQLiteGraphBackend(str(tmp_path / "graph.sqlite3"))
+    writer = GraphWriter(store)
+    for _ in range(2):
+        _write_document(writer, "a.txt", "id", ["Alice", "Bob", "Carol"])
+        writer.flush()
+
+    assert store.counts() == {"nodes": 3, "relationships": 2, "documents": 1, "mentions": 3}
+    assert set(_relationships(store).values()) == {'["a.txt"]'}
+    store.close()
+
+
+def test_names_differing_in_case_and_quotes_are_one_node(tmp_path):
+    store = SQLiteGraphBackend(str(tmp_path / "graph.sqlite3"))
+    writer = GraphWriter(store)
+    _write_document(writer, "a.txt", "1", ["Alice", "Bob"])
+    _write_document(writer, "b.txt", "2", ["'alice'", "BOB"])
+    writer.flush()
+
+    assert store.counts()["nodes"] == 2
+    assert _relationships(store) == {("alice", "bob", "RELATED_TO"): '["a.txt", "b.txt"]'}
+    store.close()
+
+
+def test_rows_are_flushed_in_batches(tmp_path):
+    store = RecordingBackend(str(tmp_path / "graph.sqlite3"))
+    writer = GraphWriter(store, batch_size=4)
+    names = [f"Node{index}" for index in range(10)]
+    _write_document(writer, "a.txt", "id", names)
+
+    assert writer.full
+    writer.flush()
+
+    assert [size for (kind, size) in store.batches if kind == "nodes"] == [4, 4, 2]
+    assert [size for (kind, size) in store.batches if kind == "RELATED_TO"] == [4, 4, 1]
+    assert store.counts()["nodes"] == 10
+    assert not writer.full and writer.pending_sources == set()
+    store.close()
+
+
+def test_failed_flush_keeps_the_buffer(tmp_path, monkeypatch):
+    store = SQLiteGraphBackend(str(tmp_path / "graph.sqlite3"))
+    writer = GraphWriter(store)
+    _write_document(writer, "a.txt", "id", ["Alice", "Bob"])
+
+    def locked(rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "merge_nodes", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            writer.flush()
+    assert writer.pending_sources == {"a.txt"}
+
+    writer.flush()
+    assert store.counts() == {"nodes": 2, "relationships": 1, "documents": 1, "mentions": 2}
+    store.close()
+
+
+def test_remove_sources_keeps_what_other_sources_use(tmp_path):
+    store = SQLiteGraphBackend(str(tmp_path / "graph.sqlite3"))
+    writer = GraphWriter(store)
+    _write_document(writer, "a.txt", "1", ["Alice", "Bob", "Carol"])
+    _write_document(writer, "b.txt", "2", ["Bob", "Carol", "Dave"])
+    writer.flush()
+
+    store.remove_sources(["a.txt"])
+
+    assert {row[0] for row in store.conn.execute("SELECT key FROM nodes")} == {"bob", "carol", "dave"}
+    assert _relationships(store) == {("bob", "carol", "RELATED_TO"): '["b.txt"]',
+                                     ("carol", "dave", "RELATED_TO"): '["b.txt"]'}
+    assert {row[0] for row in store.conn.execute("SELECT source FROM documents")} == {"b.txt"}
+
+    store.remove_sources(["b.txt"])
+    assert store.counts() == {"nodes": 0, "relationships": 0, "documents": 0, "mentions": 0}
+    store.close()
+
+
+def test_documents_keyed_on_their_id_are_migrated(tmp_path):
+    path = str(tmp_path / "graph.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE documents (id TEXT PRIMARY KEY, source TEXT);
+        CREATE TABLE mentions (document TEXT NOT NULL, node TEXT NOT NULL, PRIMARY KEY (document, node));
+        INSERT INTO documents VALUES ('id', 'a.txt');
+        INSERT INTO mentions VALUES ('id', 'alice');
+    """)
+    conn.close()
+
+    store = SQLiteGraphBackend(path)
+
+    assert store.conn.execute("SELECT key, id, source FROM documents").fetchall() == [(document_key("a.txt", "id"), "id", "a.txt")]
+    assert store.conn.execute("SELECT document FROM mentions").fetchall() == [(document_key("a.txt", "id"),)]
+    store.close()
@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from PIL import Image
+
+import image_captioning
+from extraction_cache import ExtractionCache
+from image_captioning import CaptionError, ImageCaptioner, StubCaptioner, prepare_image, split_batch_caption
+
+
+def _png(width, height, color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(image_captioning, "RETRY_BACKOFF", 0)
+
+
+def test_prepare_image_downscales_the_longest_side_to_a_jpeg():
+    image = prepare_image(_png(3000, 1500), max_side=1024)
+    assert image.format == "JPEG"
+    assert image.size == (1024, 512)
+
+
+def test_prepare_image_keeps_small_images_at_their_size():
+    assert prepare_image(_png(200, 100)).size == (200, 100)
+
+
+def test_captions_come_back_in_input_order():
+    captioner = ImageCaptioner(StubCaptioner(), max_side=100)
+    assert captioner.caption_bytes([_png(300, 150), _png(40, 80)]) == ["A 100x50 image.", "A 40x80 image."]
+
+
+def test_images_are_packed_per_request_and_duplicates_sent_once():
+    backend = StubCaptioner()
+    images = [_png(10 + index, 10) for index in range(5)]
+    captioner = ImageCaptioner(backend, images_per_request=2, max_concurrency=1)
+
+    captions = captioner.caption_bytes(images + [images[0]])
+
+    assert backend.calls == [2, 2, 1]
+    assert captions[-1] == captions[0] == "A 10x10 image."
+
+
+def test_cached_captions_are_not_requested_again(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    images = [_png(20, 20), _png(30, 30)]
+    ImageCaptioner(StubCaptioner(), cache=cache).caption_bytes(images)
+
+    backend = StubCaptioner()
+    captions = ImageCaptioner(backend, cache=cache).caption_bytes(images + [_png(40, 40)])
+
+    assert backend.calls == [1]
+    assert captions == ["A 20x20 image.", "A 30x30 image.", "A 40x40 image."]
+
+
+def test_a_different_max_side_does_not_reuse_cached_captions(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    ImageCaptioner(StubCaptioner(), cache=cache, max_side=1024).caption_bytes([_png(2000, 2000)])
+
+    backend = StubCaptioner()
+    assert ImageCaptioner(backend, cache=cache, max_side=512).caption_bytes([_png(2000, 2000)]) == ["A 512x512 image."]
+    assert backend.calls == [1]
+
+
+def test_failed_requests_are_retried():
+    backend = StubCaptioner(fail_attempts=2)
+    assert ImageCaptioner(backend, max_retries=2).caption_bytes([_png(10, 10)]) == ["A 10x10 image."]
+    assert backend.calls == [1, 1, 1]
+
+
+def test_a_request_failing_every_retry_raises():
+    with pytest.raises(CaptionError, match="after 1 retries"):
+        ImageCaptioner(StubCaptioner(fail_attempts=5), max_retries=1).caption_bytes([_png(10, 10)])
+
+
+def test_caption_paths_reads_files(tmp_path):
+    path = tmp_path / "slide.png"
+    path.write_bytes(_png(64, 48))
+    assert ImageCaptioner(StubCaptioner()).caption_paths([str(path)]) == ["A 64x48 image."]
+
+
+def test_split_batch_caption_needs_one_section_per_image():
+    text = "### Image 1\nA chart.\n\n### Image 2:\nA table.\n"
+    assert split_batch_caption(text, 2) == ["A chart.", "A table."]
+    assert split_batch_caption(text, 3) is None
+    assert split_batch_caption("### Image 2\nA table.\n### Image 1\nA chart.", 2) is None
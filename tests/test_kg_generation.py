@@ -0,0 +1,183 @@
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("camel")
+
+import kg_generation
+from graph_writer import GraphWriter, SQLiteGraphBackend, document_key
+from kg_generation import KG_MANIFEST_NAME, FakeKGBackend, KGGenerator, content_id
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(kg_generation, "RETRY_BACKOFF", 0)
+
+
+def _write(directory, name, text):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def _generator(tmp_path, backend=None, **kwargs):
+    store = SQLiteGraphBackend(str(tmp_path / "graph.sqlite3"))
+    return KGGenerator(backend=backend or FakeKGBackend(), writer=GraphWriter(store), **kwargs), store
+
+
+def _node_ids(store):
+    return {row[0] for row in store.conn.execute("SELECT id FROM nodes")}
+
+
+def _sources(store):
+    return {row[0] for row in store.conn.execute("SELECT source FROM documents")}
+
+
+def test_fake_backend_links_capitalized_words_in_order():
+    element = FakeKGBackend().extract("Alice met Bob and then Alice met Carol.", "id")
+
+    assert [node.id for node in element.nodes] == ["Alice", "Bob", "Carol"]
+    assert {node.type for node in element.nodes} == {"Concept"}
+    assert [(r.subj.id, r.obj.id) for r in element.relationships] == [("Alice", "Bob"), ("Bob", "Carol")]
+    assert element.source.id == "id"
+
+
+def test_fake_backend_fails_the_requested_number_of_times():
+    backend = FakeKGBackend(fail_attempts={"id": 2})
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            backend.extract("Alice", "id")
+    assert backend.extract("Alice", "id").nodes[0].id == "Alice"
+    assert backend.calls == ["id", "id", "id"]
+
+
+def test_documents_are_written_to_the_graph(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    first = _write(save_dir, "a.txt", "Alice knows Bob.")
+    second = _write(save_dir, "b.txt", "Carol knows Dave.")
+    generator, store = _generator(tmp_path)
+
+    result = generator.generate_kg(str(save_dir))
+
+    assert not result.failed
+    assert {document.name for document in result.documents} == {first, second}
+    assert _node_ids(store) == {"Alice", "Bob", "Carol", "Dave"}
+    assert store.counts()["relationships"] == 2
+    assert _sources(store) == {first, second}
+    keys = {row[0] for row in store.conn.execute("SELECT key FROM documents")}
+    assert document_key(first, content_id("Alice knows Bob.")) in keys
+    assert os.path.exists(save_dir / KG_MANIFEST_NAME)
+
+
+def test_unchanged_sources_are_skipped(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    _write(save_dir, "a.txt", "Alice knows Bob.")
+    backend = FakeKGBackend()
+    generator, store = _generator(tmp_path, backend)
+    generator.generate_kg(str(save_dir))
+    calls = len(backend.calls)
+
+    result = generator.generate_kg(str(save_dir))
+
+    assert result.documents == []
+    assert result.unchanged == 1
+    assert len(backend.calls) == calls
+
+
+def test_changed_source_replaces_its_graph(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    path = _write(save_dir, "a.txt", "Alice knows Bob.")
+    _write(save_dir, "b.txt", "Carol knows Dave.")
+    generator, store = _generator(tmp_path)
+    generator.generate_kg(str(save_dir))
+
+    _write(save_dir, "a.txt", "Erin knows Frank and Gina.")
+    result = generator.generate_kg(str(save_dir))
+
+    assert [document.name for document in result.documents] == [path]
+    assert result.unchanged == 1
+    assert _node_ids(store) == {"Carol", "Dave", "Erin", "Frank", "Gina"}
+    assert store.counts()["documents"] == 2
+
+
+def test_deleted_source_is_removed(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    path = _write(save_dir, "a.txt", "Alice knows Bob.")
+    _write(save_dir, "b.txt", "Bob knows Carol.")
+    generator, store = _generator(tmp_path)
+    generator.generate_kg(str(save_dir))
+
+    os.remove(path)
+    result = generator.generate_kg(str(save_dir))
+
+    assert result.removed == 1
+    # Bob is still mentioned by b.txt, Alice by nothing
+    assert _node_ids(store) == {"Bob", "Carol"}
+    assert _sources(store) == {str(save_dir / "b.txt")}
+
+
+def test_failed_extraction_is_retried(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    _write(save_dir, "a.txt", "Alice knows Bob.")
+    backend = FakeKGBackend(fail_attempts={content_id("Alice knows Bob."): 2})
+    generator, store = _generator(tmp_path, backend, max_retries=2)
+
+    result = generator.generate_kg(str(save_dir))
+
+    assert not result.failed
+    assert len(backend.calls) == 3
+    assert _node_ids(store) == {"Alice", "Bob"}
+
+
+def test_document_failing_every_retry_is_reported_and_not_recorded(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    path = _write(save_dir, "a.txt", "Alice knows Bob.")
+    backend = FakeKGBackend(fail_attempts={content_id("Alice knows Bob."): 5})
+    generator, store = _generator(tmp_path, backend, max_retries=1)
+
+    result = generator.generate_kg(str(save_dir))
+
+    assert [document.name for document in result.failed] == [path]
+    assert store.counts()["nodes"] == 0
+    # not in the manifest, so the next run tries it again
+    assert [document.name for document in generator.generate_kg(str(save_dir)).documents] == [path]
+
+
+def test_long_document_is_extracted_in_chunks_and_merged(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    text = " ".join(f"Alice met Bob{'x' * (index % 3)} near Paris." for index in range(200))
+    _write(save_dir, "a.txt", text)
+    backend = FakeKGBackend()
+    generator, store = _generator(tmp_path, backend, chunk_threshold=100, chunk_tokens=100, overlap_tokens=10)
+
+    result = generator.generate_kg(str(save_dir))
+
+    assert not result.failed
+    assert len(backend.calls) > 1
+    assert content_id(text) not in backend.calls
+    assert store.counts()["documents"] == 1
+    assert {"Alice", "Paris"} <= _node_ids(store)
+
+
+def test_document_seconds_are_measured_from_its_own_start(tmp_path):
+    save_dir = tmp_path / "uploads"
+    save_dir.mkdir()
+    for index in range(4):
+        _write(save_dir, f"{index}.txt", f"Alice knows Bob number {index}.")
+    generator, _ = _generator(tmp_path, FakeKGBackend(delay=0.1), refine_workers=1, extract_workers=1)
+
+    result = generator.generate_kg(str(save_dir))
+
+    # each document takes a refine and an extract; measured from the run
+    # start, the last one would also count the three refines before it
+    assert all(0.2 <= document.seconds < 0.4 for document in result.documents)
+    assert result.seconds >= 0.5
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+import qa_generation
+from qa_generation import FakeQABackend, QAGenerationError, QAGenerator, parse_qa_pairs
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(qa_generation, "RETRY_BACKOFF", 0)
+
+
+class ScriptedBackend:
+    """Returns the given responses in turn; an exception in the list is raised instead"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate(self, text):
+        response = self.responses[min(self.calls, len(self.responses) - 1)]
+        self.calls += 1
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_object():
+    assert parse_qa_pairs('{"What is 2+2?": "4", " Who? ": " Me "}') == [("What is 2+2?", "4"), ("Who?", "Me")]
+
+
+def test_parse_list_of_objects():
+    text = json.dumps([{"question": "Why?", "answer": "Because."}, {"question": "How?", "answer": "Slowly."}])
+    assert parse_qa_pairs(text) == [("Why?", "Because."), ("How?", "Slowly.")]
+
+
+def test_parse_fenced_response_with_a_fence_inside_an_answer():
+    answer = "Use ```print(1)``` in a cell."
+    text = f"Here you go:\n```json\n{json.dumps({'How do I print?': answer})}\n```\nAnything else?"
+    assert parse_qa_pairs(text) == [("How do I print?", answer)]
+
+
+def test_parse_skips_bracketed_prose_before_the_json():
+    text = 'As noted in [1] and [see below], the pairs are: {"What is it?": "A test."} Hope this helps [2].'
+    assert parse_qa_pairs(text) == [("What is it?", "A test.")]
+
+
+def test_parse_skips_entries_that_are_not_pairs():
+    text = json.dumps([{"question": "Kept?", "answer": "Yes."}, {"question": "Empty?", "answer": " "},
+                       {"question": "Number?", "answer": 4}, {"question": "Bool?", "answer": True}, "stray"])
+    assert parse_qa_pairs(text) == [("Kept?", "Yes."), ("Number?", "4")]
+
+
+@pytest.mark.parametrize("text", ["", "I cannot help with that.", "```json\n{not json}\n```", "[1, 2, 3]"])
+def test_parse_without_qa_json_raises(text):
+    with pytest.raises(QAGenerationError):
+        parse_qa_pairs(text)
+
+
+def test_generate_writes_pairs_with_their_chunk(tmp_path):
+    output = tmp_path / "qa.jsonl"
+    text = "The sun is a star. Water boils at one hundred degrees. Cats are small mammals."
+
+    result = QAGenerator(FakeQABackend()).generate(text, str(output))
+
+    pairs = _read(output)
+    assert (result.chunks, result.failed_chunks, result.pairs, result.duplicates) == (1, 0, 3, 0)
+    assert [pair["answer"] for pair in pairs] == ["The sun is a star.", "Water boils at one hundred degrees.",
+                                                  "Cats are small mammals."]
+    assert {pair["chunk"] for pair in pairs} == {0}
+
+
+def test_generate_drops_questions_asked_before(tmp_path):
+    output = tmp_path / "qa.jsonl"
+    response = json.dumps({"What is the capital of France?": "Paris.", "What's the capital of France?": "Paris!",
+                           "What is the capital of Spain?": "Madrid."})
+
+    result = QAGenerator(ScriptedBackend([response]), dedup="minhash").generate("Some text.", str(output))
+
+    assert [pair["question"] for pair in _read(output)] == ["What is the capital of France?", "What is the capital of Spain?"]
+    assert (result.pairs, result.duplicates) == (2, 1)
+
+
+def test_unparseable_response_is_retried_and_counted(tmp_path):
+    output = tmp_path / "qa.jsonl"
+    backend = ScriptedBackend(["Sorry, let me think.", RuntimeError("timeout"), '{"Why?": "Because."}'])
+
+    result = QAGenerator(backend, max_retries=2).generate("Some text.", str(output))
+
+    assert backend.calls == 3
+    assert (result.failed_chunks, result.pairs, result.parse_failures) == (0, 1, 1)
+
+
+def test_chunk_failing_every_retry_is_skipped_and_counted(tmp_path):
+    output = tmp_path / "qa.jsonl"
+    backend = ScriptedBackend(["no json here"])
+
+    result = QAGenerator(backend, max_retries=2).generate("Some text.", str(output))
+
+    assert backend.calls == 3
+    assert (result.chunks, result.failed_chunks, result.pairs, result.parse_failures) == (1, 1, 0, 3)
+    assert _read(output) == []
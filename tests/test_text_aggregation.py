@@ -0,0 +1,44 @@
+import os
+
+from text_aggregation import CONCATENATED_NAME, concatenate_texts, source_names
+
+
+def _write(directory, name, text):
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_custom_output_name_is_not_concatenated_into_itself(tmp_path):
+    _write(tmp_path, "a.pdf.txt", "alpha")
+    _write(tmp_path, "b.mp3.txt", "beta")
+
+    first = _read(concatenate_texts(str(tmp_path), output_name="all.txt"))
+    second = _read(concatenate_texts(str(tmp_path), output_name="all.txt"))
+
+    assert second == first
+    assert first.count("alpha") == 1 and first.count("beta") == 1
+    assert "all.txt" not in first
+
+
+def test_new_source_is_appended_under_custom_name(tmp_path):
+    _write(tmp_path, "a.pdf.txt", "alpha")
+    concatenate_texts(str(tmp_path), output_name="all.txt")
+    _write(tmp_path, "c.png.txt", "gamma")
+
+    text = _read(concatenate_texts(str(tmp_path), output_name="all.txt"))
+
+    assert text.count("alpha") == 1 and text.count("gamma") == 1
+
+
+def test_aggregates_are_not_sources_of_each_other(tmp_path):
+    _write(tmp_path, "a.pdf.txt", "alpha")
+    concatenate_texts(str(tmp_path), output_name="all.txt")
+    concatenate_texts(str(tmp_path))
+
+    assert source_names(str(tmp_path)) == ["a.pdf.txt"]
+    assert _read(os.path.join(tmp_path, CONCATENATED_NAME)).count("alpha") == 1
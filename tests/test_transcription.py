@@ -0,0 +1,83 @@
+import pytest
+
+import transcription
+from transcription import (AudioChunk, ChunkedTranscriber, StubSpeechToText, TranscriptionError, plan_chunks,
+                           stitch_transcripts)
+
+TRANSCRIPT = " ".join(f"w{index}" for index in range(700))  # one word per second of a 700s recording
+
+
+def _chunks(spans):
+    return [AudioChunk(index, start, end, f"chunk_{index:04}.mp3", overlap) for index, (start, end, overlap) in enumerate(spans)]
+
+
+def _transcribe(spans, backend, **kwargs):
+    chunks = _chunks(spans)
+    texts = ChunkedTranscriber(backend, window=300, overlap=5, **kwargs).transcribe_chunks(chunks)
+    return stitch_transcripts(texts, [chunk.overlap for chunk in chunks])
+
+
+def test_fixed_windows_overlap_the_previous_one():
+    assert plan_chunks(700, window=300, overlap=5) == [(0.0, 300, 0.0), (295, 595, 5), (590, 700, 5)]
+
+
+def test_window_ends_in_a_pause_without_overlap():
+    spans = plan_chunks(700, window=300, overlap=5, silences=[(280.0, 282.0), (560.0, 561.0)])
+    assert spans == [(0.0, 281.0, 0.0), (281.0, 560.5, 0.0), (560.5, 700, 0.0)]
+
+
+def test_pause_outside_the_search_range_is_ignored():
+    # the last SILENCE_SEARCH of a 300s window starts at 240s
+    assert plan_chunks(700, window=300, overlap=5, silences=[(100.0, 101.0)])[0] == (0.0, 300, 0.0)
+
+
+def test_stitching_drops_words_repeated_by_the_overlap():
+    assert stitch_transcripts(["one two three four five", "three four five six seven"], [0, 5]) == \
+        "one two three four five six seven"
+
+
+def test_stitching_keeps_punctuation_after_the_repeated_words():
+    assert stitch_transcripts(["so the cache is warm", "the cache is warm, then"], [0, 2]) == \
+        "so the cache is warm then"
+
+
+def test_stitching_keeps_repeats_across_a_pause():
+    assert stitch_transcripts(["and then we", "and then we stop"], [0, 0]) == "and then we and then we stop"
+
+
+def test_stitching_ignores_chance_matches_below_the_minimum():
+    assert stitch_transcripts(["it is", "it is here"], [0, 1]) == "it is it is here"
+
+
+def test_stub_chunks_stitch_back_into_the_transcript():
+    spans = plan_chunks(700, window=300, overlap=5)
+    assert _transcribe(spans, StubSpeechToText(TRANSCRIPT, 700)) == TRANSCRIPT
+
+
+def test_stub_chunks_cut_at_pauses_stitch_back_into_the_transcript():
+    spans = plan_chunks(700, window=300, overlap=5, silences=[(280.0, 282.0), (560.0, 561.0)])
+    assert _transcribe(spans, StubSpeechToText(TRANSCRIPT, 700)) == TRANSCRIPT
+
+
+def test_only_failed_chunks_are_retried(monkeypatch):
+    monkeypatch.setattr(transcription, "RETRY_BACKOFF", 0)
+    backend = StubSpeechToText(TRANSCRIPT, 700, fail_attempts={1: 2})
+    spans = plan_chunks(700, window=300, overlap=5)
+
+    assert _transcribe(spans, backend, max_retries=2) == TRANSCRIPT
+    assert sorted(backend.calls) == [0, 1, 1, 1, 2]
+
+
+def test_chunk_failing_every_retry_raises(monkeypatch):
+    monkeypatch.setattr(transcription, "RETRY_BACKOFF", 0)
+    backend = StubSpeechToText(TRANSCRIPT, 700, fail_attempts={2: 3})
+
+    with pytest.raises(TranscriptionError, match=r"Chunks \[2\]"):
+        _transcribe(plan_chunks(700, window=300, overlap=5), backend, max_retries=2)
+
+
+def test_progress_counts_finished_chunks():
+    reports = []
+    chunks = _chunks(plan_chunks(700, window=300, overlap=5))
+    ChunkedTranscriber(StubSpeechToText(TRANSCRIPT, 700)).transcribe_chunks(chunks, lambda done, total: reports.append((done, total)))
+    assert reports == [(1, 3), (2, 3), (3, 3)]
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+
+logger = logging.getLogger(__name__)
+
+CONCATENATED_NAME = "concatenated.txt"
+# Files built from other outputs; never read back in as sources. Any other
+# output is recognized by the manifest next to it (see manifest_name).
+AGGREGATE_OUTPUTS = {CONCATENATED_NAME}
+COPY_CHUNK_SIZE = 1024 * 1024
+SEPARATOR = b"\n"
+
+
+@dataclass
+class Segment:
+    name: str          # source file name inside the directory
+    size: int          # source size and mtime when it was copied, to skip hashing unchanged files
+    mtime_ns: int
+    sha256: str
+    offset: int        # where the segment (header + text) starts in the output
+    length: int
+
+
+def _header(directory: str, name: str) -> bytes:
+    return f"{os.path.join(directory, name)}: \n".encode("utf-8")
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_name(output_name: str) -> str:
+    """Hidden manifest kept next to an aggregate, e.g. .concatenated.json"""
+    return f".{os.path.splitext(output_name)[0]}.json"
+
+
+MANIFEST_NAME = manifest_name(CONCATENATED_NAME)
+
+
+def source_names(directory: str, output_name: str = CONCATENATED_NAME) -> list[str]:
+    """Text outputs in directory that feed the aggregate: every .txt file
+    except output_name and other aggregates, whether built under the default
+    name or a custom one"""
+    listing = set(os.listdir(directory))
+    return sorted(name for name in listing
+                  if name.endswith(".txt") and name != output_name and name not in AGGREGATE_OUTPUTS
+                  and manifest_name(name) not in listing and os.path.isfile(os.path.join(directory, name)))
+
+
+def _load_manifest(directory: str, output_name: str) -> list[Segment] | None:
+    """The segments of the existing output, or None when it cannot be trusted"""
+    output_path = os.path.join(directory, output_name)
+    try:
+        with open(os.path.join(directory, manifest_name(output_name)), "r", encoding="utf-8") as f:
+            segments = [Segment(**entry) for entry in json.load(f)["segments"]]
+        output_size = os.path.getsize(output_path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    expected = segments[-1].offset + segments[-1].length if segments else 0
+    return segments if output_size == expected else None
+
+
+def _save_manifest(directory: str, output_name: str, segments: list[Segment]):
+    path = os.path.join(directory, manifest_name(output_name))
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"segments": [asdict(segment) for segment in segments]}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class _Writer:
+    """Appends segments to an open output, tracking offsets"""
+
+    def __init__(self, output, offset: int):
+        self.output = output
+        self.offset = offset
+
+    def _start(self) -> int:
+        if self.offset:
+            self.output.write(SEPARATOR)
+            self.offset += len(SEPARATOR)
+        return self.offset
+
+    def copy_source(self, directory: str, name: str) -> Segment:
+        path = os.path.join(directory, name)
+        stat = os.stat(path)
+        start = self._start()
+        header = _header(directory, name)
+        self.output.write(header)
+        digest = hashlib.sha256()
+        length = len(header)
+        with open(path, "rb") as source:
+            for block in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+                digest.update(block)
+                self.output.write(block)
+                length += len(block)
+        self.offset += length
+        return Segment(name, stat.st_size, stat.st_mtime_ns, digest.hexdigest(), start, length)
+
+    def copy_segment(self, previous, segment: Segment) -> Segment:
+        start = self._start()
+        previous.seek(segment.offset)
+        remaining = segment.length
+        while remaining:
+            block = previous.read(min(COPY_CHUNK_SIZE, remaining))
+            if not block:
+                raise OSError(f"{segment.name} is truncated in the previous output")
+            self.output.write(block)
+            remaining -= len(block)
+        self.offset += segment.length
+        return Segment(segment.name, segment.size, segment.mtime_ns, segment.sha256, start, segment.length)
+
+
+def concatenate_texts(directory: str, output_name: str = CONCATENATED_NAME) -> str:
+    """Concatenate every text output in directory into output_name, streaming
+    one file at a time. A manifest next to the output records each source's
+    size, mtime, hash and position. If sources were only added, they are
+    appended; if any changed or disappeared, the output is rebuilt by copying
+    the unchanged segments from the previous output. With nothing changed,
+    only the directory listing and a stat per file are done."""
+    output_path = os.path.join(directory, output_name)
+    names = source_names(directory, output_name)
+    manifest = _load_manifest(directory, output_name)
+    # an output without a trustworthy manifest is rebuilt from the sources
+    segments = manifest if manifest is not None else []
+    by_name = {segment.name: segment for segment in segments}
+
+    unchanged = set()
+    touched = False
+    for name in names:
+        segment = by_name.get(name)
+        if segment is None:
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        if (stat.st_size, stat.st_mtime_ns) == (segment.size, segment.mtime_ns):
+            unchanged.add(name)
+        elif stat.st_size == segment.size and _hash_file(os.path.join(directory, name)) == segment.sha256:
+            # touched but not changed
+            segment.mtime_ns = stat.st_mtime_ns
+            unchanged.add(name)
+            touched = True
+
+    present = set(names)
+    new_names = [name for name in names if name not in by_name]
+    if manifest is not None and all(segment.name in unchanged for segment in segments):
+        if new_names:
+            with open(output_path, "ab") as output:
+                writer = _Writer(output, segments[-1].offset + segments[-1].length if segments else 0)
+                segments.extend(writer.copy_source(directory, name) for name in new_names)
+        if new_names or touched:
+            _save_manifest(directory, output_name, segments)
+        logger.info(f"{output_path}: appended {len(new_names)} files, {len(segments) - len(new_names)} unchanged")
+        return output_path
+
+    # rebuild in the previous order, changed files in place and new ones at the end
+    rebuilt = []
+    partial_path = f"{output_path}.part"
+    with open(partial_path, "wb") as output:
+        writer = _Writer(output, 0)
+        previous = open(output_path, "rb") if segments else None
+        try:
+            for segment in segments:
+                if segment.name in unchanged:
+                    rebuilt.append(writer.copy_segment(previous, segment))
+                elif segment.name in present:
+                    rebuilt.append(writer.copy_source(directory, segment.name))
+            for name in new_names:
+                rebuilt.append(writer.copy_source(directory, name))
+        finally:
+            if previous is not None:
+                previous.close()
+    os.replace(partial_path, output_path)
+    _save_manifest(directory, output_name, rebuilt)
+    changed = sum(1 for segment in segments if segment.name in present and segment.name not in unchanged)
+    removed = sum(1 for segment in segments if segment.name not in present)
+    logger.info(f"{output_path}: rebuilt with {len(unchanged)} unchanged, {changed} changed, "
+                f"{removed} removed and {len(new_names)} new files")
+    return output_path
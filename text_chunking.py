@@ -0,0 +1,93 @@
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = 2000              # tokens per chunk sent to a model
+OVERLAP_TOKENS = 200             # tokens repeated at the start of the next chunk, so facts on a boundary are seen whole
+ENCODING = "cl100k_base"
+
+_SENTENCE_RE = re.compile(r"[^\n.!?]*(?:[.!?]+[\"')\]]*|\n+|$)\s*")
+_TOKEN_ESTIMATE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class TextChunk:
+    index: int
+    start: int           # character offsets into the source text
+    end: int
+    text: str
+    tokens: int
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING)
+    except Exception as e:
+        logger.info(f"tiktoken unavailable ({e}), estimating token counts")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text with tiktoken when it is installed, otherwise an
+    estimate from words and punctuation that errs on the high side."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_ESTIMATE_RE.findall(text)) * 4 // 3
+
+
+def _units(text: str, max_tokens: int) -> list[tuple[int, int, int]]:
+    """(start, end, tokens) of the sentences and lines of text; a unit longer
+    than max_tokens is split further between words."""
+    units = []
+    for match in _SENTENCE_RE.finditer(text):
+        (start, end) = match.span()
+        if start == end:
+            continue
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            units.append((start, end, tokens))
+            continue
+        piece_start = start
+        piece_tokens = 0
+        for word in re.finditer(r"\S+\s*", text[start:end]):
+            word_tokens = count_tokens(word.group())
+            if piece_tokens and piece_tokens + word_tokens > max_tokens:
+                units.append((piece_start, start + word.start(), piece_tokens))
+                (piece_start, piece_tokens) = (start + word.start(), 0)
+            piece_tokens += word_tokens
+        units.append((piece_start, end, piece_tokens))
+    return units
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS) -> list[TextChunk]:
+    """Split text into chunks of at most max_tokens on sentence or line
+    boundaries. Each chunk after the first starts with the last sentences of
+    the previous one, up to overlap_tokens of them."""
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    units = _units(text, max_tokens)
+    chunks = []
+    first = 0
+    while first < len(units):
+        last = first
+        tokens = 0
+        while last < len(units) and (last == first or tokens + units[last][2] <= max_tokens):
+            tokens += units[last][2]
+            last += 1
+        (start, end) = (units[first][0], units[last - 1][1])
+        chunks.append(TextChunk(len(chunks), start, end, text[start:end], tokens))
+        if last == len(units):
+            break
+        # step back over at most overlap_tokens of trailing units, but always move forward
+        next_first = last
+        carried = 0
+        while next_first - 1 > first and carried + units[next_first - 1][2] <= overlap_tokens:
+            next_first -= 1
+            carried += units[next_first][2]
+        first = next_first
+    return chunks
@@ -0,0 +1,242 @@
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SECONDS = 300              # target length of one transcription request
+OVERLAP_SECONDS = 5              # audio shared by neighbouring chunks cut outside a silence
+SILENCE_SEARCH = 0.2             # look for a silence in the last 20% of a window before cutting there
+SILENCE_NOISE_DB = -35           # level below which ffmpeg's silencedetect counts audio as silent
+SILENCE_MIN_SECONDS = 0.5        # shortest pause worth cutting at
+MAX_CONCURRENCY = 4              # chunks transcribed at the same time
+MAX_RETRIES = 3                  # extra attempts for chunks that failed
+RETRY_BACKOFF = 2                # seconds before the first retry, doubled every round
+MAX_OVERLAP_WORDS = 60           # longest run of repeated words removed when stitching
+MIN_OVERLAP_WORDS = 3            # shortest run that counts as repeated; one or two words match by chance
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_SILENCE_RE = re.compile(r"silence_(start|end): (-?\d+(?:\.\d+)?)")
+_WORD_RE = re.compile(r"\w+")
+
+
+class TranscriptionError(Exception):
+    pass
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    start: float
+    end: float
+    path: str
+    overlap: float = 0.0         # seconds of audio shared with the previous chunk
+
+
+def _ffmpeg() -> str:
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def probe_duration(audio_path: str) -> float:
+    result = subprocess.run([_ffmpeg(), "-hide_banner", "-i", audio_path], capture_output=True, text=True)
+    match = _DURATION_RE.search(result.stderr)
+    if not match:
+        raise TranscriptionError(f"Unable to read duration of {audio_path}")
+    (hours, minutes, seconds) = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def detect_silences(audio_path: str, noise_db: float = SILENCE_NOISE_DB, min_seconds: float = SILENCE_MIN_SECONDS) -> list[tuple[float, float]]:
+    """(start, end) of every pause ffmpeg's silencedetect finds, in one streaming pass"""
+    result = subprocess.run(
+        [_ffmpeg(), "-hide_banner", "-nostats", "-i", audio_path, "-vn",
+         "-af", f"silencedetect=noise={noise_db}dB:d={min_seconds}", "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    silences = []
+    start = None
+    for kind, value in _SILENCE_RE.findall(result.stderr):
+        if kind == "start":
+            start = max(0.0, float(value))
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+
+def plan_chunks(duration: float, window: float = CHUNK_SECONDS, overlap: float = OVERLAP_SECONDS,
+                silences: list[tuple[float, float]] | None = None) -> list[tuple[float, float, float]]:
+    """Split [0, duration] into (start, end, overlap) windows, overlap being the
+    seconds shared with the previous window. A window ends in the middle of a
+    pause near its end when there is one (no overlap needed), otherwise at the
+    fixed length, with the next window starting `overlap` seconds earlier."""
+    spans = []
+    start = 0.0
+    previous_end = 0.0
+    while start < duration:
+        end = min(start + window, duration)
+        next_start = end - overlap
+        if end < duration and silences:
+            earliest = end - window * SILENCE_SEARCH
+            pauses = [(a + b) / 2 for (a, b) in silences if earliest <= (a + b) / 2 <= end]
+            if pauses:
+                end = next_start = pauses[-1]
+        spans.append((start, end, max(previous_end - start, 0.0)))
+        if end >= duration:
+            break
+        previous_end = end
+        start = max(next_start, start + 1)
+    return spans
+
+
+def cut_chunk(audio_path: str, start: float, end: float, output_path: str):
+    subprocess.run(
+        [_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+         "-i", audio_path, "-vn", output_path],
+        check=True,
+    )
+
+
+def _words(text: str) -> list[str]:
+    return [word.lower() for word in _WORD_RE.findall(text)]
+
+
+def stitch_transcripts(texts: list[str], overlaps: list[float] | None = None,
+                       max_overlap_words: int = MAX_OVERLAP_WORDS, min_overlap_words: int = MIN_OVERLAP_WORDS) -> str:
+    """Join chunk transcripts in order. Where a chunk's audio overlaps the
+    previous one (overlaps[i] > 0; all of them when overlaps is None), the
+    words at its start that repeat the end of the previous transcript are
+    dropped, if at least min_overlap_words of them match. Chunks cut at a
+    pause are joined as they are, so a speaker repeating themselves across
+    the cut is kept."""
+    stitched = []
+    tail = []
+    for index, text in enumerate(texts):
+        text = text.strip()
+        if not text:
+            continue
+        words = _words(text)
+        repeated = 0
+        if overlaps is None or overlaps[index] > 0:
+            for size in range(min(max_overlap_words, len(tail), len(words)), min_overlap_words - 1, -1):
+                if tail[-size:] == words[:size]:
+                    repeated = size
+                    break
+        if repeated:
+            # skip the raw tokens that make up the repeated words, keeping punctuation after them
+            matches = list(_WORD_RE.finditer(text))
+            text = text[matches[repeated - 1].end():].lstrip(" ,.;:!?")
+        if text:
+            stitched.append(text)
+        tail = (tail + words[repeated:])[-max_overlap_words:]
+    return " ".join(stitched)
+
+
+class FishAudioSpeechToText:
+    """Transcribe chunks with camel's FishAudioModel"""
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, chunk: AudioChunk) -> str:
+        metrics.count("model_input_bytes", os.path.getsize(chunk.path), model="audio_model")
+        with metrics.model_call("audio_model", "speech_to_text"):
+            return self.model.speech_to_text(chunk.path)
+
+
+class StubSpeechToText:
+    """Offline backend: returns the words of a known transcript that fall in
+    the chunk's time span, as if spoken at an even pace over `duration`.
+    fail_attempts maps a chunk index to how many calls for it should raise."""
+    def __init__(self, transcript: str, duration: float, fail_attempts: dict[int, int] | None = None):
+        self.words = transcript.split()
+        self.duration = duration
+        self.fail_attempts = dict(fail_attempts or {})
+        self.calls = []
+
+    def transcribe(self, chunk: AudioChunk) -> str:
+        self.calls.append(chunk.index)
+        if self.fail_attempts.get(chunk.index, 0) > 0:
+            self.fail_attempts[chunk.index] -= 1
+            raise TranscriptionError(f"stub failure for chunk {chunk.index}")
+        pace = len(self.words) / self.duration if self.duration else 0
+        return " ".join(self.words[int(chunk.start * pace):int(round(chunk.end * pace))])
+
+
+class ChunkedTranscriber:
+    """Transcribe long audio as concurrent chunks.
+
+    The audio is split at pauses or at fixed windows with overlap, chunks are
+    sent to the backend with at most `max_concurrency` in flight, only the
+    chunks that failed are retried, and the texts are stitched back in order."""
+
+    def __init__(self, backend, window: float = CHUNK_SECONDS, overlap: float = OVERLAP_SECONDS,
+                 max_concurrency: int = MAX_CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 split_on_silence: bool = True, progress: Callable[[int, int], None] | None = None):
+        self.backend = backend
+        self.window = window
+        self.overlap = overlap
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.split_on_silence = split_on_silence
+        self.progress = progress
+
+    def split(self, audio_path: str, chunk_dir: str) -> list[AudioChunk]:
+        duration = probe_duration(audio_path)
+        if duration <= self.window:
+            return [AudioChunk(0, 0.0, duration, audio_path)]
+
+        silences = detect_silences(audio_path) if self.split_on_silence else None
+        ext = os.path.splitext(audio_path)[1] or ".mp3"
+        chunks = []
+        for index, (start, end, overlap) in enumerate(plan_chunks(duration, self.window, self.overlap, silences)):
+            path = os.path.join(chunk_dir, f"chunk_{index:04}{ext}")
+            cut_chunk(audio_path, start, end, path)
+            chunks.append(AudioChunk(index, start, end, path, overlap))
+        logger.info(f"Split {audio_path} ({duration:.0f}s) into {len(chunks)} chunks")
+        return chunks
+
+    def transcribe_chunks(self, chunks: list[AudioChunk], progress: Callable[[int, int], None] | None = None) -> list[str]:
+        progress = progress if progress is not None else self.progress
+        texts = [None] * len(chunks)
+        remaining = list(chunks)
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                    logger.warning(f"Retrying {len(remaining)} failed chunks in {delay}s")
+                    time.sleep(delay)
+                futures = [(chunk, pool.submit(self.backend.transcribe, chunk)) for chunk in remaining]
+                remaining = []
+                for chunk, future in futures:
+                    try:
+                        texts[chunk.index] = future.result()
+                        errors.pop(chunk.index, None)
+                        if progress is not None:
+                            progress(sum(text is not None for text in texts), len(chunks))
+                    except Exception as e:
+                        logger.warning(f"Chunk {chunk.index} ({chunk.start:.0f}-{chunk.end:.0f}s) failed: {e}")
+                        errors[chunk.index] = e
+                        remaining.append(chunk)
+                if not remaining:
+                    break
+        if remaining:
+            raise TranscriptionError(f"Chunks {[chunk.index for chunk in remaining]} failed after {self.max_retries} retries: {errors[remaining[0].index]}")
+        return texts
+
+    def transcribe(self, audio_path: str, progress: Callable[[int, int], None] | None = None) -> str:
+        """Transcript of audio_path; progress(chunks done, chunk count), when
+        given, replaces the transcriber's own callback for this call"""
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            chunks = self.split(audio_path, chunk_dir)
+            texts = self.transcribe_chunks(chunks, progress)
+        return stitch_transcripts(texts, [chunk.overlap for chunk in chunks])
@@ -1,11 +1,17 @@
 import os
 import time
+import queue
+import threading
 import cv2
 import imutils
 import shutil
 import img2pdf
 import glob
-from skimage.metrics import structural_similarity
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+from pdf_writer import StreamingPdfWriter
+from slide_similarity import make_similarity_backend
 
 OUTPUT_SLIDES_DIR = f"./output"
 
@@ -17,8 +23,18 @@ DETECT_SHADOWS = False            # If true, the algorithm will detect shadows a
 MIN_PERCENT = 0.1                # min % of diff between foreground and background to detect if motion has stopped
 MAX_PERCENT = 3                  # max % of diff between foreground and background to detect if frame is still in motion
 SSIM_THRESHOLD = 0.9             # SSIM threshold of two consecutive frame
+SIMILARITY_BACKEND = "ssim-downscaled"  # slide dedup: "ssim" (full resolution, last slide only), "ssim-downscaled", "dhash" or "phash" (checked against every captured slide)
+FRAME_SAMPLER = "sequential"     # "seek" re-seeks per sample, "sequential" decodes once in order, "keyframe" keeps only key frames
+PIPELINED = True                 # decode, mask and compare/encode in separate stages instead of one loop
+PIPELINE_QUEUE_SIZE = 32         # decoded frames buffered between the decoder thread and the mask stage
+PIPELINE_WORKERS = os.cpu_count() or 1  # threads used for similarity comparisons and slide encodes
+SLIDE_JPEG_QUALITY = 90          # JPEG quality of slides streamed straight into a PDF
+KEYFRAME_MAX_GAP = 10            # in keyframe mode, seconds after a key frame before the FRAME_RATE stride fills in
 
 
+class NoSlidesError(Exception):
+    '''Raised when a video holds no still frame worth keeping as a slide'''
+
 
 def get_frames(video_path):
     '''A fucntion to return the frames from a video located at video_path
@@ -49,15 +65,155 @@ def get_frames(video_path):
         yield frame_count, frame_time, frame
 
     vs.release()
- 
 
 
-def detect_unique_screenshots(video_path, output_folder_screenshot_path):
-    '''Extract unique screenshots from video'''
+def keyframe_indices(video_path):
+    '''Indices of the video's key frames, from the packet flags of a
+    demux-only pass, or None when the backend cannot report them. The key
+    frame flag is only set on raw packets (CAP_PROP_FORMAT=-1), so nothing
+    is decoded here; packets come in decode order, so each key frame's
+    index is taken from its timestamp.'''
+    keyframe_prop = getattr(cv2, 'CAP_PROP_LRF_HAS_KEY_FRAME', None)
+    if keyframe_prop is None:
+        return None
+    vs = cv2.VideoCapture(video_path)
+    try:
+        if not vs.isOpened() or not vs.set(cv2.CAP_PROP_FORMAT, -1):
+            return None
+        fps = vs.get(cv2.CAP_PROP_FPS)
+        indices = set()
+        packet_index = -1
+        while vs.grab():
+            packet_index += 1
+            if vs.get(keyframe_prop) > 0:
+                indices.add(round(vs.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000) if fps > 0 else packet_index)
+        return indices or None
+    finally:
+        vs.release()
+
+
+def get_frames_sequential(video_path, keyframes_only=False):
+    '''Same output as get_frames but decodes the video once, front to back.
+    Every frame is grab()bed but only the sampled ones are retrieve()d, so
+    skipped frames are never converted. With keyframes_only only key frames
+    (see keyframe_indices) are kept; where key frames are more than
+    KEYFRAME_MAX_GAP seconds apart the FRAME_RATE stride fills the gap, and
+    it is used throughout when the backend cannot report key frames.'''
+
+    keyframes = keyframe_indices(video_path) if keyframes_only else None
+    vs = cv2.VideoCapture(video_path)
+    if not vs.isOpened():
+        raise Exception(f'unable to open file {video_path}')
+
+    fps = vs.get(cv2.CAP_PROP_FPS)
+    interval = 1/FRAME_RATE
+    next_sample_time = 0
+    last_keyframe_time = None
+    frame_index = -1
+    frame_count = 0
+
+    while vs.grab():
+        frame_index += 1
+        if fps > 0:
+            position = frame_index / fps
+        else:
+            position = vs.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+        if keyframes is not None:
+            is_keyframe = frame_index in keyframes
+            if is_keyframe:
+                last_keyframe_time = position
+            in_gap = last_keyframe_time is None or position - last_keyframe_time >= KEYFRAME_MAX_GAP
+            due = is_keyframe or (in_gap and position >= next_sample_time)
+        else:
+            due = position >= next_sample_time
+        if not due:
+            continue
+
+        (ok, frame) = vs.retrieve()
+        if not ok or frame is None:
+            break
+
+        # keep the stride aligned to the seek path even if a sample landed late
+        while next_sample_time <= position:
+            next_sample_time += interval
+
+        frame_count += 1
+        # frame_time mirrors get_frames, which reports the sample time plus one interval
+        yield frame_count, position + interval, frame
+
+    vs.release()
+
+
+def sample_frames(video_path, sampler=FRAME_SAMPLER):
+    '''Dispatch to the frame sampler selected by name'''
+    if sampler == "seek":
+        return get_frames(video_path)
+    if sampler == "sequential":
+        return get_frames_sequential(video_path)
+    if sampler == "keyframe":
+        return get_frames_sequential(video_path, keyframes_only=True)
+    raise ValueError(f"unknown frame sampler {sampler}")
+
+
+
+class PngSlideSink:
+    '''Save each slide as a PNG in a folder; write() returns the file path'''
+    def __init__(self, output_folder_screenshot_path):
+        self.output_folder_screenshot_path = output_folder_screenshot_path
+
+    def encode(self, frame):
+        (ok, png) = cv2.imencode(".png", frame)
+        if not ok:
+            raise Exception("unable to encode slide as PNG")
+        return png
+
+    def write(self, name, png):
+        path = os.path.join(self.output_folder_screenshot_path, f"{name}.png")
+        print("saving {}".format(path))
+        with open(path, "wb") as f:
+            f.write(png)
+        return path
+
+
+class PdfSlideSink:
+    '''Stream each slide as a JPEG page into a PDF; write() returns the page number.
+    on_page(page_number, jpeg) is called as soon as a page is written.'''
+    def __init__(self, output_pdf_path, on_page=None, quality=SLIDE_JPEG_QUALITY):
+        self.pdf = StreamingPdfWriter(output_pdf_path)
+        self.on_page = on_page
+        self.quality = quality
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pdf.close()
+
+    def encode(self, frame):
+        (ok, jpeg) = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise Exception("unable to encode slide as JPEG")
+        (height, width) = frame.shape[:2]
+        return jpeg.tobytes(), width, height, frame.ndim == 2
+
+    def write(self, name, encoded):
+        (jpeg, width, height, grayscale) = encoded
+        page_number = self.pdf.add_jpeg(jpeg, width, height, grayscale)
+        if self.on_page is not None:
+            self.on_page(page_number, jpeg)
+        return page_number
+
+
+def detect_unique_screenshots(video_path, output_folder_screenshot_path, sampler=FRAME_SAMPLER, similarity=SIMILARITY_BACKEND, sink=None):
+    '''Extract unique screenshots from video.
+    Slides go to sink, by default PNG files in output_folder_screenshot_path.'''
+    backend = make_similarity_backend(similarity, SSIM_THRESHOLD)
+    if sink is None:
+        sink = PngSlideSink(output_folder_screenshot_path)
     fgbg = cv2.createBackgroundSubtractorMOG2(history=FGBG_HISTORY, varThreshold=VAR_THRESHOLD,detectShadows=DETECT_SHADOWS)
 
     captured = False
-    start_time = time.time()
     (W, H) = (None, None)
 
     # Get total frames for progress calculation
@@ -65,11 +221,10 @@ def detect_unique_screenshots(video_path, output_folder_screenshot_path):
     cap.release()
 
     screenshoots_count = 0
-    last_screenshot = None
     saved_files = []
     
     
-    for frame_count, frame_time, frame in get_frames(video_path):
+    for frame_count, frame_time, frame in metrics.timed_iter("slides.decode", sample_frames(video_path, sampler)):
         
         orig = frame.copy()
         frame = imutils.resize(frame, width=600)
@@ -82,19 +237,17 @@ def detect_unique_screenshots(video_path, output_folder_screenshot_path):
 
         if p_diff < MIN_PERCENT and not captured and frame_count > WARMUP:
             captured = True
-            filename = f"{screenshoots_count:03}_{round(frame_time/60, 2)}.png"
-            path = os.path.join(output_folder_screenshot_path, filename)
-
-            image_ssim = 0.0
-            if last_screenshot is not None:
-                image_ssim = structural_similarity(last_screenshot, orig, channel_axis=2, data_range=255)
+            name = f"{screenshoots_count:03}_{round(frame_time/60, 2)}"
 
-            if image_ssim < SSIM_THRESHOLD:
+            with metrics.span("slides.fingerprint"):
+                fingerprint = backend.fingerprint(orig)
+            with metrics.span("slides.compare"):
+                duplicate = backend.is_duplicate(fingerprint)
+            if not duplicate:
                 try:
-                    print("saving {}".format(path))
-                    cv2.imwrite(str(path), orig)
-                    last_screenshot = orig
-                    saved_files.append(path)
+                    with metrics.span("slides.write"):
+                        saved_files.append(sink.write(name, sink.encode(orig)))
+                    backend.add(fingerprint)
                     screenshoots_count += 1
                 except Exception as e:
                     print(f"Error saving image: {str(e)}")
@@ -104,7 +257,167 @@ def detect_unique_screenshots(video_path, output_folder_screenshot_path):
             captured = False
 
     print(f'{screenshoots_count} screenshots Captured!')
-    print(f'Time taken {time.time()-start_time}s')
+    metrics.count("slides_captured", screenshoots_count)
+    return saved_files
+
+
+def _decode_frames(video_path, sampler, frames, stop):
+    '''Decoder stage: push sampled frames into the bounded queue, then None'''
+    try:
+        for item in metrics.timed_iter("slides.decode", sample_frames(video_path, sampler)):
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+    except Exception as e:
+        frames.put(e)
+    frames.put(None)
+
+
+class _Candidate:
+    '''A still frame waiting for its dedup decision'''
+    def __init__(self, frame_count, frame_time, frame, fingerprint):
+        self.frame_count = frame_count
+        self.frame_time = frame_time
+        self.frame = frame
+        self.fingerprint = fingerprint
+        self.comparison = None  # (frame_count of the screenshot compared against, similarity future)
+
+
+def detect_unique_screenshots_pipelined(video_path, output_folder_screenshot_path, sampler=FRAME_SAMPLER, similarity=SIMILARITY_BACKEND, sink=None, workers=PIPELINE_WORKERS):
+    '''Extract unique screenshots from video, overlapping decoding, masking,
+    comparisons and encodes.
+
+    A decoder thread fills a bounded queue, the MOG2 mask stage runs in frame
+    order on the calling thread, and SSIM comparisons and slide encodes run
+    on a thread pool in this process (OpenCV and NumPy release the GIL, and
+    fingerprints are never pickled). Each candidate has one comparison in
+    flight, against the current last screenshot; when an earlier candidate
+    becomes the last screenshot instead, the candidates behind it are
+    compared against that one. A slide only joins the similarity index once
+    the sink has written it, and the next decision waits for that, so
+    decisions are taken strictly in capture order and the saved files are
+    the same as with detect_unique_screenshots. Backends that check the whole
+    index are decided in order without speculation.'''
+    backend = make_similarity_backend(similarity, SSIM_THRESHOLD)
+    if sink is None:
+        sink = PngSlideSink(output_folder_screenshot_path)
+    fgbg = cv2.createBackgroundSubtractorMOG2(history=FGBG_HISTORY, varThreshold=VAR_THRESHOLD,detectShadows=DETECT_SHADOWS)
+
+    captured = False
+    (W, H) = (None, None)
+
+    screenshoots_count = 0
+    last_screenshot = None
+    saved_files = []
+    pending = deque()
+    writes = deque()
+
+    frames = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    decoder = threading.Thread(target=_decode_frames, args=(video_path, sampler, frames, stop), daemon=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def speculate(candidate):
+            if candidate.comparison is not None:
+                candidate.comparison[1].cancel()
+            candidate.comparison = None
+            if last_screenshot is not None:
+                candidate.comparison = (last_screenshot.frame_count,
+                                        pool.submit(backend.similarity, last_screenshot.fingerprint, candidate.fingerprint))
+
+        def flush_writes(wait=False):
+            nonlocal last_screenshot, screenshoots_count
+            while writes and (wait or writes[0][2].done()):
+                (name, candidate, future) = writes.popleft()
+                try:
+                    with metrics.span("slides.write"):
+                        saved_files.append(sink.write(name, future.result()))
+                except Exception as e:
+                    print(f"Error saving image: {str(e)}")
+                    continue
+                backend.add(candidate.fingerprint)
+                last_screenshot = candidate
+                screenshoots_count += 1
+                if not backend.compare_all:
+                    for other in pending:
+                        speculate(other)
+
+        def resolve_oldest():
+            # the slide decided before this one must be in the index, or have failed to save
+            flush_writes(wait=True)
+            candidate = pending.popleft()
+
+            with metrics.span("slides.compare"):
+                if backend.compare_all or last_screenshot is None:
+                    duplicate = backend.is_duplicate(candidate.fingerprint)
+                else:
+                    (against, future) = candidate.comparison or (None, None)
+                    if against == last_screenshot.frame_count:
+                        score = future.result()
+                    else:
+                        if future is not None:
+                            future.cancel()
+                        score = backend.similarity(last_screenshot.fingerprint, candidate.fingerprint)
+                    duplicate = score >= backend.threshold
+            candidate.comparison = None
+
+            if not duplicate:
+                name = f"{screenshoots_count:03}_{round(candidate.frame_time/60, 2)}"
+                writes.append((name, candidate, pool.submit(sink.encode, candidate.frame)))
+
+        decoder.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                frame_count, frame_time, frame = item
+
+                orig = frame
+                frame = imutils.resize(frame, width=600)
+                mask = fgbg.apply(frame)
+
+                if W is None or H is None:
+                    (H, W) = mask.shape[:2]
+
+                p_diff = (cv2.countNonZero(mask) / float(W * H)) * 100
+
+                if p_diff < MIN_PERCENT and not captured and frame_count > WARMUP:
+                    captured = True
+                    with metrics.span("slides.fingerprint"):
+                        candidate = _Candidate(frame_count, frame_time, orig, backend.fingerprint(orig))
+                    if not backend.compare_all:
+                        speculate(candidate)
+                    pending.append(candidate)
+
+                    if len(pending) > workers:
+                        resolve_oldest()
+                    flush_writes()
+
+                elif captured and p_diff >= MAX_PERCENT:
+                    captured = False
+
+            while pending:
+                resolve_oldest()
+            flush_writes(wait=True)
+        finally:
+            stop.set()
+            while decoder.is_alive():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    print(f'{len(saved_files)} screenshots Captured!')
+    metrics.count("slides_captured", len(saved_files))
     return saved_files
 
 
@@ -151,12 +464,35 @@ def convert_screenshots_to_pdf(video_path, output_folder_screenshot_path):
         raise
 
 
-def video_to_slides(video_path):
+def video_to_slides(video_path, pipelined=PIPELINED):
     output_folder_screenshot_path = initialize_output_folder(video_path)
-    saved_files = detect_unique_screenshots(video_path, output_folder_screenshot_path)
+    with metrics.span("slides.detect", video=os.path.basename(video_path)):
+        if pipelined:
+            saved_files = detect_unique_screenshots_pipelined(video_path, output_folder_screenshot_path)
+        else:
+            saved_files = detect_unique_screenshots(video_path, output_folder_screenshot_path)
     return output_folder_screenshot_path, saved_files
 
 
+def video_to_pdf_stream(video_path, output_pdf_path, on_page=None, pipelined=PIPELINED):
+    '''Detect slides and stream them as JPEG pages straight into a PDF,
+    without the PNG folder. Returns the PDF path and the number of pages.'''
+    detect = detect_unique_screenshots_pipelined if pipelined else detect_unique_screenshots
+    try:
+        with PdfSlideSink(output_pdf_path, on_page) as sink, metrics.span("slides.detect", video=os.path.basename(video_path)):
+            pages = detect(video_path, None, sink=sink)
+    except BaseException:
+        # a truncated PDF next to the video would pass for this video's slides
+        if os.path.exists(output_pdf_path):
+            os.remove(output_pdf_path)
+        raise
+    if not pages:
+        os.remove(output_pdf_path)
+        raise NoSlidesError(f"no slides captured from {video_path}")
+    print('pdf saved at', output_pdf_path)
+    return output_pdf_path, len(pages)
+
+
 def slides_to_pdf(video_path, output_folder_screenshot_path, saved_files):
     video_filename = os.path.splitext(os.path.basename(video_path))[0]
     safe_filename = "".join(x for x in video_filename if x.isalnum() or x in (' ', '-', '_'))